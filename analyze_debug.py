@@ -1,128 +1,551 @@
 #!/usr/bin/env python3
 """
-Script para analizar y mostrar la información de debug de la API de OKX
+Analizador de las capturas de debug de la API de OKX
+Mantiene un índice SQLite (símbolo, hora, tamaño y posición de cada registro) sobre los
+segmentos `debug_captures/*.jsonl.gz` de debug_capture.py y los `debug_api_*.json` antiguos,
+así que las consultas sobre semanas de capturas solo leen los registros que necesitan. Los
+agregados (distribución de velas recibidas, rangos de precio por hora, anomalías) se calculan
+con numpy en varios procesos, uno por archivo.
+
+Ejemplos:
+    python analyze_debug.py                                # índice + resumen de todo
+    python analyze_debug.py --symbol BTC-USDT --since 7d
+    python analyze_debug.py --since 2025-07-27 --until 2025-07-28 --json
+    python analyze_debug.py --show latest                  # detalle de una captura
 """
 
+import argparse
 import json
 import os
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+
+import numpy as np
 import pandas as pd
 
-def analyze_debug_file(filename):
-    """Analiza un archivo de debug y muestra información resumida"""
-    
-    if not os.path.exists(filename):
-        print(f"Error: El archivo {filename} no existe")
-        return
-    
-    print(f"=== ANÁLISIS DEL ARCHIVO DE DEBUG: {filename} ===\n")
-    
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Información básica
-    print(f"📅 Timestamp de ejecución: {data['timestamp']}")
-    print(f"💰 Símbolo: {data['symbol']}")
+from debug_capture import SEGMENT_SUFFIX
+
+LEGACY_PREFIX = 'debug_api_'
+INDEX_FILENAME = 'debug_index.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexed_bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captures (
+    source TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    capture_id TEXT,
+    symbol TEXT,
+    captured_at REAL,
+    candles_received INTEGER,
+    candles_used INTEGER,
+    first_candle INTEGER,
+    last_candle INTEGER,
+    PRIMARY KEY (source, offset)
+);
+CREATE INDEX IF NOT EXISTS captures_symbol_time ON captures (symbol, captured_at);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (captured_at);
+"""
+
+
+# --- Lectura de archivos --------------------------------------------------------------
+
+def read_segment(path):
+    """Contenido descomprimido de un segmento gzip
+    Tolera segmentos todavía abiertos (sin trailer gzip): devuelve lo que se puede leer."""
+    with open(path, 'rb') as f:
+        compressed = f.read()
+    chunks = []
+    while compressed:
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            chunks.append(decompressor.decompress(compressed))
+        except zlib.error:
+            break
+        # Varios miembros gzip concatenados: se sigue con el siguiente
+        compressed = decompressor.unused_data if decompressor.eof else b''
+    return b''.join(chunks)
+
+
+def read_source(path, kind):
+    if kind == 'segment':
+        return read_segment(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def candle_array(candles):
+    """Filas de vela de OKX -> matriz float (ts, open, high, low, close, volume)
+    Los valores no numéricos quedan como NaN."""
+    if not candles:
+        return np.empty((0, 6))
+    rows = [row[:6] for row in candles if isinstance(row, (list, tuple)) and len(row) >= 6]
+    if not rows:
+        return np.empty((0, 6))
+    try:
+        return np.asarray(rows, dtype=float)
+    except (TypeError, ValueError):
+        return pd.DataFrame(rows).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+
+def record_candles(record):
+    """Velas tal como llegaron de OKX (o las procesadas si el registro no las tiene)"""
+    raw = (record.get('api_response') or {}).get('raw_data')
+    if raw:
+        return raw
+    return (record.get('processed_data') or {}).get('data') or []
+
+
+def record_time(record, fallback=None):
+    if record.get('captured_at') is not None:
+        return float(record['captured_at'])
+    try:
+        return datetime.fromisoformat(record['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return fallback
+
+
+def index_row(record, offset, length, fallback_time=None):
+    candles = candle_array(record_candles(record))
+    timestamps = candles[:, 0][~np.isnan(candles[:, 0])]
+    return (
+        offset,
+        length,
+        record.get('capture_id'),
+        record.get('symbol'),
+        record_time(record, fallback_time),
+        (record.get('api_response') or {}).get('total_candles_received', len(candles)),
+        (record.get('processed_data') or {}).get('candles_used_for_chart'),
+        int(timestamps.min()) if len(timestamps) else None,
+        int(timestamps.max()) if len(timestamps) else None,
+    )
+
+
+# --- Índice ---------------------------------------------------------------------------
+
+def index_source(path, kind, start_offset=0):
+    """Filas de índice de los registros de `path` a partir de `start_offset`
+    Se ejecuta en un proceso aparte. Devuelve (filas, bytes indexados); en un segmento
+    abierto la última línea puede estar incompleta y se deja para la próxima vez."""
+    content = read_source(path, kind)
+    if kind == 'legacy':
+        try:
+            record = json.loads(content)
+        except ValueError:
+            return [], len(content)
+        return [index_row(record, 0, len(content), os.path.getmtime(path))], len(content)
+
+    rows = []
+    position = start_offset
+    while True:
+        end = content.find(b'\n', position)
+        if end < 0:
+            break
+        try:
+            rows.append(index_row(json.loads(content[position:end]), position, end - position))
+        except ValueError:
+            pass
+        position = end + 1
+    return rows, position
+
+
+def discover_sources(directories):
+    """(ruta, tipo) de todos los segmentos y archivos antiguos de los directorios"""
+    sources = []
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(SEGMENT_SUFFIX):
+                sources.append((os.path.abspath(entry.path), 'segment'))
+            elif entry.name.startswith(LEGACY_PREFIX) and entry.name.endswith('.json'):
+                sources.append((os.path.abspath(entry.path), 'legacy'))
+    return sources
+
+
+def open_index(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def update_index(conn, directories, workers=None):
+    """Indexa los archivos nuevos o que han crecido y olvida los que ya no existen
+    Devuelve cuántos archivos se (re)indexaron."""
+    known = {path: (size, mtime, indexed) for path, size, mtime, indexed in
+             conn.execute('SELECT path, size, mtime, indexed_bytes FROM sources')}
+    found = discover_sources(directories)
+    found_paths = {path for path, _ in found}
+
+    # Segmentos borrados por la rotación
+    for path in set(known) - found_paths:
+        conn.execute('DELETE FROM captures WHERE source = ?', (path,))
+        conn.execute('DELETE FROM sources WHERE path = ?', (path,))
+
+    tasks = []
+    for path, kind in found:
+        stat = os.stat(path)
+        previous = known.get(path)
+        if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime:
+            continue
+        # Un segmento que crece se sigue desde donde se quedó; si encoge es otro archivo
+        start = previous[2] if previous and kind == 'segment' and stat.st_size >= previous[0] else 0
+        if start == 0:
+            conn.execute('DELETE FROM captures WHERE source = ?', (path,))
+        tasks.append((path, kind, start, stat.st_size, stat.st_mtime))
+
+    results = run_parallel(index_source, [(path, kind, start) for path, kind, start, _, _ in tasks], workers)
+    for (path, kind, _, size, mtime), (rows, indexed) in zip(tasks, results):
+        conn.executemany(
+            'INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(path, *row) for row in rows]
+        )
+        conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)', (path, kind, size, mtime, indexed))
+    conn.commit()
+    return len(tasks)
+
+
+def run_parallel(function, argument_list, workers=None):
+    if not argument_list:
+        return []
+    if workers == 1 or len(argument_list) == 1:
+        return [function(*arguments) for arguments in argument_list]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, *zip(*argument_list)))
+
+
+def parse_time(value):
+    """'7d', '12h', '30m' (hace N días/horas/minutos) o fecha ISO -> epoch"""
+    if value is None:
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([dhm])', value.strip())
+    if match:
+        seconds = {'d': 86400, 'h': 3600, 'm': 60}[match.group(2)]
+        return time.time() - float(match.group(1)) * seconds
+    return datetime.fromisoformat(value).timestamp()
+
+
+def query_index(conn, symbol=None, since=None, until=None):
+    """DataFrame con las filas del índice que cumplen los filtros"""
+    conditions, parameters = [], []
+    if symbol:
+        conditions.append('symbol = ?')
+        parameters.append(symbol)
+    if since is not None:
+        conditions.append('captured_at >= ?')
+        parameters.append(since)
+    if until is not None:
+        conditions.append('captured_at < ?')
+        parameters.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return pd.read_sql_query(
+        f'SELECT c.*, s.kind FROM captures c JOIN sources s ON s.path = c.source {where} '
+        'ORDER BY captured_at', conn, params=parameters
+    )
+
+
+# --- Agregados ------------------------------------------------------------------------
+
+def detect_anomalies(candles, captured_at, jump_sigma):
+    """Anomalías de una ventana de velas (matriz de candle_array)"""
+    anomalies = []
+    if not len(candles):
+        return anomalies
+    ts, opens, highs, lows, closes = (candles[:, i] for i in range(5))
+    prices = candles[:, 1:5]
+
+    invalid = (np.isnan(prices).any(axis=1) | (prices <= 0).any(axis=1)
+               | (highs < np.maximum(opens, closes)) | (lows > np.minimum(opens, closes)))
+    if invalid.any():
+        anomalies.append({'kind': 'invalid_ohlc', 'count': int(invalid.sum())})
+
+    order = np.sort(ts[~np.isnan(ts)])
+    duplicates = int(np.count_nonzero(np.diff(order) == 0))
+    if duplicates:
+        anomalies.append({'kind': 'duplicate_candles', 'count': duplicates})
+
+    diffs = np.diff(np.unique(order))
+    if len(diffs):
+        # El intervalo es la separación más frecuente entre velas
+        values, counts = np.unique(diffs, return_counts=True)
+        bar_ms = values[np.argmax(counts)]
+        missing = int(np.sum(diffs[diffs > bar_ms] // bar_ms - 1))
+        if missing:
+            anomalies.append({'kind': 'gap', 'missing_candles': missing})
+        if captured_at is not None and captured_at * 1000 > order[-1] + 2 * bar_ms:
+            anomalies.append({'kind': 'stale', 'seconds_behind': round(float(captured_at - (order[-1] + bar_ms) / 1000), 1)})
+
+    valid_closes = closes[~invalid]
+    if len(valid_closes) > 3:
+        # Saltos de precio: z robusto (mediana / MAD) sobre los retornos logarítmicos
+        returns = np.diff(np.log(valid_closes[np.argsort(ts[~invalid])]))
+        mad = np.median(np.abs(returns - np.median(returns)))
+        if mad > 0:
+            z = np.abs(returns - np.median(returns)) / (1.4826 * mad)
+            jumps = int(np.count_nonzero(z > jump_sigma))
+            if jumps:
+                anomalies.append({'kind': 'price_jump', 'count': jumps, 'max_z': round(float(z.max()), 1)})
+    return anomalies
+
+
+def analyze_source(path, kind, offsets, jump_sigma):
+    """Agregados parciales de los registros de un archivo (se ejecuta en un proceso aparte)
+    Devuelve los máximos/mínimos por (símbolo, hora) y las anomalías de cada captura."""
+    content = read_source(path, kind)
+    symbols, hours, highs, lows = [], [], [], []
+    anomalies = []
+    for offset, length in offsets:
+        try:
+            record = json.loads(content[offset:offset + length])
+        except ValueError:
+            anomalies.append({'source': path, 'offset': offset, 'kind': 'unreadable'})
+            continue
+        candles = candle_array(record_candles(record))
+        captured_at = record_time(record)
+        for anomaly in detect_anomalies(candles, captured_at, jump_sigma):
+            anomalies.append({'capture_id': record.get('capture_id'), 'symbol': record.get('symbol'),
+                              'captured_at': captured_at, 'source': path, 'offset': offset, **anomaly})
+        valid = ~np.isnan(candles[:, [0, 2, 3]]).any(axis=1)
+        if not valid.any():
+            continue
+        candles = candles[valid]
+        hour = (candles[:, 0] // 3_600_000).astype(np.int64)
+        # Máximo y mínimo por hora dentro de la captura (las ventanas se solapan entre
+        # capturas; max/min son idempotentes, así que se combinan sin deduplicar)
+        order = np.argsort(hour, kind='stable')
+        hour, candles = hour[order], candles[order]
+        starts = np.flatnonzero(np.r_[True, hour[1:] != hour[:-1]])
+        hours.append(hour[starts])
+        highs.append(np.maximum.reduceat(candles[:, 2], starts))
+        lows.append(np.minimum.reduceat(candles[:, 3], starts))
+        symbols.extend([record.get('symbol')] * len(starts))
+    if hours:
+        hours, highs, lows = np.concatenate(hours), np.concatenate(highs), np.concatenate(lows)
+    return {'symbols': symbols, 'hours': hours, 'highs': highs, 'lows': lows, 'anomalies': anomalies}
+
+
+def candle_count_distribution(rows):
+    """Distribución de velas recibidas por símbolo (solo usa el índice)"""
+    distribution = {}
+    for symbol, group in rows.groupby(rows['symbol'].fillna('?')):
+        counts = group['candles_received'].dropna().to_numpy(dtype=float)
+        if not len(counts):
+            continue
+        values, frequency = np.unique(counts.astype(int), return_counts=True)
+        distribution[symbol] = {
+            'captures': int(len(counts)),
+            'min': int(counts.min()),
+            'p50': float(np.percentile(counts, 50)),
+            'p95': float(np.percentile(counts, 95)),
+            'max': int(counts.max()),
+            'mode': int(values[np.argmax(frequency)]),
+            'histogram': {str(v): int(f) for v, f in zip(values, frequency)},
+        }
+    return distribution
+
+
+def short_responses(rows, distribution):
+    """Capturas con menos velas de las habituales para su símbolo"""
+    anomalies = []
+    for row in rows.itertuples():
+        expected = distribution.get(row.symbol or '?', {}).get('mode')
+        if expected and pd.notna(row.candles_received) and row.candles_received < expected:
+            anomalies.append({'capture_id': row.capture_id, 'symbol': row.symbol, 'captured_at': row.captured_at,
+                              'source': row.source, 'offset': row.offset, 'kind': 'short_response',
+                              'received': int(row.candles_received), 'expected': expected})
+    return anomalies
+
+
+def analyze(rows, workers=None, jump_sigma=6.0):
+    """Resumen de las capturas seleccionadas en `rows` (resultado de query_index)"""
+    distribution = candle_count_distribution(rows)
+    tasks = [
+        (source, group['kind'].iloc[0], list(zip(group['offset'], group['length'])), jump_sigma)
+        for source, group in rows.groupby('source')
+    ]
+    partials = run_parallel(analyze_source, tasks, workers)
+
+    frames = [pd.DataFrame({'symbol': p['symbols'], 'hour': p['hours'], 'high': p['highs'], 'low': p['lows']})
+              for p in partials if len(p['symbols'])]
+    hourly = pd.DataFrame(columns=['symbol', 'hour', 'high', 'low', 'range', 'range_pct'])
+    if frames:
+        hourly = (pd.concat(frames, ignore_index=True)
+                  .groupby(['symbol', 'hour'], as_index=False).agg(high=('high', 'max'), low=('low', 'min')))
+        hourly['range'] = hourly['high'] - hourly['low']
+        hourly['range_pct'] = hourly['range'] / hourly['low'] * 100
+        hourly['hour'] = pd.to_datetime(hourly['hour'] * 3600, unit='s', utc=True)
+
+    anomalies = short_responses(rows, distribution)
+    for partial in partials:
+        anomalies.extend(partial['anomalies'])
+    anomalies.sort(key=lambda a: a.get('captured_at') or 0)
+    return {
+        'captures': int(len(rows)),
+        'symbols': sorted(rows['symbol'].dropna().unique().tolist()),
+        'first_capture': rows['captured_at'].min() if len(rows) else None,
+        'last_capture': rows['captured_at'].max() if len(rows) else None,
+        'bytes': int(rows['length'].sum()) if len(rows) else 0,
+        'candle_count_distribution': distribution,
+        'hourly_ranges': hourly,
+        'anomalies': anomalies,
+    }
+
+
+# --- Salida ---------------------------------------------------------------------------
+
+def format_time(epoch):
+    return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S') if epoch else '-'
+
+
+def print_summary(summary, hours_limit, anomalies_limit):
+    print("🔍 ANALIZADOR DE CAPTURAS DE DEBUG - API OKX\n")
+    print(f"📁 Capturas: {summary['captures']:,} ({summary['bytes']:,} bytes)")
+    print(f"📅 Desde {format_time(summary['first_capture'])} hasta {format_time(summary['last_capture'])}")
+    print(f"💰 Símbolos: {', '.join(summary['symbols']) or '-'}")
     print()
-    
-    # Información de la API
-    print("🌐 INFORMACIÓN DE LA API:")
-    print(f"   URL: {data['api_request']['url']}")
-    print(f"   Parámetros: {data['api_request']['parameters']}")
-    print(f"   Status Code: {data['api_response']['status_code']}")
-    print(f"   Total de velas recibidas: {data['api_response']['total_candles_received']}")
+
+    print("🕯️  VELAS RECIBIDAS POR CAPTURA:")
+    for symbol, stats in summary['candle_count_distribution'].items():
+        print(f"   {symbol}: {stats['captures']} capturas, min {stats['min']}, p50 {stats['p50']:.0f}, "
+              f"p95 {stats['p95']:.0f}, max {stats['max']} (habitual: {stats['mode']})")
+    print()
+
+    hourly = summary['hourly_ranges']
+    print(f"📈 RANGO DE PRECIOS POR HORA (últimas {hours_limit} por símbolo, UTC):")
+    for symbol, group in hourly.groupby('symbol'):
+        print(f"   {symbol}:")
+        for row in group.tail(hours_limit).itertuples():
+            print(f"      {row.hour:%Y-%m-%d %H:00}  alto ${row.high:,.2f}  bajo ${row.low:,.2f}  "
+                  f"rango ${row.range:,.2f} ({row.range_pct:.2f}%)")
+    print()
+
+    anomalies = summary['anomalies']
+    print(f"⚠️  ANOMALÍAS: {len(anomalies)}")
+    kinds = pd.Series([a['kind'] for a in anomalies], dtype=object).value_counts()
+    for kind, count in kinds.items():
+        print(f"   {kind}: {count}")
+    for anomaly in anomalies[-anomalies_limit:]:
+        detail = {k: v for k, v in anomaly.items() if k not in ('kind', 'symbol', 'captured_at', 'source', 'offset')}
+        print(f"   {format_time(anomaly.get('captured_at'))} {anomaly.get('symbol') or '-'} {anomaly['kind']} {detail}")
     print()
-    
-    # Información de datos procesados
+    print("=" * 60)
+
+
+def summary_to_json(summary):
+    hourly = summary['hourly_ranges'].copy()
+    hourly['hour'] = hourly['hour'].astype(str)
+    return {**summary, 'hourly_ranges': hourly.to_dict(orient='records')}
+
+
+def load_record(row):
+    content = read_source(row['source'], row['kind'])
+    return json.loads(content[row['offset']:row['offset'] + row['length']])
+
+
+def show_capture(record):
+    """Detalle de una captura (lo que mostraba antes el analizador para un archivo)"""
+    print(f"📅 Timestamp de ejecución: {record.get('timestamp')}")
+    print(f"💰 Símbolo: {record.get('symbol')}")
+    print(f"🆔 Captura: {record.get('capture_id', '-')}")
+    print()
+    if record.get('api_request'):
+        print("🌐 INFORMACIÓN DE LA API:")
+        print(f"   URL: {record['api_request']['url']}")
+        print(f"   Parámetros: {record['api_request']['parameters']}")
+    api_response = record.get('api_response') or {}
+    if api_response.get('status_code'):
+        print(f"   Status Code: {api_response['status_code']}")
+    print(f"   Total de velas recibidas: {api_response.get('total_candles_received')}")
+    print()
+
+    processed_data = (record.get('processed_data') or {}).get('data') or []
     print("📊 DATOS PROCESADOS:")
-    print(f"   Velas utilizadas para el gráfico: {data['processed_data']['candles_used_for_chart']}")
+    print(f"   Velas utilizadas para el gráfico: {len(processed_data)}")
     print()
-    
-    # Mostrar las primeras y últimas velas
-    raw_data = data['api_response']['raw_data']
-    processed_data = data['processed_data']['data']
-    
+
+    candles = candle_array(processed_data)
     print("🕯️  PRIMERAS 5 VELAS (más recientes):")
-    for i, candle in enumerate(processed_data[:5]):
-        timestamp = datetime.fromtimestamp(int(candle[0]) / 1000)
-        print(f"   {i+1}. {timestamp.strftime('%Y-%m-%d %H:%M:%S')} - Open: {candle[1]}, High: {candle[2]}, Low: {candle[3]}, Close: {candle[4]}")
-    
+    for i, candle in enumerate(candles[:5]):
+        timestamp = datetime.fromtimestamp(candle[0] / 1000)
+        print(f"   {i+1}. {timestamp:%Y-%m-%d %H:%M:%S} - Open: {candle[1]}, High: {candle[2]}, Low: {candle[3]}, Close: {candle[4]}")
     print()
-    print("🕯️  ÚLTIMAS 5 VELAS (más antiguas):")
-    for i, candle in enumerate(processed_data[-5:]):
-        timestamp = datetime.fromtimestamp(int(candle[0]) / 1000)
-        print(f"   {len(processed_data)-4+i}. {timestamp.strftime('%Y-%m-%d %H:%M:%S')} - Open: {candle[1]}, High: {candle[2]}, Low: {candle[3]}, Close: {candle[4]}")
-    
-    print()
-    
-    # Estadísticas básicas
-    print("📈 ESTADÍSTICAS BÁSICAS:")
-    if processed_data:
-        prices = [float(candle[4]) for candle in processed_data]  # Precios de cierre
-        volumes = [float(candle[5]) for candle in processed_data]  # Volúmenes
-        
-        print(f"   Precio más alto: ${max(prices):,.2f}")
-        print(f"   Precio más bajo: ${min(prices):,.2f}")
-        print(f"   Rango de precios: ${max(prices) - min(prices):,.2f}")
-        print(f"   Volumen total: {sum(volumes):,.2f} BTC")
-        print(f"   Volumen promedio por vela: {sum(volumes)/len(volumes):,.2f} BTC")
-    
+
+    if len(candles):
+        closes, volumes = candles[:, 4], candles[:, 5]
+        print("📈 ESTADÍSTICAS BÁSICAS:")
+        print(f"   Precio más alto: ${np.nanmax(closes):,.2f}")
+        print(f"   Precio más bajo: ${np.nanmin(closes):,.2f}")
+        print(f"   Rango de precios: ${np.nanmax(closes) - np.nanmin(closes):,.2f}")
+        print(f"   Volumen total: {np.nansum(volumes):,.2f}")
+        print(f"   Volumen promedio por vela: {np.nanmean(volumes):,.2f}")
     print()
     print("=" * 60)
 
-def list_debug_files():
-    """Lista todos los archivos de debug disponibles"""
-    debug_files = [f for f in os.listdir('.') if f.startswith('debug_api_') and f.endswith('.json')]
-    
-    if not debug_files:
-        print("No se encontraron archivos de debug.")
-        return []
-    
-    print("📁 ARCHIVOS DE DEBUG DISPONIBLES:")
-    for i, filename in enumerate(sorted(debug_files, reverse=True)):
-        file_size = os.path.getsize(filename)
-        print(f"   {i+1}. {filename} ({file_size:,} bytes)")
-    
-    return debug_files
 
 def main():
     """Función principal"""
-    print("🔍 ANALIZADOR DE ARCHIVOS DE DEBUG - API OKX\n")
-    
-    # Listar archivos disponibles
-    debug_files = list_debug_files()
-    
-    if not debug_files:
+    default_dir = os.environ.get('DEBUG_CAPTURE_DIR', 'debug_captures')
+    parser = argparse.ArgumentParser(description='Analizador de capturas de debug de la API de OKX')
+    parser.add_argument('--dir', action='append', dest='directories',
+                        help=f'Directorio con capturas (repetible; por defecto {default_dir} y .)')
+    parser.add_argument('--index', help=f'Archivo del índice (por defecto {default_dir}/{INDEX_FILENAME})')
+    parser.add_argument('--symbol', help='Solo este símbolo')
+    parser.add_argument('--since', help="Desde (fecha ISO o relativo: '7d', '12h', '30m')")
+    parser.add_argument('--until', help='Hasta (fecha ISO o relativo)')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos para indexar y agregar')
+    parser.add_argument('--jump-sigma', type=float, default=6.0,
+                        help='Umbral (z robusto) para marcar un salto de precio')
+    parser.add_argument('--hours', type=int, default=24, help='Horas a mostrar por símbolo')
+    parser.add_argument('--max-anomalies', type=int, default=20, help='Anomalías a listar')
+    parser.add_argument('--show', metavar='CAPTURE_ID',
+                        help="Muestra el detalle de una captura ('latest' para la más reciente)")
+    parser.add_argument('--json', action='store_true', help='Salida en JSON')
+    args = parser.parse_args()
+
+    directories = args.directories or [default_dir, '.']
+    conn = open_index(args.index or os.path.join(directories[0], INDEX_FILENAME))
+    started = time.perf_counter()
+    updated = update_index(conn, directories, args.workers)
+    print(f"Índice actualizado: {updated} archivos en {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    rows = query_index(conn, args.symbol, parse_time(args.since), parse_time(args.until))
+    if args.show:
+        selected = rows if args.show == 'latest' else rows[rows['capture_id'] == args.show]
+        if selected.empty:
+            print(f"Error: no se encontró la captura {args.show}")
+            sys.exit(1)
+        record = load_record(selected.iloc[-1])
+        if args.json:
+            print(json.dumps(record, indent=2, ensure_ascii=False, default=str))
+        else:
+            show_capture(record)
         return
-    
-    print()
-    
-    # Analizar el archivo más reciente por defecto
-    latest_file = debug_files[0]
-    print(f"Analizando el archivo más reciente: {latest_file}")
-    print()
-    
-    analyze_debug_file(latest_file)
-    
-    # Preguntar si quiere analizar otro archivo
-    if len(debug_files) > 1:
-        print("\n¿Deseas analizar otro archivo? (s/n): ", end="")
-        response = input().lower().strip()
-        
-        if response in ['s', 'si', 'sí', 'y', 'yes']:
-            print("\nArchivos disponibles:")
-            for i, filename in enumerate(debug_files):
-                print(f"   {i+1}. {filename}")
-            
-            try:
-                choice = int(input("\nSelecciona el número del archivo: ")) - 1
-                if 0 <= choice < len(debug_files):
-                    print()
-                    analyze_debug_file(debug_files[choice])
-                else:
-                    print("Selección inválida.")
-            except ValueError:
-                print("Entrada inválida.")
+
+    if rows.empty:
+        print("No se encontraron capturas de debug.")
+        return
+    summary = analyze(rows, args.workers, args.jump_sigma)
+    if args.json:
+        print(json.dumps(summary_to_json(summary), indent=2, ensure_ascii=False, default=str))
+    else:
+        print_summary(summary, args.hours, args.max_anomalies)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,47 +1,85 @@
-from flask import Flask, render_template_string, jsonify, request, send_file
+from flask import Flask, render_template_string, jsonify, request, send_file, Response, g
 import os
 from datetime import datetime
 import json
 import io
 import base64
+import time
+import hmac
+import hashlib
+import random
+import atexit
+import functools
+from urllib.parse import parse_qsl
+import secrets
+import base64 as base64_lib
 
-# Importar dependencias de manera segura
-try:
-    import requests
-    import pandas as pd
-    import plotly.graph_objects as go
-    import plotly.io as pio
-    import time
-    import hmac
-    import base64 as base64_lib
-    import hashlib
-    
-    # Importar matplotlib para generación de imágenes alternativa
-    try:
-        import matplotlib.pyplot as plt
-        import matplotlib.dates as mdates
-        from matplotlib.figure import Figure
-        from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-        import io
-        MATPLOTLIB_AVAILABLE = True
-    except ImportError:
-        MATPLOTLIB_AVAILABLE = False
-        print("Warning: Matplotlib not available - alternative image generation will be limited")
-    
-    # Intentar importar Kaleido (opcional)
-    try:
-        import kaleido
-        KALEIDO_AVAILABLE = True
-    except ImportError:
-        KALEIDO_AVAILABLE = False
-        print("Warning: Kaleido not available - PNG generation will be limited")
-    
-    DEPENDENCIES_LOADED = True
-except ImportError as e:
-    print(f"Warning: Some dependencies failed to load: {e}")
-    DEPENDENCIES_LOADED = False
-    KALEIDO_AVAILABLE = False
-    MATPLOTLIB_AVAILABLE = False
+from metrics import (
+    stage, timed_stage, render_prometheus, REQUEST_SECONDS, UPSTREAM_ERRORS,
+    RENDER_FALLBACKS, IN_FLIGHT, CANDLE_REJECTS
+)
+from tracing import begin_trace, end_trace, SamplingProfiler, ProfileStore
+from lazy_imports import lazy_import, is_available, warm_imports, import_timings_ms
+from candle_cache import CandleCache, CircuitBreaker, UpstreamError, window_fingerprint, next_bar_close, BAR_SECONDS
+from candle_store import CandleStore, aggregate, select_fields, parse_time_ms, parse_fields, is_closed
+from candle_gaps import GapRepairer, completeness_report
+from streaming import parse_stream_mode, stream_rows
+from render_cache import RenderCache, ImageLinks
+from cache_snapshot import load_snapshot, SnapshotWriter
+from image_options import (
+    parse_image_options, default_image_options, mimetype_for, cache_params, etag_suffix
+)
+from prerender import Prerenderer, parse_watchlist
+from compression import CompressionCache, negotiate, is_compressible, compress as compress_body
+
+# Dependencias pesadas: se importan de forma diferida (ver lazy_imports.py) para que
+# /ping y /health respondan sin esperar a pandas, plotly y matplotlib.
+# STARTUP_IMPORTS controla cuándo se cargan:
+#   background (por defecto): en un hilo en segundo plano al importar la app (ya en el worker)
+#   eager: durante la importación (útil con gunicorn --preload para compartirlas entre workers)
+#   lazy: solo en el primer uso
+STARTUP_IMPORTS = os.environ.get('STARTUP_IMPORTS', 'background')
+HEAVY_MODULES = ['requests', 'pandas', 'plotly.graph_objects', 'plotly.io', 'plotly.subplots',
+                 'lod', 'indicators', 'mpl_candles']
+
+requests = lazy_import('requests')
+pd = lazy_import('pandas')
+go = lazy_import('plotly.graph_objects')
+pio = lazy_import('plotly.io')
+plotly_subplots = lazy_import('plotly.subplots')
+mpl_candles = lazy_import('mpl_candles')
+lod = lazy_import('lod')
+indicators = lazy_import('indicators')
+candle_cleaning = lazy_import('candle_cleaning')
+correlation = lazy_import('correlation')
+
+DEPENDENCIES_LOADED = all(is_available(name) for name in ('requests', 'pandas', 'plotly'))
+if not DEPENDENCIES_LOADED:
+    print("Warning: Some dependencies are not installed (requests, pandas, plotly)")
+
+# Matplotlib para generación de imágenes alternativa
+MATPLOTLIB_AVAILABLE = DEPENDENCIES_LOADED and is_available('matplotlib')
+if not MATPLOTLIB_AVAILABLE:
+    print("Warning: Matplotlib not available - alternative image generation will be limited")
+
+# Kaleido (opcional)
+KALEIDO_AVAILABLE = DEPENDENCIES_LOADED and is_available('kaleido')
+if not KALEIDO_AVAILABLE:
+    print("Warning: Kaleido not available - PNG generation will be limited")
+
+STARTUP_STATE = {'mode': STARTUP_IMPORTS, 'warm': False, 'warm_seconds': None}
+
+def _imports_warmed(seconds):
+    STARTUP_STATE['warm'] = True
+    STARTUP_STATE['warm_seconds'] = round(seconds, 3)
+    print(f"Dependencias precargadas en {seconds:.2f}s")
+
+if DEPENDENCIES_LOADED and STARTUP_IMPORTS in ('background', 'eager'):
+    warm_imports(
+        [name for name in HEAVY_MODULES if MATPLOTLIB_AVAILABLE or not name.startswith(('matplotlib', 'mpl_'))],
+        background=STARTUP_IMPORTS == 'background',
+        on_done=_imports_warmed
+    )
 
 app = Flask(__name__)
 
@@ -50,6 +88,16 @@ OKX_API_KEY = os.environ.get('OKX_API_KEY')
 OKX_API_SECRET = os.environ.get('OKX_API_SECRET')
 OKX_PASSPHRASE = os.environ.get('OKX_PASSPHRASE')
 
+# Profiling por muestreo: ?profile=1 con la clave de administración, o 1 de cada N peticiones
+PROFILE_ADMIN_KEY = os.environ.get('PROFILE_ADMIN_KEY')
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_STORE = ProfileStore(os.environ.get('PROFILE_DIR', 'profiles'),
+                             keep=int(os.environ.get('PROFILE_KEEP', '20')))
+
+# URL base de la API de OKX (se puede apuntar a okx_mock_server.py para pruebas de carga)
+OKX_BASE_URL = os.environ.get('OKX_BASE_URL', 'https://www.okx.com').rstrip('/')
+OKX_TIMEOUT = float(os.environ.get('OKX_TIMEOUT', '10'))
+
 def get_timestamp():
     """Genera timestamp en formato ISO8601 UTC"""
     if not DEPENDENCIES_LOADED:
@@ -78,8 +126,78 @@ def get_headers(method, request_path, body=''):
         'Content-Type': 'application/json'
     }
 
+def parse_okx_json(response):
+    """Cuerpo JSON de una respuesta 200 de OKX; lanza UpstreamError('bad_json') si no lo es"""
+    try:
+        return response.json()
+    except ValueError as e:
+        UPSTREAM_ERRORS.inc(reason='bad_json')
+        raise UpstreamError('bad_json', str(e))
+
+@timed_stage('upstream')
+def fetch_candlestick_data(symbol='BTC-USDT', bar='5m'):
+    """Consulta la API de OKX - últimas 81 velas
+    
+    Lanza UpstreamError si OKX no responde o responde con error de servidor / límite de
+    peticiones; devuelve [] si la respuesta es válida pero no trae velas.
+    """
+    # Obtener las últimas 81 velas (necesitamos más para asegurar que tenemos suficientes)
+    url_path = f'/api/v5/market/candles?instId={symbol}&bar={bar}&limit=100'
+    url = OKX_BASE_URL + url_path
+    
+    headers = get_headers('GET', url_path)
+    try:
+        response = requests.get(url, headers=headers, timeout=OKX_TIMEOUT)
+    except requests.Timeout as e:
+        UPSTREAM_ERRORS.inc(reason='timeout')
+        raise UpstreamError('timeout', str(e))
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(reason='exception')
+        raise UpstreamError('exception', str(e))
+    
+    if response.status_code == 200:
+        data = parse_okx_json(response)
+        if 'data' in data and data['data']:
+            # Tomar solo las últimas 81 velas
+            candles_to_show = 81
+            if len(data['data']) >= candles_to_show:
+                filtered_data = data['data'][:candles_to_show]  # Las últimas 81 velas
+            else:
+                filtered_data = data['data']  # Si hay menos de 81, tomar todas
+            return filtered_data
+        UPSTREAM_ERRORS.inc(reason='empty')
+        return []
+    
+    UPSTREAM_ERRORS.inc(reason=f'http_{response.status_code}')
+    if response.status_code == 429 or response.status_code >= 500:
+        raise UpstreamError(f'http_{response.status_code}', response.text[:200])
+    return []
+
+def fetch_history_candles(symbol, bar, after, before):
+    """Velas de OKX con before < timestamp < after (/history-candles, como mucho 100)
+    
+    Lo usa la reparación de huecos; mismos errores que fetch_candlestick_data.
+    """
+    url_path = f'/api/v5/market/history-candles?instId={symbol}&bar={bar}&after={after}&before={before}&limit=100'
+    try:
+        response = requests.get(OKX_BASE_URL + url_path, headers=get_headers('GET', url_path), timeout=OKX_TIMEOUT)
+    except requests.Timeout as e:
+        UPSTREAM_ERRORS.inc(reason='timeout')
+        raise UpstreamError('timeout', str(e))
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(reason='exception')
+        raise UpstreamError('exception', str(e))
+    
+    if response.status_code == 200:
+        return parse_okx_json(response).get('data') or []
+    UPSTREAM_ERRORS.inc(reason=f'http_{response.status_code}')
+    if response.status_code == 429 or response.status_code >= 500:
+        raise UpstreamError(f'http_{response.status_code}', response.text[:200])
+    return []
+
+@timed_stage('fetch')
 def get_candlestick_data(symbol='BTC-USDT', bar='5m'):
-    """Obtiene datos de velas desde la API de OKX - últimas 81 velas"""
+    """Obtiene datos de velas desde la API de OKX - últimas 81 velas ([] si falla)"""
     if not DEPENDENCIES_LOADED:
         return []
     
@@ -87,29 +205,95 @@ def get_candlestick_data(symbol='BTC-USDT', bar='5m'):
         # Verificar que las credenciales estén configuradas
         if not all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE]):
             return []
-        
-        # Obtener las últimas 81 velas (necesitamos más para asegurar que tenemos suficientes)
-        url_path = f'/api/v5/market/candles?instId={symbol}&bar={bar}&limit=100'
-        url = 'https://www.okx.com' + url_path
-        
-        headers = get_headers('GET', url_path)
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'data' in data and data['data']:
-                # Tomar solo las últimas 81 velas
-                candles_to_show = 81
-                if len(data['data']) >= candles_to_show:
-                    filtered_data = data['data'][:candles_to_show]  # Las últimas 81 velas
-                else:
-                    filtered_data = data['data']  # Si hay menos de 81, tomar todas
-                return filtered_data
-        return []
+        return fetch_candlestick_data(symbol, bar)
     except Exception as e:
         print(f"Error getting candlestick data: {e}")
         return []
 
+# Almacén local de velas cerradas para /api/history (CANDLE_STORE_DIR vacío lo desactiva);
+# cada respuesta buena de OKX se guarda al pasar por la caché
+CANDLE_STORE_DIR = os.environ.get('CANDLE_STORE_DIR', 'candle_store')
+CANDLE_STORE = CandleStore(CANDLE_STORE_DIR) if CANDLE_STORE_DIR else None
+
+# Filas por fragmento de las respuestas en streaming (/api/history, ?stream= en /api/candles)
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', '500'))
+
+CANDLE_CACHE = CandleCache(
+    fetch_candlestick_data,
+    on_fetch=CANDLE_STORE.write if CANDLE_STORE is not None else None,
+    fresh_ttl=float(os.environ.get('CANDLE_CACHE_TTL', '10')),
+    max_stale=float(os.environ.get('CANDLE_CACHE_MAX_STALE', '3600')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get('OKX_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.environ.get('OKX_BREAKER_RESET', '30'))
+    )
+)
+
+# Reparación de huecos del almacén: las peticiones van a /history-candles solo por los rangos
+# que faltan, con GAP_REQUEST_INTERVAL segundos entre peticiones. Cada GAP_SCAN_INTERVAL
+# segundos (0 desactiva la búsqueda periódica) se revisan los últimos GAP_SCAN_DAYS días.
+GAP_REPAIRER = None
+if CANDLE_STORE is not None:
+    GAP_REPAIRER = GapRepairer(
+        CANDLE_STORE, fetch_history_candles,
+        request_interval=float(os.environ.get('GAP_REQUEST_INTERVAL', '0.2')),
+        max_attempts=int(os.environ.get('GAP_MAX_ATTEMPTS', '3')),
+        breaker=CANDLE_CACHE.breaker,
+        scan_interval=float(os.environ.get('GAP_SCAN_INTERVAL', '900')),
+        scan_days=int(os.environ.get('GAP_SCAN_DAYS', '2')),
+        # Con varios workers solo el que tiene este lock hace la búsqueda periódica
+        lock_path=os.path.join(CANDLE_STORE_DIR, '.gap_scan.lock')
+    )
+
+# Imágenes renderizadas por ventana de velas
+RENDER_CACHE = RenderCache(max_bytes=int(os.environ.get('RENDER_CACHE_MAX_BYTES', str(64 * 1024 * 1024))))
+
+# Informes de /api/correlation (JSON) por combinación de ventanas cerradas: cambian al cierre de vela
+CORRELATION_CACHE = RenderCache(
+    max_bytes=int(os.environ.get('CORRELATION_CACHE_MAX_BYTES', str(4 * 1024 * 1024))), name='correlation'
+)
+
+# Nivel de detalle: píxeles mínimos por vela antes de agrupar velas (lod.py)
+LOD_MIN_PX_PER_CANDLE = int(os.environ.get('LOD_MIN_PX_PER_CANDLE', '4'))
+
+# Enlaces de corta duración a imágenes de la caché (mode=url en los endpoints base64)
+IMAGE_LINKS = ImageLinks(ttl=float(os.environ.get('IMAGE_LINK_TTL', '300')))
+
+# Compresión de respuestas: tamaño mínimo y caché de variantes comprimidas
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+COMPRESSION_CACHE = CompressionCache(
+    max_bytes=int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+)
+
+# Instantánea en disco de ambas cachés para arrancar en caliente tras un reinicio
+# (CACHE_SNAPSHOT_PATH vacío la desactiva)
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', 'cache_snapshot.bin')
+SNAPSHOT_WRITER = None
+if CACHE_SNAPSHOT_PATH:
+    try:
+        restored = load_snapshot(CACHE_SNAPSHOT_PATH, CANDLE_CACHE, RENDER_CACHE, max_age=CANDLE_CACHE.max_stale)
+        print(f"Instantánea de caché restaurada: {restored[0]} ventanas, {restored[1]} imágenes")
+    except Exception as e:
+        print(f"Error restaurando instantánea de caché: {e}")
+    SNAPSHOT_WRITER = SnapshotWriter(
+        CACHE_SNAPSHOT_PATH, CANDLE_CACHE, RENDER_CACHE,
+        interval=float(os.environ.get('CACHE_SNAPSHOT_INTERVAL', '60'))
+    )
+
+@timed_stage('fetch')
+def get_cached_candles(symbol='BTC-USDT', bar='5m'):
+    """Velas desde la caché stale-while-revalidate; devuelve (data, meta)
+    
+    `meta` incluye `as_of` (cuándo se obtuvieron de OKX) y `stale`. Se guarda en `g`
+    para que las respuestas binarias lleven la misma información en cabeceras.
+    """
+    if not DEPENDENCIES_LOADED or not all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE]):
+        return [], {'as_of': None, 'stale': False, 'source': 'none'}
+    data, meta = CANDLE_CACHE.get(symbol, bar)
+    g.candles_meta = meta
+    return data, meta
+
+@timed_stage('parse')
 def create_dataframe(data):
     """Convierte los datos de la API a DataFrame"""
     if not DEPENDENCIES_LOADED or not data:
@@ -121,12 +305,13 @@ def create_dataframe(data):
             'volume', 'volume_currency', 'volume_currency_2', 'trades'
         ])
         
-        # Limpiar y validar datos antes de convertir
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Eliminar filas con valores NaN
-        df = df.dropna(subset=['open', 'high', 'low', 'close'])
+        # Limpiar y validar datos antes de convertir (conversión vectorizada + invariantes OHLC)
+        df, rejects = candle_cleaning.clean_candles(df)
+        if not rejects.empty:
+            summary = candle_cleaning.reject_summary(rejects)
+            print(f"Velas descartadas: {len(rejects)} {summary}")
+            for reason, count in summary.items():
+                CANDLE_REJECTS.inc(count, reason=reason)
         
         # Convertir timestamp
         df['timestamp'] = pd.to_datetime(df['timestamp'].astype(int), unit='ms')
@@ -139,107 +324,298 @@ def create_dataframe(data):
         print(f"Error creating dataframe: {e}")
         return pd.DataFrame() if DEPENDENCIES_LOADED else None
 
-def create_candlestick_chart(df, symbol):
-    """Crea gráfico de velas con Plotly"""
+@timed_stage('stats')
+def calculate_stats(df):
+    """Calcula las estadísticas resumidas (máximo, mínimo, cambio %, volumen) de las velas"""
+    prices = df['close'].values
+    volumes = df['volume'].values
+    
+    return {
+        'high': float(prices.max()),
+        'low': float(prices.min()),
+        'change': round(((prices[-1] - prices[0]) / prices[0]) * 100, 2),
+        'volume': float(volumes.sum())
+    }
+
+@functools.lru_cache(maxsize=None)
+def plotly_base_layout():
+    """Layout común de los gráficos de Plotly, construido una sola vez (go.Figure lo copia)"""
+    return go.Layout(
+        xaxis_title="Hora",
+        yaxis_title="Precio (USDT)",
+        xaxis_rangeslider_visible=False,
+        height=600
+    )
+
+def downsample_for_width(df, width):
+    """Agrupa las velas para que no haya más de las que caben en `width` píxeles (ver lod.py)"""
+    with stage('lod'):
+        return lod.downsample_frame(df, width, LOD_MIN_PX_PER_CANDLE)
+
+def panel_series(df, plot_df, panels, width, x=None):
+    """Series de los paneles inferiores a partir de la misma ventana en memoria
+    - volumes: alineado con las velas que se dibujan (ya agrupadas por LOD si hacía falta)
+    - rsi: (x, valores) calculado a resolución completa y reducido con LTTB al ancho; `x` son
+      las posiciones de cada vela original (por defecto, en unidades de vela agrupada)"""
+    series = {}
+    if 'volume' in panels:
+        series['volumes'] = plot_df['volume'].values
+    lines = indicators.compute_indicators(df, panels)
+    if 'rsi' in lines:
+        if x is None:
+            x = lod.line_positions(len(df), plot_df.attrs.get('lod_bucket_size', 1))
+        series['rsi'] = lod.downsample_line(x, lines['rsi'], width)
+    return series
+
+def create_multipanel_chart(df, plot_df, symbol, panels, width):
+    """Figura de Plotly con el precio y los paneles pedidos compartiendo el eje X"""
+    series = panel_series(df, plot_df, panels, width, x=df['timestamp'].values)
+    fig = plotly_subplots.make_subplots(
+        rows=1 + len(panels), cols=1, shared_xaxes=True, vertical_spacing=0.03,
+        row_heights=[3] + [1] * len(panels)
+    )
+    fig.add_trace(go.Candlestick(
+        x=plot_df['timestamp'].values,
+        open=plot_df['open'].values,
+        high=plot_df['high'].values,
+        low=plot_df['low'].values,
+        close=plot_df['close'].values,
+        name=symbol
+    ), row=1, col=1)
+    for row, panel in enumerate(panels, start=2):
+        if panel == 'volume':
+            up = plot_df['close'].values >= plot_df['open'].values
+            fig.add_trace(go.Bar(
+                x=plot_df['timestamp'].values, y=series['volumes'], name='Volumen',
+                marker_color=['#26a69a' if is_up else '#ef5350' for is_up in up]
+            ), row=row, col=1)
+        elif panel == 'rsi':
+            rsi_x, rsi_y = series['rsi']
+            fig.add_trace(go.Scatter(x=rsi_x, y=rsi_y, mode='lines', name='RSI'), row=row, col=1)
+            for level in indicators.RSI_LEVELS:
+                fig.add_hline(y=level, line_dash='dash', line_width=1, row=row, col=1)
+            fig.update_yaxes(range=[0, 100], row=row, col=1)
+    fig.update_layout(
+        title=f"Candlestick 5m - {symbol} - Últimas 81 velas",
+        yaxis_title="Precio (USDT)",
+        xaxis_rangeslider_visible=False,
+        showlegend=False,
+        height=600
+    )
+    return fig
+
+@timed_stage('chart')
+def create_candlestick_chart(df, symbol, width=None, panels=()):
+    """Crea gráfico de velas con Plotly
+    `width` es el ancho de destino en píxeles; con más velas de las que caben se agrupan.
+    `panels` añade paneles de volumen y/o RSI bajo el precio."""
     if not DEPENDENCIES_LOADED or df is None or df.empty:
         return None
     
     try:
+        width = width or default_image_options().width
+        plot_df = downsample_for_width(df, width)
+        if panels:
+            return create_multipanel_chart(df, plot_df, symbol, panels, width)
+        df = plot_df
+        # Arrays de numpy y layout base ya validado: Plotly no vuelve a validar cada propiedad
         fig = go.Figure(data=[go.Candlestick(
-            x=df['timestamp'],
-            open=df['open'],
-            high=df['high'],
-            low=df['low'],
-            close=df['close']
-        )])
-        
-        fig.update_layout(
-            title=f"Candlestick 5m - {symbol} - Últimas 81 velas",
-            xaxis_title="Hora",
-            yaxis_title="Precio (USDT)",
-            xaxis_rangeslider_visible=False,
-            height=600
-        )
+            x=df['timestamp'].values,
+            open=df['open'].values,
+            high=df['high'].values,
+            low=df['low'].values,
+            close=df['close'].values
+        )], layout=plotly_base_layout())
+        fig.layout.title.text = f"Candlestick 5m - {symbol} - Últimas 81 velas"
         
         return fig
     except Exception as e:
         print(f"Error creating chart: {e}")
         return None
 
-def create_matplotlib_chart(df, symbol):
-    """Crea un gráfico de velas usando matplotlib (alternativa a Plotly)"""
+@timed_stage('chart')
+def create_matplotlib_chart(df, symbol, options=None):
+    """Crea un gráfico de velas usando matplotlib (alternativa a Plotly)
+    `options` (image_options.ImageOptions) fija formato, tamaño en píxeles, dpi y calidad.
+    Usa una figura preconfigurada del pool de mpl_candles y solo cambia los datos."""
     if not MATPLOTLIB_AVAILABLE or df is None or df.empty:
         return None
+    options = options or default_image_options()
     
     try:
-        # Crear figura
-        fig = Figure(figsize=(12, 8), facecolor='black')
-        canvas = FigureCanvas(fig)
-        ax = fig.add_subplot(111, facecolor='black')
-        
-        # Configurar colores
-        up_color = '#00ff88'
-        down_color = '#ff4444'
-        
-        # Preparar datos
-        dates = df['timestamp'].values
-        opens = df['open'].values
-        highs = df['high'].values
-        lows = df['low'].values
-        closes = df['close'].values
-        
-        # Crear velas
-        for i in range(len(dates)):
-            color = up_color if closes[i] >= opens[i] else down_color
-            
-            # Línea vertical (mecha)
-            ax.plot([i, i], [lows[i], highs[i]], color=color, linewidth=1)
-            
-            # Cuerpo de la vela
-            body_height = abs(closes[i] - opens[i])
-            body_bottom = min(opens[i], closes[i])
-            
-            if body_height > 0:
-                ax.bar(i, body_height, bottom=body_bottom, color=color, 
-                      width=0.8, alpha=0.8)
-            else:
-                # Línea horizontal para velas sin cuerpo
-                ax.plot([i-0.4, i+0.4], [opens[i], opens[i]], color=color, linewidth=2)
-        
-        # Configurar gráfico
-        ax.set_title(f'{symbol} Candlestick Chart', color='white', fontsize=16, pad=20)
-        ax.set_xlabel('Time', color='white', fontsize=12)
-        ax.set_ylabel('Price (USDT)', color='white', fontsize=12)
-        
-        # Configurar ejes
-        ax.tick_params(colors='white')
-        ax.grid(True, alpha=0.3, color='gray')
-        
-        # Configurar etiquetas del eje X
-        if len(dates) > 10:
-            step = len(dates) // 10
-            ax.set_xticks(range(0, len(dates), step))
-            ax.set_xticklabels([pd.Timestamp(dates[i]).strftime('%H:%M') for i in range(0, len(dates), step)], 
-                              rotation=45, color='white')
-        else:
-            ax.set_xticks(range(len(dates)))
-            ax.set_xticklabels([pd.Timestamp(d).strftime('%H:%M') for d in dates], rotation=45, color='white')
-        
-        # Ajustar layout
-        fig.tight_layout()
-        
-        # Convertir a bytes
-        img_buffer = io.BytesIO()
-        fig.savefig(img_buffer, format='png', facecolor='black', edgecolor='none', 
-                   bbox_inches='tight', dpi=100)
-        img_buffer.seek(0)
-        
-        return img_buffer.getvalue()
+        plot_df = downsample_for_width(df, options.width)
+        return mpl_candles.render_candles(
+            symbol,
+            plot_df['timestamp'].values,
+            plot_df['open'].values,
+            plot_df['high'].values,
+            plot_df['low'].values,
+            plot_df['close'].values,
+            width=options.width,
+            height=options.height,
+            dpi=options.dpi,
+            image_format=options.format,
+            quality=options.quality if options.format in ('jpeg', 'webp') else None,
+            thumbnail=options.thumbnail,
+            panels=options.panels,
+            **panel_series(df, plot_df, options.panels, options.width)
+        )
         
     except Exception as e:
         print(f"Error creating matplotlib chart: {e}")
         return None
 
+def make_render_key(renderer, symbol, interval, data, *params):
+    """Clave de la caché de imágenes: (renderer, symbol, interval, huella de la ventana, parámetros...)"""
+    return (renderer, symbol, interval, window_fingerprint(data)) + tuple(params)
+
+def render_matplotlib_image(df, symbol, interval, data, options, render_key=None):
+    """Imagen de matplotlib para la ventana, reutilizando la de la caché si la ventana no cambió"""
+    render_key = render_key or make_render_key('matplotlib', symbol, interval, data, *cache_params(options))
+    img_bytes = RENDER_CACHE.get(render_key)
+    if img_bytes is None:
+        img_bytes = create_matplotlib_chart(df, symbol, options)
+        RENDER_CACHE.put(render_key, img_bytes)
+    return img_bytes
+
+def export_plotly_image(fig, options):
+    """Exporta la figura de Plotly con Kaleido en el formato y tamaño pedidos
+    Como en matplotlib, la imagen mide width x height píxeles y dpi solo cambia el tamaño relativo
+    del texto: el layout mide width * 100 / dpi y se exporta con escala dpi / 100.
+    (Kaleido no tiene parámetro de calidad)"""
+    if options.thumbnail:
+        fig.update_layout(title=None, xaxis_title=None, yaxis_title=None,
+                          margin=dict(l=40, r=10, t=10, b=30), font=dict(size=9))
+    layout_width = max(1, round(options.width * 100 / options.dpi))
+    scale = options.width / layout_width
+    with stage('export'):
+        return pio.to_image(fig, format=options.format, width=layout_width,
+                            height=max(1, round(options.height / scale)), scale=scale)
+
+def candle_etag(kind, data, *params):
+    """ETag fuerte de una representación derivada de la ventana de velas"""
+    return '-'.join([kind, *params, window_fingerprint(data)])
+
+def add_cache_headers(response, etag, interval, meta):
+    """ETag y Cache-Control hasta el próximo cierre de vela (revalidar siempre si los datos están vencidos)"""
+    response.set_etag(etag)
+    if meta.get('stale'):
+        response.headers['Cache-Control'] = 'no-cache'
+    else:
+        max_age = max(1, int(next_bar_close(interval) - time.time()))
+        response.headers['Cache-Control'] = f'max-age={max_age}'
+    return response
+
+def not_modified_response(etag, interval, meta):
+    """Respuesta 304 si el cliente ya tiene esta versión (If-None-Match), o None
+    Comparación débil: las respuestas comprimidas llevan el mismo ETag marcado como W/"""
+    if request.if_none_match.contains_weak(etag):
+        return add_cache_headers(Response(status=304), etag, interval, meta)
+    return None
+
+def image_response(img_bytes, mimetype='image/png'):
+    """Respuesta con los bytes de la imagen tal cual
+    A diferencia de send_file(io.BytesIO(...)) no se copian ni se trocean: el servidor WSGI
+    recibe el mismo objeto bytes guardado en la caché, con su Content-Length."""
+    response = Response([img_bytes], mimetype=mimetype, direct_passthrough=True)
+    response.content_length = len(img_bytes)
+    return response
+
+def multipart_response(metadata, img_bytes, mimetype='image/png'):
+    """multipart/mixed con una parte JSON (metadatos) y otra con la imagen en binario"""
+    boundary = secrets.token_hex(16)
+    json_part = json.dumps(metadata, separators=(',', ':')).encode()
+    head = (
+        f'--{boundary}\r\nContent-Type: application/json\r\nContent-Length: {len(json_part)}\r\n\r\n'
+    ).encode() + json_part + (
+        f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Length: {len(img_bytes)}\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    # La imagen va como un trozo más, sin concatenarla con el resto
+    response = Response([head, img_bytes, tail], mimetype=f'multipart/mixed; boundary={boundary}',
+                        direct_passthrough=True)
+    response.content_length = len(head) + len(img_bytes) + len(tail)
+    return response
+
+def payload_etag(kind, data, options):
+    """ETag de /api/*-base64: solo en modo base64, el único cuyo cuerpo depende solo de la ventana
+    (mode=url emite un enlace nuevo en cada petición)"""
+    if request.args.get('mode', 'base64') != 'base64':
+        return None
+    return candle_etag(kind, data, etag_suffix(options))
+
+def image_payload_response(metadata, img_bytes, render_key, options, etag=None, interval=None, meta=None):
+    """Metadatos + imagen según ?mode=
+    - base64 (por defecto): JSON con image_base64, como hasta ahora
+    - url: JSON con image_url, un enlace de corta duración a /api/images/<token>
+    - multipart: multipart/mixed con el JSON y la imagen en binario (sin base64)
+    Con `etag` (de payload_etag) la respuesta base64 lleva ETag y Cache-Control."""
+    mode = request.args.get('mode', 'base64')
+    if mode == 'multipart':
+        return multipart_response(metadata, img_bytes, mimetype_for(options))
+    if mode == 'url':
+        token = IMAGE_LINKS.issue(render_key, mimetype_for(options))
+        return jsonify({**metadata, 'image_url': f'/api/images/{token}',
+                        'image_url_expires_in': int(IMAGE_LINKS.ttl)})
+    with stage('encode'):
+        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+    response = jsonify({**metadata, 'image_base64': img_base64})
+    if etag:
+        return add_cache_headers(response, etag, interval, meta)
+    return response
+
+def prerender_window(symbol, interval, data):
+    """Renderiza la ventana con cada variante de PRERENDER_VARIANTS y la deja en RENDER_CACHE
+    con las mismas claves que usan /api/n8n-image*, /api/chart-image y /api/chart-base64"""
+    df = create_dataframe(data)
+    if df is None or df.empty:
+        return
+    for options in PRERENDER_VARIANTS:
+        if MATPLOTLIB_AVAILABLE:
+            render_matplotlib_image(df, symbol, interval, data, options)
+        if KALEIDO_AVAILABLE:
+            render_key = make_render_key('plotly', symbol, interval, data, *cache_params(options))
+            if RENDER_CACHE.get(render_key) is None:
+                fig = create_candlestick_chart(df, symbol, options.width, options.panels)
+                if fig is not None:
+                    RENDER_CACHE.put(render_key, export_plotly_image(fig, options))
+
+# Pre-render al cierre de vela para la lista de seguimiento (PRERENDER_WATCHLIST, p. ej.
+# "BTC-USDT:5m,ETH-USDT:1H"). Cada variante es una query string con los parámetros de imagen
+# (PRERENDER_VARIANTS separadas por ';', p. ej. "format=png;thumbnail=1&format=webp").
+PRERENDER_VARIANTS = [
+    parse_image_options(dict(parse_qsl(variant)))
+    for variant in os.environ.get('PRERENDER_VARIANTS', 'format=png').split(';') if variant.strip()
+]
+PRERENDERER = Prerenderer(
+    parse_watchlist(os.environ.get('PRERENDER_WATCHLIST', '')),
+    refresh=CANDLE_CACHE.refresh,
+    render=prerender_window,
+    delay=float(os.environ.get('PRERENDER_DELAY', '2'))
+)
+
+def start_background_threads():
+    """Arranca los hilos en segundo plano de este proceso (instantánea de caché, pre-render y
+    reparación de huecos)
+    
+    Se llama al importar la app, salvo con gunicorn --preload (BACKGROUND_THREADS=post_fork): ahí
+    lo hace el hook post_fork de gunicorn.conf.py en cada worker. Así el maestro no tiene hilos:
+    ni renderiza para una caché que nadie lee ni puede hacer fork con un lock tomado.
+    """
+    if SNAPSHOT_WRITER is not None:
+        SNAPSHOT_WRITER.start()
+        atexit.register(SNAPSHOT_WRITER.stop)
+    if not DEPENDENCIES_LOADED or not all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE]):
+        return
+    if PRERENDERER.watchlist:
+        PRERENDERER.start()
+    if GAP_REPAIRER is not None:
+        GAP_REPAIRER.start()
+        atexit.register(GAP_REPAIRER.stop)
+
+if os.environ.get('BACKGROUND_THREADS', 'import') == 'import':
+    start_background_threads()
+
 # HTML template para la página web
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -434,6 +810,115 @@ HTML_TEMPLATE = """
 </html>
 """
 
+def is_admin_request():
+    """Comprueba la clave de administración (cabecera X-Admin-Key o parámetro admin_key)"""
+    key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    return bool(PROFILE_ADMIN_KEY) and key is not None and hmac.compare_digest(key, PROFILE_ADMIN_KEY)
+
+def should_profile():
+    """Decide si la petición actual se perfila: a petición de un admin o por muestreo"""
+    if request.args.get('profile') == '1' and is_admin_request():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.randrange(PROFILE_SAMPLE_RATE) == 0
+
+@app.before_request
+def start_request_metrics():
+    """Marca el inicio de la petición para las métricas por ruta y la traza"""
+    g.request_started = time.perf_counter()
+    g.trace = begin_trace()
+    if should_profile():
+        g.profiler = SamplingProfiler().start()
+    IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    """Registra la duración por ruta, añade Server-Timing y guarda el perfil si lo hay"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(duration, route=route, method=request.method, status=response.status_code)
+    
+    trace = g.pop('trace', None)
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+    
+    candles_meta = g.pop('candles_meta', None)
+    if candles_meta is not None and candles_meta.get('as_of'):
+        response.headers['X-Data-As-Of'] = candles_meta['as_of']
+        response.headers['X-Data-Stale'] = 'true' if candles_meta['stale'] else 'false'
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        forced = request.args.get('profile') == '1' and is_admin_request()
+        profile_id = PROFILE_STORE.save(profiler, duration, route, force=forced)
+        if profile_id:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Comprime la respuesta según Accept-Encoding
+    Se registra después de record_request_metrics para ejecutarse antes (Flask recorre los
+    after_request en orden inverso) y que la etapa 'compress' aparezca en Server-Timing."""
+    if not is_compressible(response, COMPRESSION_MIN_BYTES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+    
+    body = response.get_data()
+    etag, weak = response.get_etag()
+    with stage('compress'):
+        if etag:
+            # Derivada de la caché de velas: se reutilizan los bytes ya comprimidos
+            compressed = COMPRESSION_CACHE.compress(body, encoding)
+        else:
+            compressed = compress_body(body, encoding)
+    if len(compressed) >= len(body):
+        return response
+    
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag and not weak:
+        # La representación comprimida no es idéntica byte a byte: ETag débil (como nginx)
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    """Descuenta la petición en curso y cierra la traza (también si terminó con excepción)"""
+    IN_FLIGHT.dec()
+    end_trace()
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+@app.route('/debug/profiles')
+def debug_profiles():
+    """Lista los perfiles guardados de las peticiones más lentas (requiere clave de administración)"""
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Clave de administración requerida'}), 401
+    return jsonify({'success': True, 'profiles': PROFILE_STORE.list()})
+
+@app.route('/debug/profiles/<profile_id>')
+def debug_profile(profile_id):
+    """Devuelve un perfil en formato folded (flamegraph.pl, speedscope)"""
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Clave de administración requerida'}), 401
+    path = PROFILE_STORE.path(profile_id)
+    if path is None or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Perfil no encontrado'}), 404
+    return send_file(path, mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -458,9 +943,14 @@ def api_candles():
         
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
+        try:
+            stream_mode = parse_stream_mode(request.args)
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -468,6 +958,24 @@ def api_candles():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        if stream_mode is not None:
+            # Solo las velas (sin gráfico ni DataFrame), de la más antigua a la más reciente
+            etag = candle_etag('candles', data, stream_mode, '+'.join(fields))
+            not_modified = not_modified_response(etag, interval, meta)
+            if not_modified is not None:
+                return not_modified
+            header = {'success': True, 'symbol': symbol, 'interval': interval,
+                      'as_of': meta['as_of'], 'stale': meta['stale']}
+            rows = select_fields(reversed(data), fields)
+            return add_cache_headers(stream_rows(stream_mode, header, rows, fields, STREAM_CHUNK_ROWS),
+                                     etag, interval, meta)
+        
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = candle_etag('candles', data)
+        not_modified = not_modified_response(etag, interval, meta)
+        if not_modified is not None:
+            return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -487,25 +995,20 @@ def api_candles():
             })
         
         # Calcular estadísticas
-        prices = df['close'].values
-        volumes = df['volume'].values
-        
-        stats = {
-            'high': float(prices.max()),
-            'low': float(prices.min()),
-            'change': round(((prices[-1] - prices[0]) / prices[0]) * 100, 2),
-            'volume': float(volumes.sum())
-        }
+        stats = calculate_stats(df)
         
         # Convertir gráfico a JSON
-        chart_json = json.loads(fig.to_json())
-        
-        return jsonify({
-            'success': True,
-            'chart': chart_json,
-            'stats': stats,
-            'candles_count': len(df)
-        })
+        with stage('encode'):
+            chart_json = json.loads(fig.to_json())
+            
+            return add_cache_headers(jsonify({
+                'success': True,
+                'chart': chart_json,
+                'stats': stats,
+                'candles_count': len(df),
+                'as_of': meta['as_of'],
+                'stale': meta['stale']
+            }), etag, interval, meta)
         
     except Exception as e:
         return jsonify({
@@ -533,8 +1036,17 @@ def api_chart_base64():
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Formato y tamaño de la imagen (format, width, height, dpi, quality, thumbnail)
+        try:
+            options = parse_image_options(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -542,6 +1054,13 @@ def api_chart_base64():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = payload_etag('chart-base64', data, options)
+        if etag:
+            not_modified = not_modified_response(etag, interval, meta)
+            if not_modified is not None:
+                return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -551,39 +1070,38 @@ def api_chart_base64():
                 'error': 'No hay datos disponibles'
             })
         
-        # Crear gráfico
-        fig = create_candlestick_chart(df, symbol)
+        # Imagen ya renderizada para esta misma ventana de velas
+        render_key = make_render_key('plotly', symbol, interval, data, *cache_params(options))
+        img_bytes = RENDER_CACHE.get(render_key)
         
-        if fig is None:
-            return jsonify({
-                'success': False,
-                'error': 'Error al crear el gráfico'
-            })
-        
-        # Convertir gráfico a PNG y luego a base64
-        img_bytes = pio.to_image(fig, format="png")
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+        if img_bytes is None:
+            # Crear gráfico
+            fig = create_candlestick_chart(df, symbol, options.width, options.panels)
+            
+            if fig is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Error al crear el gráfico'
+                })
+            
+            # Exportar la imagen
+            img_bytes = export_plotly_image(fig, options)
+            RENDER_CACHE.put(render_key, img_bytes)
         
         # Calcular estadísticas
-        prices = df['close'].values
-        volumes = df['volume'].values
-        
-        stats = {
-            'high': float(prices.max()),
-            'low': float(prices.min()),
-            'change': round(((prices[-1] - prices[0]) / prices[0]) * 100, 2),
-            'volume': float(volumes.sum())
-        }
+        stats = calculate_stats(df)
         
-        return jsonify({
+        return image_payload_response({
             'success': True,
-            'image_base64': img_base64,
             'stats': stats,
             'candles_count': len(df),
             'symbol': symbol,
             'interval': interval,
-            'timestamp': datetime.now().isoformat()
-        })
+            'image_format': options.format,
+            'timestamp': meta['as_of'],
+            'as_of': meta['as_of'],
+            'stale': meta['stale']
+        }, img_bytes, render_key, options, etag, interval, meta)
         
     except Exception as e:
         return jsonify({
@@ -611,8 +1129,17 @@ def api_chart_image():
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Formato y tamaño de la imagen (format, width, height, dpi, quality, thumbnail)
+        try:
+            options = parse_image_options(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -620,6 +1147,12 @@ def api_chart_image():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = candle_etag('chart-image', data, etag_suffix(options))
+        not_modified = not_modified_response(etag, interval, meta)
+        if not_modified is not None:
+            return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -629,8 +1162,14 @@ def api_chart_image():
                 'error': 'No hay datos disponibles'
             })
         
+        # Imagen ya renderizada para esta misma ventana de velas
+        render_key = make_render_key('plotly', symbol, interval, data, *cache_params(options))
+        img_bytes = RENDER_CACHE.get(render_key)
+        if img_bytes is not None:
+            return add_cache_headers(image_response(img_bytes, mimetype_for(options)), etag, interval, meta)
+        
         # Crear gráfico
-        fig = create_candlestick_chart(df, symbol)
+        fig = create_candlestick_chart(df, symbol, options.width, options.panels)
         
         if fig is None:
             return jsonify({
@@ -640,6 +1179,7 @@ def api_chart_image():
         
         # Verificar si Kaleido está disponible
         if not KALEIDO_AVAILABLE:
+            RENDER_FALLBACKS.inc(renderer='plotly', reason='kaleido_unavailable')
             return jsonify({
                 'success': False,
                 'error': 'Generación de imágenes PNG no disponible (Kaleido/Chrome no instalado)',
@@ -652,17 +1192,16 @@ def api_chart_image():
                 }
             })
         
-        # Convertir gráfico a PNG con manejo de errores
+        # Exportar la imagen con manejo de errores
         try:
-            img_bytes = pio.to_image(fig, format="png")
+            img_bytes = export_plotly_image(fig, options)
+            RENDER_CACHE.put(render_key, img_bytes)
             
-            # Devolver la imagen como un archivo PNG
-            return send_file(
-                io.BytesIO(img_bytes),
-                mimetype='image/png'
-            )
+            # Devolver la imagen en el formato pedido
+            return add_cache_headers(image_response(img_bytes, mimetype_for(options)), etag, interval, meta)
         except Exception as chrome_error:
             # Si falla la generación de imagen, devolver datos JSON como alternativa
+            RENDER_FALLBACKS.inc(renderer='plotly', reason='export_error')
             if "Chrome" in str(chrome_error) or "Kaleido" in str(chrome_error):
                 return jsonify({
                     'success': False,
@@ -712,7 +1251,8 @@ def health():
                 'n8n_image': '/api/n8n-image',
                 'n8n_image_base64': '/api/n8n-image-base64',
                 'chart_image': '/api/chart-image',
-                'health': '/health'
+                'health': '/health',
+                'metrics': '/metrics'
             }
         })
     except Exception as e:
@@ -752,8 +1292,8 @@ def api_n8n():
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -761,6 +1301,12 @@ def api_n8n():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = candle_etag('n8n', data)
+        not_modified = not_modified_response(etag, interval, meta)
+        if not_modified is not None:
+            return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -777,9 +1323,11 @@ def api_n8n():
         change = latest_candle['close'] - latest_candle['open']
         change_percent = (change / latest_candle['open']) * 100
         
-        return jsonify({
+        return add_cache_headers(jsonify({
             'success': True,
-            'timestamp': datetime.now().isoformat(),
+            # Hora de los datos y no de la petición: el cuerpo solo cambia con la ventana
+            # (y su versión comprimida se reutiliza en COMPRESSION_CACHE)
+            'timestamp': meta['as_of'],
             'symbol': symbol,
             'interval': interval,
             'current_price': float(latest_candle['close']),
@@ -791,8 +1339,10 @@ def api_n8n():
             'change_percent': float(change_percent),
             'trend': 'up' if change >= 0 else 'down',
             'candles_count': len(df),
-            'last_update': latest_candle.name.isoformat() if hasattr(latest_candle.name, 'isoformat') else str(latest_candle.name)
-        })
+            'last_update': latest_candle.name.isoformat() if hasattr(latest_candle.name, 'isoformat') else str(latest_candle.name),
+            'as_of': meta['as_of'],
+            'stale': meta['stale']
+        }), etag, interval, meta)
         
     except Exception as e:
         return jsonify({
@@ -821,8 +1371,17 @@ def api_n8n_image():
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Formato y tamaño de la imagen (format, width, height, dpi, quality, thumbnail)
+        try:
+            options = parse_image_options(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -830,6 +1389,12 @@ def api_n8n_image():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = candle_etag('n8n-image', data, etag_suffix(options))
+        not_modified = not_modified_response(etag, interval, meta)
+        if not_modified is not None:
+            return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -842,16 +1407,15 @@ def api_n8n_image():
         # Intentar generar imagen con matplotlib
         try:
             if MATPLOTLIB_AVAILABLE:
-                img_bytes = create_matplotlib_chart(df, symbol)
+                img_bytes = render_matplotlib_image(df, symbol, interval, data, options)
                 if img_bytes:
-                    return send_file(
-                        io.BytesIO(img_bytes),
-                        mimetype='image/png'
-                    )
+                    return add_cache_headers(image_response(img_bytes, mimetype_for(options)), etag, interval, meta)
         except Exception as e:
             print(f"Error generating matplotlib chart: {e}")
         
         # Si matplotlib no está disponible o falla, devolver error
+        RENDER_FALLBACKS.inc(renderer='matplotlib',
+                             reason='render_error' if MATPLOTLIB_AVAILABLE else 'matplotlib_unavailable')
         return jsonify({
             'success': False,
             'error': 'No se puede generar imagen (matplotlib no disponible o error)',
@@ -886,8 +1450,17 @@ def api_n8n_image_base64():
         symbol = request.args.get('symbol', 'BTC-USDT')
         interval = request.args.get('interval', '5m')
         
-        # Obtener datos
-        data = get_candlestick_data(symbol, interval)
+        # Formato y tamaño de la imagen (format, width, height, dpi, quality, thumbnail)
+        try:
+            options = parse_image_options(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Obtener datos (desde caché si está disponible)
+        data, meta = get_cached_candles(symbol, interval)
         
         if not data:
             return jsonify({
@@ -895,6 +1468,13 @@ def api_n8n_image_base64():
                 'error': 'No se pudieron obtener datos de la API'
             })
         
+        # Si el cliente ya tiene esta ventana, no hace falta reconstruir nada
+        etag = payload_etag('n8n-image-base64', data, options)
+        if etag:
+            not_modified = not_modified_response(etag, interval, meta)
+            if not_modified is not None:
+                return not_modified
+        
         # Crear DataFrame
         df = create_dataframe(data)
         
@@ -907,34 +1487,34 @@ def api_n8n_image_base64():
         # Intentar generar imagen con matplotlib
         try:
             if MATPLOTLIB_AVAILABLE:
-                img_bytes = create_matplotlib_chart(df, symbol)
+                render_key = make_render_key('matplotlib', symbol, interval, data, *cache_params(options))
+                img_bytes = render_matplotlib_image(df, symbol, interval, data, options, render_key)
                 if img_bytes:
-                    # Convertir a base64
-                    import base64
-                    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-                    
                     # Obtener la última vela para información adicional
                     latest_candle = df.iloc[-1]
                     change = latest_candle['close'] - latest_candle['open']
                     change_percent = (change / latest_candle['open']) * 100
                     
-                    return jsonify({
+                    return image_payload_response({
                         'success': True,
-                        'timestamp': datetime.now().isoformat(),
+                        'timestamp': meta['as_of'],
                         'symbol': symbol,
                         'interval': interval,
-                        'image_base64': img_base64,
-                        'image_format': 'png',
+                        'image_format': options.format,
                         'image_size_bytes': len(img_bytes),
                         'current_price': float(latest_candle['close']),
                         'change_percent': float(change_percent),
                         'trend': 'up' if change >= 0 else 'down',
-                        'candles_count': len(df)
-                    })
+                        'candles_count': len(df),
+                        'as_of': meta['as_of'],
+                        'stale': meta['stale']
+                    }, img_bytes, render_key, options, etag, interval, meta)
         except Exception as e:
             print(f"Error generating matplotlib chart: {e}")
         
         # Si matplotlib no está disponible o falla, devolver error
+        RENDER_FALLBACKS.inc(renderer='matplotlib',
+                             reason='render_error' if MATPLOTLIB_AVAILABLE else 'matplotlib_unavailable')
         return jsonify({
             'success': False,
             'error': 'No se puede generar imagen (matplotlib no disponible o error)',
@@ -949,6 +1529,154 @@ def api_n8n_image_base64():
             'timestamp': datetime.now().isoformat()
         })
 
+@app.route('/api/images/<token>')
+def api_image(token):
+    """Imagen de la caché enlazada desde mode=url; el enlace caduca a los IMAGE_LINK_TTL segundos"""
+    render_key, mimetype, remaining = IMAGE_LINKS.resolve(token)
+    img_bytes = RENDER_CACHE.get(render_key) if render_key is not None else None
+    if img_bytes is None:
+        return jsonify({'success': False, 'error': 'Imagen no encontrada o enlace caducado'}), 404
+    response = image_response(img_bytes, mimetype)
+    response.headers['Cache-Control'] = f'private, max-age={max(1, int(remaining))}'
+    return response
+
+@app.route('/api/history')
+def api_history():
+    """Velas del almacén local en un rango de fechas, en streaming
+    
+    Parámetros: symbol, bar (o interval), start / end (epoch en ms o ISO; end no incluido),
+    fields (columnas separadas por comas), agg (intervalo mayor al que agrupar, p. ej. 1D) y
+    stream (json por defecto, o ndjson).
+    """
+    if CANDLE_STORE is None:
+        return jsonify({'success': False, 'error': 'El almacén de velas está desactivado (CANDLE_STORE_DIR)'}), 503
+    
+    symbol = request.args.get('symbol', 'BTC-USDT')
+    bar = request.args.get('bar') or request.args.get('interval', '5m')
+    agg = request.args.get('agg') or None
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        mode = parse_stream_mode(request.args, default='json')
+        start = parse_time_ms(request.args.get('start'))
+        end = parse_time_ms(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if bar not in BAR_SECONDS:
+        return jsonify({'success': False, 'error': f"'bar' debe ser uno de: {', '.join(BAR_SECONDS)}"}), 400
+    if agg is not None and (agg not in BAR_SECONDS or BAR_SECONDS[agg] % BAR_SECONDS[bar]):
+        return jsonify({'success': False, 'error': f"'agg' debe ser un intervalo múltiplo de {bar}"}), 400
+    if start is not None and end is not None and end <= start:
+        return jsonify({'success': False, 'error': "'end' debe ser posterior a 'start'"}), 400
+    
+    # Generadores: nada se lee del disco hasta que sale el primer fragmento
+    rows = CANDLE_STORE.query(symbol, bar, start, end)
+    if agg is not None:
+        rows = aggregate(rows, agg)
+    header = {'success': True, 'symbol': symbol, 'bar': bar, 'agg': agg, 'start': start, 'end': end}
+    return stream_rows(mode, header, select_fields(rows, fields), fields, STREAM_CHUNK_ROWS)
+
+@app.route('/api/correlation')
+def api_correlation():
+    """Correlación móvil, beta y fuerza relativa de varios símbolos alineados por timestamp
+    
+    Parámetros: symbols (separados por comas; por defecto los del selector), interval,
+    window (rendimientos por ventana móvil, 20 por defecto) y benchmark (por defecto el primero).
+    Solo se usan velas cerradas, así que el informe se calcula una vez por cierre de vela.
+    """
+    if not DEPENDENCIES_LOADED or not all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE]):
+        return jsonify({'success': False, 'error': 'Las credenciales de la API no están configuradas correctamente'})
+    
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols)) or list(correlation.DEFAULT_SYMBOLS)
+    interval = request.args.get('interval', '5m')
+    benchmark = request.args.get('benchmark') or symbols[0]
+    try:
+        window = int(request.args.get('window', correlation.DEFAULT_WINDOW))
+    except ValueError:
+        return jsonify({'success': False, 'error': "'window' debe ser un número entero"}), 400
+    if interval not in BAR_SECONDS:
+        return jsonify({'success': False, 'error': f"'interval' debe ser uno de: {', '.join(BAR_SECONDS)}"}), 400
+    if not 2 <= len(symbols) <= 10 or benchmark not in symbols:
+        return jsonify({'success': False, 'error': "'symbols' admite de 2 a 10 símbolos e incluye 'benchmark'"}), 400
+    if window < 2:
+        return jsonify({'success': False, 'error': "'window' debe ser al menos 2"}), 400
+    
+    windows, metas = {}, []
+    fetched = CANDLE_CACHE.get_many([(symbol, interval) for symbol in symbols])
+    for symbol in symbols:
+        data, meta = fetched[(symbol, interval)]
+        if data:
+            windows[symbol] = data
+            metas.append(meta)
+    missing = [symbol for symbol in symbols if symbol not in windows]
+    if benchmark in missing or len(windows) < 2:
+        return jsonify({'success': False, 'error': 'No se pudieron obtener datos de la API', 'missing': missing})
+    # Cabeceras X-Data-*: la ventana más antigua manda
+    meta = {'as_of': min((m['as_of'] for m in metas if m['as_of']), default=None),
+            'stale': any(m['stale'] for m in metas)}
+    g.candles_meta = meta
+    
+    # La clave solo cambia cuando cierra una vela (o OKX corrige una cerrada) en algún símbolo;
+    # incluye los símbolos pedidos y los que faltan, que también van en el cuerpo ('missing')
+    fingerprints = [window_fingerprint([row for row in windows[s] if is_closed(row)]) for s in windows]
+    digest = hashlib.blake2b('|'.join(symbols + ['missing'] + missing + list(windows) + fingerprints).encode(),
+                             digest_size=8).hexdigest()
+    etag = '-'.join(['correlation', interval, str(window), benchmark, digest])
+    not_modified = not_modified_response(etag, interval, meta)
+    if not_modified is not None:
+        return not_modified
+    
+    body = CORRELATION_CACHE.get(etag)
+    if body is None:
+        timestamps, aligned_symbols, closes = correlation.align_closes(windows)
+        try:
+            report = correlation.correlation_report(timestamps, aligned_symbols, closes, window, benchmark)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        body = json.dumps({'success': True, 'interval': interval, 'missing': missing, **report}).encode()
+        CORRELATION_CACHE.put(etag, body)
+    return add_cache_headers(Response(body, mimetype='application/json'), etag, interval, meta)
+
+def parse_completeness_args():
+    """(symbol, bar, start, end) de /api/completeness; lanza ValueError con un mensaje para el cliente"""
+    symbol = request.args.get('symbol', 'BTC-USDT')
+    bar = request.args.get('bar') or request.args.get('interval', '5m')
+    if bar not in BAR_SECONDS:
+        raise ValueError(f"'bar' debe ser uno de: {', '.join(BAR_SECONDS)}")
+    start = parse_time_ms(request.args.get('start'))
+    end = parse_time_ms(request.args.get('end'))
+    if start is not None and end is not None and end <= start:
+        raise ValueError("'end' debe ser posterior a 'start'")
+    return symbol, bar, start, end
+
+@app.route('/api/completeness', methods=['GET', 'POST'])
+def api_completeness():
+    """Completitud del almacén por día: velas esperadas, presentes y huecos
+    
+    Parámetros: symbol, bar (o interval), start / end (epoch en ms o ISO; end no incluido).
+    Sin start se empieza en la primera vela guardada; sin end se llega a la última vela cerrada.
+    Con POST (requiere la clave de administración) además se encolan los huecos para repararlos.
+    """
+    if CANDLE_STORE is None:
+        return jsonify({'success': False, 'error': 'El almacén de velas está desactivado (CANDLE_STORE_DIR)'}), 503
+    if request.method == 'POST' and not is_admin_request():
+        return jsonify({'success': False, 'error': 'Clave de administración requerida'}), 401
+    try:
+        symbol, bar, start, end = parse_completeness_args()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    timestamps = [int(row[0]) for row in CANDLE_STORE.query(symbol, bar, start, end)]
+    report = completeness_report(timestamps, bar, start, end)
+    result = {'success': True, 'symbol': symbol, **report}
+    if request.method == 'POST':
+        if not GAP_REPAIRER.stats()['running']:
+            return jsonify({**result, 'success': False,
+                            'error': 'La reparación de huecos no está en marcha (credenciales de OKX)'}), 503
+        result['scheduled'] = GAP_REPAIRER.schedule(symbol, bar, report['gaps'])
+        result['gap_repair'] = GAP_REPAIRER.stats()
+    return jsonify(result)
+
 @app.route('/debug')
 def debug():
     """Endpoint de debug con información del sistema"""
@@ -960,7 +1688,17 @@ def debug():
         'python_version': '3.11.5',
         'flask_version': '2.3.3',
         'dependencies_loaded': DEPENDENCIES_LOADED,
-        'credentials_configured': all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE])
+        'credentials_configured': all([OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE]),
+        'startup': STARTUP_STATE,
+        'candle_cache': CANDLE_CACHE.stats(),
+        'render_cache': RENDER_CACHE.stats(),
+        'correlation_cache': CORRELATION_CACHE.stats(),
+        'compression_cache': COMPRESSION_CACHE.stats(),
+        'prerender': PRERENDERER.stats(),
+        'figure_pool': mpl_candles.FIGURE_POOL.stats() if MATPLOTLIB_AVAILABLE else None,
+        'candle_store': CANDLE_STORE.stats() if CANDLE_STORE is not None else None,
+        'gap_repair': GAP_REPAIRER.stats() if GAP_REPAIRER is not None else None,
+        'import_timings_ms': import_timings_ms()
     })
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+"""
+Backtesting de reglas de señal sobre el histórico local de velas (candle_store)
+Evalúa sin conexión, sobre series largas del almacén, reglas construidas con las mismas
+estadísticas que devuelve /api/n8n (cambio y tendencia de la vela, cambio % de la ventana)
+más el RSI de los paneles:
+
+- entrada (largo) cuando el cambio de las últimas `lookback` velas es >= `entry` %, la última
+  vela es alcista (trend 'up') y el RSI está por debajo de `rsi_max`
+- salida cuando ese cambio es <= -`exit` % o el RSI llega a `rsi_exit`
+
+La señal se decide al cierre de una vela y se aplica a la siguiente. Cada combinación de
+parámetros se evalúa con operaciones de numpy sobre la serie entera (sin bucles por vela);
+las series se leen una vez por proceso y las combinaciones se reparten entre procesos.
+
+Uso:
+    python backtest.py --symbols BTC-USDT,ETH-USDT --bar 5m --agg 1H --since 2025-01-01
+    python backtest.py --symbols BTC-USDT --lookback 12,24,81 --entry 0.5,1,2 --exit 1,2 --json
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import indicators
+from candle_cache import BAR_SECONDS
+from candle_store import CandleStore, aggregate, parse_time_ms
+
+# Parámetros de una regla, en el orden de la rejilla
+PARAMETERS = ('lookback', 'entry', 'exit', 'rsi_period', 'rsi_max', 'rsi_exit')
+DEFAULT_GRID = {
+    'lookback': '12,24,48,81',
+    'entry': '0.5,1,2',
+    'exit': '0.5,1,2',
+    'rsi_period': '14',
+    'rsi_max': '70,100',
+    'rsi_exit': '80,100',
+}
+SORT_KEYS = ('total_return', 'sharpe', 'max_drawdown', 'win_rate')
+
+YEAR_SECONDS = 365 * 86400
+
+
+@functools.lru_cache(maxsize=8)
+def load_series(directory, symbol, bar, start=None, end=None, agg=None):
+    """(timestamps, open, close) de una serie del almacén como arrays; se lee una vez por proceso"""
+    rows = CandleStore(directory).query(symbol, bar, start, end)
+    if agg:
+        rows = aggregate(rows, agg)
+    values = np.array([row[:5] for row in rows], dtype=float).reshape(-1, 5)
+    return values[:, 0].astype(np.int64), values[:, 1], values[:, 4]
+
+
+def window_change(closes, lookback):
+    """Cambio % respecto a `lookback` velas antes (el 'change' de calculate_stats); NaN al principio"""
+    change = np.full(len(closes), np.nan)
+    if len(closes) > lookback:
+        change[lookback:] = (closes[lookback:] - closes[:-lookback]) / closes[:-lookback] * 100
+    return change
+
+
+def positions(entries, exits):
+    """Posición (1 dentro, 0 fuera) tras cada vela a partir de las señales; salir gana a entrar"""
+    state = np.full(len(entries), np.nan)
+    state[0] = 0.0
+    state[entries] = 1.0
+    state[exits] = 0.0
+    # Cada vela sin señal mantiene el último estado: índice de la última señal con maximum.accumulate
+    last = np.maximum.accumulate(np.where(np.isnan(state), 0, np.arange(len(state))))
+    return state[last]
+
+
+def evaluate(opens, closes, features, params, fee, bars_per_year):
+    """Métricas de una combinación de parámetros sobre la serie completa"""
+    change = features[('change', params['lookback'])]
+    rsi = features[('rsi', params['rsi_period'])]
+    with np.errstate(invalid='ignore'):
+        entries = (change >= params['entry']) & (closes >= opens) & (rsi < params['rsi_max'])
+        exits = (change <= -params['exit']) | (rsi >= params['rsi_exit'])
+    position = positions(entries, exits)
+
+    previous = np.concatenate([[0.0], position[:-1]])
+    turnover = np.abs(position - previous)
+    returns = closes[1:] / closes[:-1] - 1
+    strategy = position[:-1] * returns - fee * turnover[:-1]
+
+    equity = np.cumprod(1 + strategy)
+    peaks = np.maximum.accumulate(np.concatenate([[1.0], equity]))[1:]
+    drawdown = equity / peaks - 1
+
+    # Rentabilidad de cada operación: suma de log-rendimientos entre la entrada y la salida
+    log_equity = np.concatenate([[0.0], np.cumsum(np.log1p(strategy))])
+    starts = np.flatnonzero((position == 1) & (previous == 0))
+    # La salida en la vela e cobra su comisión en strategy[e]; una operación abierta llega al final
+    ends = np.flatnonzero((position == 0) & (previous == 1)) + 1
+    ends = np.minimum(np.concatenate([ends, [len(position) - 1]])[:len(starts)], len(position) - 1)
+    trade_returns = np.expm1(log_equity[ends] - log_equity[starts])
+
+    deviation = strategy.std()
+    return {
+        **params,
+        'total_return': float(equity[-1] - 1) * 100,
+        'max_drawdown': float(drawdown.min()) * 100,
+        'sharpe': float(strategy.mean() / deviation * math.sqrt(bars_per_year)) if deviation > 0 else 0.0,
+        'trades': int(len(starts)),
+        'win_rate': float((trade_returns > 0).mean()) * 100 if len(starts) else None,
+        'exposure': float(position[:-1].mean()) * 100,
+    }
+
+
+def run_grid(directory, symbol, bar, start, end, agg, grid, fee):
+    """Evalúa una parte de la rejilla sobre una serie (se ejecuta en un proceso del pool)"""
+    timestamps, opens, closes = load_series(directory, symbol, bar, start, end, agg)
+    if len(closes) < 2:
+        return []
+    features = {}
+    for params in grid:
+        if ('change', params['lookback']) not in features:
+            features[('change', params['lookback'])] = window_change(closes, params['lookback'])
+        if ('rsi', params['rsi_period']) not in features:
+            features[('rsi', params['rsi_period'])] = indicators.rsi(closes, params['rsi_period'])
+    bars_per_year = YEAR_SECONDS / BAR_SECONDS[agg or bar]
+    buy_and_hold = float(closes[-1] / closes[0] - 1) * 100
+    return [
+        {'symbol': symbol, 'candles': len(closes), 'buy_and_hold': buy_and_hold,
+         **evaluate(opens, closes, features, params, fee, bars_per_year)}
+        for params in grid
+    ]
+
+
+def parse_values(value, cast=float):
+    """'0.5,1,2' -> [0.5, 1.0, 2.0]"""
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def build_grid(args):
+    """Producto cartesiano de los valores de cada parámetro -> lista de dicts"""
+    values = [
+        parse_values(getattr(args, name), int if name in ('lookback', 'rsi_period') else float)
+        for name in PARAMETERS
+    ]
+    return [dict(zip(PARAMETERS, combination)) for combination in itertools.product(*values)]
+
+
+def backtest(directory, symbols, bar, grid, start=None, end=None, agg=None, fee=0.001, workers=None):
+    """Resultados de todas las combinaciones para cada símbolo, en paralelo
+    Cada tarea es (símbolo, trozo de la rejilla): los trozos de un mismo símbolo reutilizan la
+    serie ya leída en ese proceso."""
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, math.ceil(len(grid) * len(symbols) / (workers * 4)))
+    tasks = [(symbol, grid[i:i + chunk]) for symbol in symbols for i in range(0, len(grid), chunk)]
+    if workers == 1 or len(tasks) == 1:
+        parts = [run_grid(directory, symbol, bar, start, end, agg, part, fee) for symbol, part in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_grid, directory, symbol, bar, start, end, agg, part, fee)
+                       for symbol, part in tasks]
+            parts = [future.result() for future in futures]
+    return [result for part in parts for result in part]
+
+
+def print_results(results, sort_key, top):
+    """Tabla de las mejores combinaciones por símbolo"""
+    for symbol in sorted({result['symbol'] for result in results}):
+        rows = sorted((r for r in results if r['symbol'] == symbol),
+                      key=lambda r: r[sort_key] if r[sort_key] is not None else -math.inf, reverse=True)
+        print(f"\n📈 {symbol} ({rows[0]['candles']} velas, comprar y mantener {rows[0]['buy_and_hold']:+.2f}%)")
+        print(f"{'lookback':>8} {'entry':>6} {'exit':>6} {'rsi':>4} {'rsi_max':>7} {'rsi_exit':>8} "
+              f"{'retorno':>9} {'drawdown':>9} {'sharpe':>7} {'ops':>5} {'aciertos':>8} {'expos.':>7}")
+        for r in rows[:top]:
+            win_rate = f"{r['win_rate']:.1f}%" if r['win_rate'] is not None else '-'
+            print(f"{r['lookback']:>8} {r['entry']:>6g} {r['exit']:>6g} {r['rsi_period']:>4} {r['rsi_max']:>7g} "
+                  f"{r['rsi_exit']:>8g} {r['total_return']:>+8.2f}% {r['max_drawdown']:>8.2f}% "
+                  f"{r['sharpe']:>7.2f} {r['trades']:>5} {win_rate:>8} {r['exposure']:>6.1f}%")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Backtesting de reglas de señal sobre el histórico local de velas')
+    parser.add_argument('--dir', default=os.environ.get('CANDLE_STORE_DIR') or 'candle_store')
+    parser.add_argument('--symbols', help='Símbolos separados por comas (por defecto, todos los del almacén)')
+    parser.add_argument('--bar', default='5m', help='Intervalo guardado en el almacén')
+    parser.add_argument('--agg', help='Intervalo mayor al que agrupar las velas antes de evaluar (p. ej. 1H)')
+    parser.add_argument('--since', help='Desde (epoch en ms o fecha ISO)')
+    parser.add_argument('--until', help='Hasta, no incluido (epoch en ms o fecha ISO)')
+    parser.add_argument('--fee', type=float, default=0.1, help='Comisión por operación en %% (entrada o salida)')
+    for name in PARAMETERS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, default=DEFAULT_GRID[name],
+                            help=f'Valores de {name} separados por comas (por defecto {DEFAULT_GRID[name]})')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos (por defecto, uno por CPU)')
+    parser.add_argument('--sort', choices=SORT_KEYS, default='total_return')
+    parser.add_argument('--top', type=int, default=10, help='Combinaciones a mostrar por símbolo')
+    parser.add_argument('--json', action='store_true', help='Todas las combinaciones en JSON')
+    args = parser.parse_args()
+
+    if args.bar not in BAR_SECONDS or (args.agg and args.agg not in BAR_SECONDS):
+        parser.error(f"los intervalos deben ser uno de: {', '.join(BAR_SECONDS)}")
+    try:
+        start, end = parse_time_ms(args.since), parse_time_ms(args.until)
+        grid = build_grid(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    store = CandleStore(args.dir)
+    symbols = parse_values(args.symbols, str) if args.symbols else sorted(
+        series.rpartition('/')[0] for series in store.series() if series.endswith(f'/{args.bar}'))
+    if not symbols:
+        print(f"No hay series con intervalo {args.bar} en {args.dir}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    results = backtest(args.dir, symbols, args.bar, grid, start, end, args.agg, args.fee / 100, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"{len(results)} combinaciones evaluadas en {elapsed:.2f}s "
+          f"({len(results) / elapsed * 60:.0f}/min)", file=sys.stderr)
+    evaluated = {result['symbol'] for result in results}
+    skipped = [symbol for symbol in symbols if symbol not in evaluated]
+    if skipped:
+        print(f"Sin velas suficientes en el rango pedido ({args.bar}{' -> ' + args.agg if args.agg else ''}): "
+              f"{', '.join(skipped)}", file=sys.stderr)
+    if not results:
+        print("No hay velas suficientes en el rango pedido.")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, args.sort, args.top)
+
+
+if __name__ == '__main__':
+    main()
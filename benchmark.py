@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline del pipeline de velas: fetch, parse, stats, render y serialización
+Usa respuestas grabadas de OKX (candles_*.json) en lugar de la API real, así que
+los resultados son reproducibles y se pueden comparar entre versiones.
+
+Ejemplos:
+    python benchmark.py --output bench_results.json
+    python benchmark.py --sizes 81,1000 --stages parse,stats
+    python benchmark.py --output nuevo.json --compare bench_results.json --threshold 1.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from unittest import mock
+
+# app.py exige credenciales para servir las rutas; en el benchmark nunca se usan
+# contra OKX porque la capa de red se reemplaza por los datos grabados
+os.environ.setdefault('OKX_API_KEY', 'benchmark')
+os.environ.setdefault('OKX_API_SECRET', 'benchmark')
+os.environ.setdefault('OKX_PASSPHRASE', 'benchmark')
+# Sin instantánea de caché: cada ejecución empieza en frío y no deja archivos
+os.environ.setdefault('CACHE_SNAPSHOT_PATH', '')
+# Ni almacén local de velas (las respuestas grabadas no deben acabar en disco)
+os.environ.setdefault('CANDLE_STORE_DIR', '')
+
+import app as app_module
+from image_options import parse_image_options
+
+DEFAULT_RECORDING = 'candles_BTC-USDT_2025-07-27.json'
+DEFAULT_SIZES = [81, 1000, 10000, 100000]
+BAR_MS = 5 * 60 * 1000
+
+ALL_STAGES = [
+    'fetch', 'parse', 'stats', 'plotly_figure', 'plotly_to_json',
+    'plotly_to_image', 'matplotlib_chart', 'routes'
+]
+
+# Etapas que no dependen del tamaño de ventana: OKX devuelve como mucho 100 velas por petición
+# (limit=100) y fetch_candlestick_data se queda con 81, así que se miden una vez con ese tamaño
+FIXED_SIZE_STAGES = {'fetch': 100}
+
+ROUTES = [
+    '/api/candles',
+    '/api/n8n',
+    '/api/chart-base64',
+    '/api/chart-image',
+    '/api/n8n-image',
+    '/api/n8n-image-base64',
+]
+
+
+class RecordedResponse:
+    """Respuesta HTTP mínima construida a partir de datos grabados de OKX"""
+
+    def __init__(self, candles):
+        self.status_code = 200
+        self._payload = {'code': '0', 'msg': '', 'data': candles}
+        self.text = ''
+
+    def json(self):
+        return self._payload
+
+
+def load_recording(path):
+    """Carga un archivo de velas grabado y lo devuelve en orden cronológico"""
+    with open(path, 'r') as f:
+        candles = json.load(f)
+    return sorted(candles, key=lambda c: int(c[0]))
+
+
+def build_window(recording, size):
+    """Construye una ventana de `size` velas repitiendo la grabación con timestamps contiguos
+
+    El resultado sigue el orden de la API de OKX (más reciente primero).
+    """
+    first_ts = int(recording[0][0])
+    window = []
+    for i in range(size):
+        candle = list(recording[i % len(recording)])
+        candle[0] = str(first_ts + i * BAR_MS)
+        window.append(candle)
+    window.reverse()
+    return window
+
+
+def time_call(func, repeat, max_seconds):
+    """Ejecuta `func` hasta `repeat` veces (o hasta agotar `max_seconds`) y devuelve los tiempos"""
+    timings = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > max_seconds:
+            break
+    return timings
+
+
+def summarize(timings):
+    """Resume una lista de tiempos en segundos"""
+    ordered = sorted(timings)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[p95_index],
+        'max': ordered[-1],
+    }
+
+
+def bench_stage(stage, window):
+    """Devuelve una lista de (nombre, callable) para una etapa y una ventana"""
+    symbol = 'BTC-USDT'
+    df = app_module.create_dataframe(window)
+    cases = []
+
+    if stage == 'fetch':
+        def fetch():
+            with mock.patch.object(app_module.requests, 'get', return_value=RecordedResponse(window)):
+                app_module.get_candlestick_data(symbol, '5m')
+        cases.append(('fetch', fetch))
+    elif stage == 'parse':
+        cases.append(('create_dataframe', lambda: app_module.create_dataframe(window)))
+    elif stage == 'stats':
+        cases.append(('calculate_stats', lambda: app_module.calculate_stats(df)))
+    elif stage == 'plotly_figure':
+        cases.append(('create_candlestick_chart', lambda: app_module.create_candlestick_chart(df, symbol)))
+    elif stage == 'plotly_to_json':
+        fig = app_module.create_candlestick_chart(df, symbol)
+        cases.append(('fig.to_json', lambda: fig.to_json()))
+    elif stage == 'plotly_to_image':
+        if not app_module.KALEIDO_AVAILABLE:
+            return None
+        fig = app_module.create_candlestick_chart(df, symbol)
+        cases.append(('pio.to_image', lambda: app_module.pio.to_image(fig, format='png')))
+    elif stage == 'matplotlib_chart':
+        if not app_module.MATPLOTLIB_AVAILABLE:
+            return None
+        cases.append(('create_matplotlib_chart', lambda: app_module.create_matplotlib_chart(df, symbol)))
+        thumbnail = parse_image_options({'thumbnail': '1', 'format': 'webp'})
+        cases.append(('create_matplotlib_chart thumbnail webp',
+                      lambda: app_module.create_matplotlib_chart(df, symbol, thumbnail)))
+    elif stage == 'routes':
+        client = app_module.app.test_client()
+        meta = {'as_of': datetime.now().isoformat(), 'stale': False, 'source': 'cache'}
+        for route in ROUTES:
+            def call_route(route=route):
+                # Se mide el pipeline completo, no la caché de imágenes
+                app_module.RENDER_CACHE.clear()
+                with mock.patch.object(app_module, 'get_cached_candles', return_value=(window, meta)):
+                    response = client.get(f'{route}?symbol={symbol}&interval=5m')
+                    response.get_data()
+            cases.append((f'GET {route}', call_route))
+    return cases
+
+
+def measure_cold_start(startup_mode=None):
+    """Mide en un proceso nuevo el tiempo de `import app` y hasta la primera respuesta de /ping"""
+    code = (
+        'import time; t0 = time.perf_counter(); import app; t1 = time.perf_counter(); '
+        'app.app.test_client().get("/ping"); t2 = time.perf_counter(); print(t1 - t0, t2 - t0)'
+    )
+    env = dict(os.environ)
+    if startup_mode:
+        env['STARTUP_IMPORTS'] = startup_mode
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        return None
+    import_seconds, first_ping_seconds = (float(v) for v in result.stdout.strip().splitlines()[-1].split())
+    return {'import_seconds': import_seconds, 'first_ping_seconds': first_ping_seconds}
+
+
+def environment_info():
+    """Información del entorno para poder comparar resultados entre máquinas y versiones"""
+    info = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dependencies_loaded': app_module.DEPENDENCIES_LOADED,
+        'kaleido_available': app_module.KALEIDO_AVAILABLE,
+        'matplotlib_available': app_module.MATPLOTLIB_AVAILABLE,
+    }
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        info['git_commit'] = None
+    for name in ('pandas', 'numpy', 'plotly', 'matplotlib', 'flask'):
+        module = sys.modules.get(name)
+        info[f'{name}_version'] = getattr(module, '__version__', None)
+    return info
+
+
+def compare_results(results, baseline_path, threshold):
+    """Compara medianas contra un resultado anterior y devuelve las regresiones"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    previous = {(r['name'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result['name'], result['size']))
+        if not old or not old.get('median'):
+            continue
+        ratio = result['median'] / old['median']
+        result['baseline_median'] = old['median']
+        result['ratio'] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Benchmark offline del pipeline de velas')
+    parser.add_argument('--recording', default=DEFAULT_RECORDING,
+                        help='Archivo de velas grabado de OKX')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Tamaños de ventana separados por comas')
+    parser.add_argument('--stages', default=','.join(ALL_STAGES),
+                        help=f'Etapas a medir ({",".join(ALL_STAGES)})')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por caso')
+    parser.add_argument('--max-seconds', type=float, default=10.0,
+                        help='Tiempo máximo por caso antes de dejar de repetir')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='Medir también el arranque en frío de app.py en cada modo de STARTUP_IMPORTS')
+    parser.add_argument('--cold-start-budget', type=float,
+                        default=float(os.environ.get('COLD_START_BUDGET', 1.0)),
+                        help='Segundos máximos hasta la primera respuesta de /ping (modo por defecto)')
+    parser.add_argument('--output', help='Archivo JSON de salida (por defecto stdout)')
+    parser.add_argument('--compare', help='Resultado anterior contra el que comparar')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Factor de la mediana a partir del cual se considera regresión')
+    args = parser.parse_args()
+
+    if not app_module.DEPENDENCIES_LOADED:
+        print('Error: las dependencias de app.py no están instaladas', file=sys.stderr)
+        return 2
+
+    recording = load_recording(args.recording)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+
+    results = []
+    measured_fixed = set()
+    for size in sizes:
+        window = build_window(recording, size)
+        for stage in stages:
+            fixed = stage in FIXED_SIZE_STAGES
+            if fixed:
+                if stage in measured_fixed:
+                    continue
+                measured_fixed.add(stage)
+            stage_size = FIXED_SIZE_STAGES[stage] if fixed else size
+            cases = bench_stage(stage, build_window(recording, stage_size) if fixed else window)
+            if cases is None:
+                print(f'   {stage:<28} {stage_size:>7} velas: omitido (dependencia no disponible)', file=sys.stderr)
+                results.append({'stage': stage, 'name': stage, 'size': stage_size, 'skipped': True})
+                continue
+            for name, func in cases:
+                func()  # calentamiento
+                summary = summarize(time_call(func, args.repeat, args.max_seconds))
+                results.append({'stage': stage, 'name': name, 'size': stage_size, 'fixed_size': fixed, **summary})
+                print(f'   {name:<28} {stage_size:>7} velas: mediana {summary["median"] * 1000:10.2f} ms '
+                      f'({summary["runs"]} ejecuciones){" (tamaño fijo)" if fixed else ""}', file=sys.stderr)
+
+    report = {'environment': environment_info(), 'results': results}
+    over_budget = False
+    if args.cold_start:
+        report['cold_start'] = {mode: measure_cold_start(mode) for mode in ('background', 'lazy', 'eager')}
+        default_mode = report['cold_start']['background']
+        if default_mode is not None:
+            over_budget = default_mode['first_ping_seconds'] > args.cold_start_budget
+            print(f'   Arranque en frío: primer /ping en {default_mode["first_ping_seconds"]:.3f}s '
+                  f'(presupuesto {args.cold_start_budget:.3f}s)', file=sys.stderr)
+        report['cold_start_budget_seconds'] = args.cold_start_budget
+        report['cold_start_over_budget'] = over_budget
+
+    regressions = []
+    if args.compare:
+        regressions = compare_results([r for r in results if not r.get('skipped')], args.compare, args.threshold)
+        report['regressions'] = [(r['name'], r['size'], r['ratio']) for r in regressions]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f'Resultados guardados en {args.output}', file=sys.stderr)
+    else:
+        print(output)
+
+    if regressions:
+        print(f'❌ {len(regressions)} regresiones por encima de x{args.threshold}', file=sys.stderr)
+        for r in regressions:
+            print(f'   {r["name"]} ({r["size"]} velas): x{r["ratio"]}', file=sys.stderr)
+        return 1
+    if over_budget:
+        print('❌ El arranque en frío supera el presupuesto', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
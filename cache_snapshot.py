@@ -0,0 +1,146 @@
+"""
+Instantáneas en disco de la caché de velas y de imágenes para reinicios en caliente
+Railway reinicia el proceso en cada despliegue y tras un fallo; al arrancar se restauran
+las ventanas guardadas (marcadas como stale, así que se refrescan en segundo plano una
+sola vez por clave) en lugar de que todas las primeras peticiones vayan a OKX a la vez.
+
+Formato del archivo (compacto y sin pickle):
+    MAGIC | longitud de la cabecera (4 bytes, big endian) | cabecera JSON comprimida con zlib | imágenes
+La cabecera guarda las ventanas de velas y, para cada imagen, su clave, offset y longitud.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from candle_cache import bar_offset, bar_seconds, window_fingerprint
+
+MAGIC = b'OKXSNAP1'
+
+
+def save_snapshot(path, candle_cache, render_cache=None):
+    """Escribe la instantánea de forma atómica (archivo temporal + rename); devuelve bytes escritos"""
+    candles = [
+        {'symbol': symbol, 'bar': bar, 'fetched_at': fetched_at, 'data': data}
+        for symbol, bar, data, fetched_at in candle_cache.export()
+    ]
+    images = []
+    blobs = []
+    offset = 0
+    for key, value in (render_cache.items() if render_cache is not None else []):
+        images.append({'key': list(key), 'offset': offset, 'length': len(value)})
+        blobs.append(value)
+        offset += len(value)
+
+    header = zlib.compress(json.dumps({
+        'saved_at': time.time(),
+        'candles': candles,
+        'images': images,
+    }, separators=(',', ':')).encode())
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('>I', len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(MAGIC) + 4 + len(header) + offset
+
+
+def _window_is_valid(symbol, bar, data, fetched_at, now, max_age):
+    """Valida una ventana contra los límites de vela: timestamps alineados y no demasiado antigua"""
+    if not data or not isinstance(data, list):
+        return False
+    bar_ms = bar_seconds(bar) * 1000
+    try:
+        timestamps = [int(candle[0]) for candle in data]
+    except (TypeError, ValueError, IndexError):
+        return False
+    offset_ms = bar_offset(bar) * 1000
+    if any((ts - offset_ms) % bar_ms for ts in timestamps):
+        return False
+    latest_open = max(timestamps) / 1000
+    # La última vela no puede ser del futuro ni tener más de `max_age` segundos desde su cierre
+    if latest_open > now + bar_seconds(bar):
+        return False
+    return now - (latest_open + bar_seconds(bar)) <= max_age and now - fetched_at <= max_age
+
+
+def load_snapshot(path, candle_cache, render_cache=None, max_age=3600.0):
+    """Restaura la instantánea si existe y es válida; devuelve (velas, imágenes) restauradas"""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            print(f"Instantánea de caché ignorada (formato desconocido): {path}")
+            return 0, 0
+        (header_length,) = struct.unpack('>I', f.read(4))
+        header = json.loads(zlib.decompress(f.read(header_length)))
+        blobs_start = f.tell()
+
+        now = time.time()
+        fingerprints = set()
+        restored_candles = 0
+        for entry in header.get('candles', []):
+            symbol, bar, data, fetched_at = entry['symbol'], entry['bar'], entry['data'], entry['fetched_at']
+            if not _window_is_valid(symbol, bar, data, fetched_at, now, max_age):
+                continue
+            candle_cache.restore(symbol, bar, data, fetched_at)
+            fingerprints.add((symbol, bar, window_fingerprint(data)))
+            restored_candles += 1
+
+        restored_images = 0
+        if render_cache is not None:
+            for image in header.get('images', []):
+                key = tuple(image['key'])
+                # Solo imágenes renderizadas con una ventana que se acaba de restaurar
+                # (clave: renderer, symbol, bar, fingerprint, ...)
+                if len(key) < 4 or (key[1], key[2], key[3]) not in fingerprints:
+                    continue
+                f.seek(blobs_start + image['offset'])
+                value = f.read(image['length'])
+                if len(value) == image['length']:
+                    render_cache.put(key, value)
+                    restored_images += 1
+    return restored_candles, restored_images
+
+
+class SnapshotWriter:
+    """Hilo que guarda la instantánea cada `interval` segundos (y al terminar el proceso)"""
+
+    def __init__(self, path, candle_cache, render_cache=None, interval=60.0):
+        self.path = path
+        self.candle_cache = candle_cache
+        self.render_cache = render_cache
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self):
+        try:
+            return save_snapshot(self.path, self.candle_cache, self.render_cache)
+        except Exception as e:
+            print(f"Error guardando instantánea de caché: {e}")
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='okx-cache-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, save=True):
+        self._stop.set()
+        if save:
+            self.save()
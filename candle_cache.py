@@ -0,0 +1,262 @@
+"""
+Caché de velas con stale-while-revalidate y circuit breaker para la API de OKX
+- Si la ventana en caché es reciente se sirve directamente.
+- Si está vencida se sirve igualmente (marcada como stale) y se refresca en segundo plano.
+- Si OKX falla repetidamente el circuito se abre: no se consulta OKX durante un tiempo
+  y se sirve la última ventana buena conocida, sin esperar al timeout en cada petición.
+"""
+
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from metrics import CACHE_HITS, CACHE_MISSES, STALE_SERVED, UPSTREAM_CIRCUIT_OPEN
+
+# Duración de cada intervalo de OKX en segundos
+BAR_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+    '1H': 3600, '2H': 7200, '4H': 14400, '6H': 21600, '12H': 43200,
+    '1D': 86400, '1W': 604800,
+}
+
+
+# OKX abre las velas de 6H o más en hora de Hong Kong (UTC+8): las de 6H, 12H y 1D a partir de
+# las 16:00 UTC y las de 1W el lunes a las 00:00 UTC+8 (domingo 16:00 UTC; el epoch fue jueves)
+BAR_OFFSETS = {'6H': 16 * 3600, '12H': 16 * 3600, '1D': 16 * 3600, '1W': 3 * 86400 + 16 * 3600}
+
+
+def bar_seconds(bar):
+    """Duración en segundos de un intervalo de OKX (5m por defecto si no se reconoce)"""
+    return BAR_SECONDS.get(bar, 300)
+
+
+def bar_offset(bar):
+    """Desfase en segundos respecto al epoch de las aperturas de vela de `bar` en OKX"""
+    return BAR_OFFSETS.get(bar, 0)
+
+
+def next_bar_close(bar, now=None):
+    """Timestamp (epoch en segundos) del próximo cierre de vela para `bar`"""
+    now = time.time() if now is None else now
+    seconds = bar_seconds(bar)
+    offset = bar_offset(bar)
+    return (int(now - offset) // seconds + 1) * seconds + offset
+
+
+def window_fingerprint(data):
+    """Huella de una ventana de velas: timestamp de la última vela + hash del contenido"""
+    if not data:
+        return 'empty'
+    latest = max(int(candle[0]) for candle in data)
+    digest = hashlib.blake2b(json.dumps(data, separators=(',', ':')).encode(), digest_size=8).hexdigest()
+    return f'{latest}-{digest}'
+
+
+class UpstreamError(Exception):
+    """Error al obtener datos de OKX; `reason` se usa como etiqueta de métricas"""
+
+    def __init__(self, reason, message=''):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Circuito clásico cerrado / abierto / semiabierto"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Indica si se puede llamar a OKX ahora (en semiabierto solo pasa una petición de prueba)"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+        UPSTREAM_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+        if self.state == self.OPEN:
+            UPSTREAM_CIRCUIT_OPEN.set(1)
+
+    def snapshot(self):
+        return {'state': self.state, 'failures': self.failures}
+
+
+class CandleCache:
+    """Ventanas de velas por (símbolo, intervalo) con refresco en segundo plano"""
+
+    def __init__(self, fetcher, fresh_ttl=10.0, max_stale=3600.0, max_entries=256, breaker=None, on_fetch=None):
+        self.fetcher = fetcher
+        # on_fetch(symbol, bar, data) tras cada respuesta buena de OKX (p. ej. guardar en disco)
+        self.on_fetch = on_fetch
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.breaker = breaker or CircuitBreaker()
+        self._entries = OrderedDict()  # (symbol, bar) -> (data, fetched_at)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _meta(self, fetched_at, stale, source):
+        return {
+            'as_of': datetime.fromtimestamp(fetched_at).isoformat() if fetched_at else None,
+            'stale': stale,
+            'source': source,
+            'circuit': self.breaker.state,
+        }
+
+    def _store(self, key, data, fetched_at=None):
+        with self._lock:
+            self._entries[key] = (data, fetched_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def peek(self, symbol, bar):
+        """Devuelve (data, fetched_at) sin consultar OKX, o (None, None)"""
+        with self._lock:
+            return self._entries.get((symbol, bar), (None, None))
+
+    def _fetch(self, key):
+        """Consulta OKX respetando el circuito; devuelve los datos o None si falla"""
+        if not self.breaker.allow():
+            return None
+        try:
+            data = self.fetcher(*key)
+        except UpstreamError:
+            self.breaker.record_failure()
+            return None
+        except Exception as e:
+            # Cualquier otro fallo también cuenta: si no, una prueba en semiabierto dejaría el circuito bloqueado
+            self.breaker.record_failure()
+            print(f"Error inesperado al consultar {key[0]} {key[1]}: {e}")
+            return None
+        self.breaker.record_success()
+        if data:
+            self._store(key, data)
+            if self.on_fetch is not None:
+                try:
+                    self.on_fetch(*key, data)
+                except Exception as e:
+                    print(f"Error en on_fetch de {key[0]} {key[1]}: {e}")
+        return data
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._fetch(key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f'okx-refresh-{key[0]}-{key[1]}', daemon=True).start()
+
+    def get(self, symbol, bar):
+        """Devuelve (data, meta). `data` es [] si no hay datos ni en OKX ni en caché"""
+        key = (symbol, bar)
+        data, fetched_at = self.peek(symbol, bar)
+
+        if data is not None:
+            age = time.time() - fetched_at
+            if age < self.fresh_ttl:
+                CACHE_HITS.inc(cache='candles')
+                return data, self._meta(fetched_at, False, 'cache')
+            if age < self.max_stale:
+                # Stale-while-revalidate: se responde ya y se refresca en segundo plano
+                CACHE_HITS.inc(cache='candles')
+                STALE_SERVED.inc()
+                self._refresh_in_background(key)
+                return data, self._meta(fetched_at, True, 'cache')
+
+        CACHE_MISSES.inc(cache='candles')
+        fresh = self._fetch(key)
+        if fresh:
+            return fresh, self._meta(time.time(), False, 'okx')
+
+        # Última ventana buena conocida, aunque sea más antigua que max_stale
+        data, fetched_at = self.peek(symbol, bar)
+        if data:
+            STALE_SERVED.inc()
+            return data, self._meta(fetched_at, True, 'last_known_good')
+        return [], self._meta(None, False, 'none')
+
+    def get_many(self, keys):
+        """get() de varias ventanas [(symbol, bar), ...] -> {(symbol, bar): (data, meta)}
+        Las que habría que esperar a OKX (sin ventana o más antigua que max_stale) se piden a la
+        vez en hilos, así que una petición en frío tarda un viaje a OKX y no uno por ventana."""
+        now = time.time()
+        cold = []
+        for key in keys:
+            data, fetched_at = self.peek(*key)
+            if data is None or now - fetched_at >= self.max_stale:
+                cold.append(key)
+        results = {}
+        if len(cold) > 1:
+            with ThreadPoolExecutor(max_workers=len(cold), thread_name_prefix='okx-fetch') as pool:
+                # Cada hilo con una copia del contexto: la etapa 'upstream' cuenta en la traza de la petición
+                futures = {key: pool.submit(contextvars.copy_context().run, self.get, *key) for key in cold}
+                results = {key: future.result() for key, future in futures.items()}
+        return {key: results[key] if key in results else self.get(*key) for key in keys}
+
+    def refresh(self, symbol, bar):
+        """Consulta OKX ahora aunque la ventana en caché sea reciente; devuelve los datos o None"""
+        return self._fetch((symbol, bar))
+
+    def export(self):
+        """Lista de (symbol, bar, data, fetched_at) para guardar en disco"""
+        with self._lock:
+            return [(key[0], key[1], data, fetched_at) for key, (data, fetched_at) in self._entries.items()]
+
+    def restore(self, symbol, bar, data, fetched_at):
+        """Restaura una ventana guardada sin pisar una más reciente ya presente"""
+        current, current_fetched_at = self.peek(symbol, bar)
+        if current is not None and current_fetched_at >= fetched_at:
+            return
+        self._store((symbol, bar), data, fetched_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'refreshing': len(self._refreshing),
+                'circuit': self.breaker.snapshot(),
+            }
@@ -0,0 +1,83 @@
+"""
+Limpieza y validación vectorizada de velas
+Sustituye a `clean_numeric_value` aplicado celda a celda con `df[col].apply(...)`: las
+columnas se convierten de una vez con pandas (parser en C) y las reglas de las cadenas
+largas (varios números concatenados -> el primero) se aplican con operaciones de cadena
+sobre la columna. Después se comprueban los invariantes OHLC sobre todas las velas a la
+vez y se devuelven las descartadas con el motivo.
+Importa numpy y pandas, así que app.py lo carga de forma diferida.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_string_dtype
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+# A partir de esta longitud una cadena se trata como varios números pegados
+LONG_STRING = 20
+FIRST_NUMBER = r'(\d+\.?\d*)'
+
+# Motivos de descarte, en el orden en que se comprueban (cada vela se cuenta en el primero)
+REJECT_REASONS = ('invalid_number', 'non_positive_price', 'high_below_body', 'low_above_body',
+                  'negative_volume')
+
+
+def clean_numeric(values):
+    """Columna (Series o lista) -> Series float con NaN donde el valor no es un número
+    Mismo criterio que el antiguo `clean_numeric_value`: los números se respetan, las cadenas
+    de más de 20 caracteres se quedan con el primer número que contienen y el resto se
+    convierte directamente."""
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if is_numeric_dtype(series):
+        return series.astype(float)
+
+    lengths = series.str.len() if series.dtype == object or is_string_dtype(series) else pd.Series(np.nan, index=series.index)
+    is_long = lengths > LONG_STRING
+    if not is_long.any():
+        try:
+            # Caso habitual (todo son números bien formados): conversión directa de numpy
+            return pd.Series(np.asarray(series, dtype=float), index=series.index)
+        except (TypeError, ValueError):
+            return pd.to_numeric(series, errors='coerce').astype(float)
+    result = pd.to_numeric(series.where(~is_long), errors='coerce').astype(float)
+    first_numbers = series[is_long].str.extract(FIRST_NUMBER, expand=False)
+    result[is_long] = pd.to_numeric(first_numbers, errors='coerce')
+    return result
+
+
+def reject_reasons(df, volume_column='volume'):
+    """Array con el motivo de descarte de cada vela ('' si es válida)"""
+    opens, highs, lows, closes = (df[column].to_numpy(dtype=float) for column in PRICE_COLUMNS)
+    prices = np.column_stack([opens, highs, lows, closes])
+    volumes = df[volume_column].to_numpy(dtype=float) if volume_column in df else np.zeros(len(df))
+    checks = [
+        np.isnan(prices).any(axis=1) | np.isnan(volumes),
+        (prices <= 0).any(axis=1),
+        highs < np.maximum(opens, closes),
+        lows > np.minimum(opens, closes),
+        volumes < 0,
+    ]
+    return np.select(checks, REJECT_REASONS, default='')
+
+
+def clean_candles(df, numeric_columns=PRICE_COLUMNS + ('volume',)):
+    """Convierte las columnas numéricas y separa las velas que no cumplen los invariantes
+    (low <= open/close <= high, precios positivos, volumen no negativo)
+    Devuelve (velas válidas, velas descartadas con la columna `reason`)."""
+    df = df.copy()
+    for column in numeric_columns:
+        if column in df:
+            df[column] = clean_numeric(df[column])
+    reasons = reject_reasons(df)
+    rejected = reasons != ''
+    if not rejected.any():
+        return df, df.iloc[:0].assign(reason=pd.Series(dtype=object))
+    return df[~rejected], df[rejected].assign(reason=reasons[rejected])
+
+
+def reject_summary(rejects):
+    """{motivo: número de velas} de las velas descartadas"""
+    if rejects is None or rejects.empty:
+        return {}
+    return {reason: int(count) for reason, count in rejects['reason'].value_counts().items()}
@@ -0,0 +1,332 @@
+"""
+Huecos en las series del almacén de velas: detección, informe de completitud y reparación
+OKX a veces devuelve ventanas con velas de menos y los indicadores se calculan sin notarlo.
+- find_gaps: huecos de una serie con numpy (separación entre velas mayor que el intervalo).
+- completeness_report: velas esperadas / presentes / huecos por día de un rango.
+- GapRepairer: hilo que pide a /history-candles solo los rangos que faltan (como mucho 100
+  velas por petición, con pausa entre peticiones) y los guarda en el almacén. Un hueco que
+  OKX sigue devolviendo vacío tras varios intentos se marca como no reparable y no se vuelve a
+  pedir; los errores de OKX no cuentan como intento, solo retrasan el siguiente.
+  Con varios workers solo uno hace la búsqueda periódica (el que tiene el flock de `lock_path`);
+  los huecos encolados a mano se reparan en el worker que recibió la petición.
+numpy se importa en el primer uso para no retrasar el arranque de app.py.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from candle_cache import BAR_SECONDS, UpstreamError
+from lazy_imports import lazy_import
+from metrics import GAP_REPAIRS, GAP_CANDLES_FILLED
+
+try:
+    import fcntl
+except ImportError:  # Windows: cada proceso busca huecos por su cuenta
+    fcntl = None
+
+np = lazy_import('numpy')
+
+DAY_MS = 86_400_000
+
+# Velas por petición de /api/v5/market/history-candles
+OKX_HISTORY_LIMIT = 100
+
+
+def bar_ms(bar):
+    return BAR_SECONDS[bar] * 1000
+
+
+def _align_up(value, step, phase):
+    """Primer instante >= value en la rejilla phase + k * step"""
+    return phase + -(-(value - phase) // step) * step
+
+
+def find_gaps(timestamps, step_ms, start=None, end=None):
+    """Huecos de una serie como array (primera vela que falta, última que falta, número)
+
+    Las velas se suponen en la rejilla de la primera vela (las de 1D de OKX no empiezan a las
+    00:00 UTC). Con `start`/`end` (ms, end no incluido) también cuentan los huecos al
+    principio y al final del rango."""
+    ts = np.unique(np.asarray(timestamps, dtype=np.int64))
+    if start is not None:
+        ts = ts[ts >= start]
+    if end is not None:
+        ts = ts[ts < end]
+    if not len(ts):
+        if start is None or end is None:
+            return np.empty((0, 3), dtype=np.int64)
+        first = _align_up(start, step_ms, start)
+        count = (end - first + step_ms - 1) // step_ms
+        return np.array([[first, first + (count - 1) * step_ms, count]], dtype=np.int64) if count > 0 \
+            else np.empty((0, 3), dtype=np.int64)
+
+    phase = int(ts[0] % step_ms)
+    bounds = [ts]
+    if start is not None:
+        # Vela virtual justo antes del rango
+        bounds.insert(0, [_align_up(start, step_ms, phase) - step_ms])
+    if end is not None:
+        # Vela virtual justo después del rango
+        bounds.append([_align_up(end, step_ms, phase)])
+    bounds = np.concatenate(bounds).astype(np.int64)
+
+    diffs = np.diff(bounds)
+    holes = np.flatnonzero(diffs > step_ms)
+    first_missing = bounds[holes] + step_ms
+    last_missing = bounds[holes + 1] - step_ms
+    missing = diffs[holes] // step_ms - 1
+    keep = missing > 0
+    return np.column_stack([first_missing[keep], last_missing[keep], missing[keep]])
+
+
+def _day(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def completeness_report(timestamps, bar, start=None, end=None, now=None):
+    """Velas esperadas, presentes y huecos del rango, en total y por día (UTC)
+
+    Sin `start` el rango empieza en la primera vela guardada; sin `end` llega hasta la última
+    vela cerrada, así que un corte de escritura reciente también aparece como hueco."""
+    step = bar_ms(bar)
+    ts = np.unique(np.asarray(timestamps, dtype=np.int64))
+    if start is not None:
+        ts = ts[ts >= start]
+    if end is not None:
+        ts = ts[ts < end]
+    if not len(ts) and (start is None or end is None):
+        return {'bar': bar, 'start': start, 'end': end, 'expected': 0, 'present': 0, 'missing': 0,
+                'completeness': None, 'days': [], 'gaps': []}
+
+    phase = int(ts[0] % step) if len(ts) else int(start % step)
+    if start is None:
+        start = int(ts[0])
+    if end is None:
+        now_ms = int((time.time() if now is None else now) * 1000)
+        # Apertura de la vela que se está formando (no incluida)
+        end = _align_up(now_ms - step + 1, step, phase)
+    gaps = find_gaps(ts, step, start, end)
+
+    # Esperadas por día: posiciones de la rejilla dentro de [día, día siguiente) ∩ [start, end)
+    first_day, last_day = start // DAY_MS, (end - 1) // DAY_MS
+    days = np.arange(first_day, last_day + 1, dtype=np.int64)
+    lows = np.maximum(days * DAY_MS, start)
+    highs = np.minimum((days + 1) * DAY_MS, end)
+    expected = np.array([(_align_up(h, step, phase) - _align_up(l, step, phase)) // step
+                         for l, h in zip(lows, highs)], dtype=np.int64)
+    present = np.bincount((ts // DAY_MS - first_day).astype(np.int64), minlength=len(days))[:len(days)]
+
+    day_gaps = {}
+    for first, last, _ in gaps.tolist():
+        # Un hueco que cruza medianoche se reparte entre los días
+        position = first
+        while position <= last:
+            day_end = (position // DAY_MS + 1) * DAY_MS
+            chunk_last = min(last, _align_up(day_end, step, phase) - step)
+            day_gaps.setdefault(position // DAY_MS, []).append(
+                [position, chunk_last, (chunk_last - position) // step + 1])
+            position = chunk_last + step
+
+    report_days = []
+    for day, day_expected, day_present in zip(days.tolist(), expected.tolist(), present.tolist()):
+        report_days.append({
+            'day': _day(day * DAY_MS),
+            'expected': day_expected,
+            'present': day_present,
+            'missing': max(0, day_expected - day_present),
+            'completeness': round(day_present / day_expected, 4) if day_expected else None,
+            'gaps': day_gaps.get(day, []),
+        })
+    total_expected = int(expected.sum())
+    total_present = int(len(ts))
+    return {
+        'bar': bar,
+        'start': int(start),
+        'end': int(end),
+        'expected': total_expected,
+        'present': total_present,
+        'missing': max(0, total_expected - total_present),
+        'completeness': round(total_present / total_expected, 4) if total_expected else None,
+        'days': report_days,
+        'gaps': gaps.tolist(),
+    }
+
+
+def gap_requests(first_missing, last_missing, step_ms, limit=OKX_HISTORY_LIMIT):
+    """Parámetros (after, before) de /history-candles que cubren un hueco con el mínimo de
+    peticiones: `after` devuelve velas anteriores y `before` posteriores (ambos excluidos)"""
+    requests = []
+    chunk_last = last_missing
+    while chunk_last >= first_missing:
+        chunk_first = max(first_missing, chunk_last - (limit - 1) * step_ms)
+        requests.append((chunk_last + step_ms, chunk_first - step_ms))
+        chunk_last = chunk_first - step_ms
+    return requests
+
+
+class GapRepairer:
+    """Cola de huecos a reparar y el hilo que los pide a OKX
+
+    `fetch_history(symbol, bar, after, before)` devuelve las filas de OKX de ese rango y puede
+    lanzar UpstreamError; `breaker` (opcional) es el CircuitBreaker de la caché de velas."""
+
+    def __init__(self, store, fetch_history, request_interval=0.2, max_attempts=3, breaker=None,
+                 scan_interval=0, scan_days=2, lock_path=None):
+        self.store = store
+        self.fetch_history = fetch_history
+        self.request_interval = request_interval
+        self.max_attempts = max_attempts
+        self.breaker = breaker
+        self.scan_interval = scan_interval
+        self.scan_days = scan_days
+        # Espera tras un error de OKX: lo que tarda el circuito en dejar pasar otra petición
+        self.error_backoff = breaker.reset_timeout if breaker is not None else 30.0
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._queue = OrderedDict()  # (symbol, bar, first, last) -> intentos
+        self._unfillable = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counts = {'requests': 0, 'filled': 0, 'empty': 0, 'errors': 0}
+
+    def schedule(self, symbol, bar, gaps):
+        """Encola los huecos (filas de find_gaps) que no estén ya en cola ni marcados
+        como no reparables; devuelve cuántos se encolaron"""
+        scheduled = 0
+        with self._lock:
+            for first, last, _ in np.asarray(gaps, dtype=np.int64).reshape(-1, 3).tolist():
+                key = (symbol, bar, first, last)
+                if key in self._queue or key in self._unfillable:
+                    continue
+                self._queue[key] = 0
+                scheduled += 1
+        if scheduled:
+            self._wakeup.set()
+        return scheduled
+
+    def scan(self, now=None):
+        """Busca huecos en los últimos `scan_days` días de cada serie guardada y los encola"""
+        now_ms = int((time.time() if now is None else now) * 1000)
+        start = now_ms - self.scan_days * DAY_MS
+        scheduled = 0
+        for series in self.store.series():
+            symbol, _, bar = series.rpartition('/')
+            if bar not in BAR_SECONDS:
+                continue
+            timestamps = [int(row[0]) for row in self.store.query(symbol, bar, start)]
+            if timestamps:
+                report = completeness_report(timestamps, bar, timestamps[0], now=now)
+                scheduled += self.schedule(symbol, bar, report['gaps'])
+        return scheduled
+
+    def _hold_scan_lock(self):
+        """Indica si este proceso hace la búsqueda periódica: el primero que toma el flock de
+        `lock_path` lo mantiene; si ese worker muere el lock se libera y lo toma otro"""
+        if self._lock_file is not None or self.lock_path is None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def repair(self, symbol, bar, first, last):
+        """Pide un hueco a OKX y lo guarda; devuelve cuántas velas se añadieron"""
+        added = 0
+        for after, before in gap_requests(first, last, bar_ms(bar)):
+            if self.breaker is not None and not self.breaker.allow():
+                raise UpstreamError('circuit_open')
+            self.counts['requests'] += 1
+            try:
+                rows = self.fetch_history(symbol, bar, after, before)
+            except Exception:
+                # Cualquier fallo cierra la prueba del semiabierto (el circuito es el de la caché de velas)
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+            if self.breaker is not None:
+                self.breaker.record_success()
+            added += self.store.write(symbol, bar, rows)
+            if self._stop.wait(self.request_interval):
+                break
+        return added
+
+    def _next(self):
+        with self._lock:
+            if not self._queue:
+                return None, 0
+            return self._queue.popitem(last=False)
+
+    def _run(self):
+        next_scan = time.monotonic()
+        while not self._stop.is_set():
+            if self.scan_interval and time.monotonic() >= next_scan:
+                try:
+                    if self._hold_scan_lock():
+                        self.scan()
+                except Exception as e:
+                    print(f"Error buscando huecos de velas: {e}")
+                next_scan = time.monotonic() + self.scan_interval
+
+            key, attempts = self._next()
+            if key is None:
+                timeout = max(0.0, next_scan - time.monotonic()) if self.scan_interval else None
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue
+            try:
+                added = self.repair(*key)
+            except Exception as e:
+                # OKX caído o circuito abierto: el hueco vuelve a la cola sin gastar un intento
+                self.counts['errors'] += 1
+                GAP_REPAIRS.inc(result='error')
+                print(f"Error reparando hueco {key}: {e}")
+                with self._lock:
+                    self._queue[key] = attempts
+                self._stop.wait(self.error_backoff)
+                continue
+            if added:
+                self.counts['filled'] += added
+                GAP_REPAIRS.inc(result='filled')
+                GAP_CANDLES_FILLED.inc(added)
+                continue
+            self.counts['empty'] += 1
+            GAP_REPAIRS.inc(result='empty')
+            attempts += 1
+            with self._lock:
+                if attempts >= self.max_attempts:
+                    # OKX no tiene esas velas (p. ej. sin operaciones): no se vuelve a pedir
+                    self._unfillable.add(key)
+                else:
+                    self._queue[key] = attempts
+            self._stop.wait(self.request_interval)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='okx-gap-repair', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counts,
+                'running': self._thread is not None and self._thread.is_alive(),
+                'scanner': self._lock_file is not None or self.lock_path is None,
+                'queued': len(self._queue),
+                'unfillable': len(self._unfillable),
+                'scan_interval': self.scan_interval,
+            }
@@ -0,0 +1,290 @@
+"""
+Almacén local de velas para consultas de histórico (/api/history)
+Las velas cerradas se guardan por (símbolo, intervalo) en particiones de tiempo con las
+filas de OKX ordenadas por timestamp:
+
+    candle_store/BTC-USDT/5m/2025-07-27.json     (intervalos de menos de 1H: un día)
+    candle_store/BTC-USDT/1H/2025-07.json        (1H o más: un mes)
+    candle_store/manifest.json                   (min/max/número de velas por partición)
+
+Una consulta por rango busca en el manifiesto (búsqueda binaria sobre las claves de
+partición, que ordenan igual que el tiempo) solo las particiones que se solapan con el
+rango y, dentro de la primera y la última, corta con bisect sobre los timestamps. Las
+filas se generan partición a partición, así que un rango grande nunca está entero en
+memoria. Escribir es seguro entre procesos (flock sobre un archivo de bloqueo).
+
+Uso como script:
+    python candle_store.py import candles_BTC-USDT_2025-07-27.json --bar 5m
+    python candle_store.py stats
+"""
+
+import argparse
+import bisect
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from candle_cache import BAR_SECONDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo bloqueo dentro del proceso
+    fcntl = None
+
+MANIFEST_FILENAME = 'manifest.json'
+LOCK_FILENAME = '.lock'
+
+# Columnas de una fila de OKX (la novena, `confirm`, solo se usa para descartar velas abiertas)
+FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'volume_currency', 'volume_currency_2')
+DEFAULT_FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+# Las semanas de OKX empiezan en lunes; el epoch fue jueves
+BUCKET_OFFSET_MS = {'1W': 4 * 86400 * 1000}
+
+# Último milisegundo representable por datetime (9999-12-31T23:59:59.999Z)
+MAX_TIME_MS = 253402300799999
+
+LEGACY_FILENAME = re.compile(r'candles_(?P<symbol>.+)_\d{4}-\d{2}-\d{2}\.json$')
+
+
+def parse_fields(value):
+    """'timestamp,close' -> ('timestamp', 'close'); lanza ValueError con un mensaje para el cliente"""
+    fields = tuple(f.strip() for f in (value or '').split(',') if f.strip()) or DEFAULT_FIELDS
+    if any(field not in FIELDS for field in fields):
+        raise ValueError(f"'fields' admite: {', '.join(FIELDS)}")
+    return fields
+
+
+def partition_key(ts_ms, bar):
+    """Partición de una vela: un día para intervalos de menos de 1H, un mes para el resto"""
+    moment = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return moment.strftime('%Y-%m-%d') if BAR_SECONDS.get(bar, 300) < 3600 else moment.strftime('%Y-%m')
+
+
+def parse_time_ms(value):
+    """Epoch en milisegundos o fecha/fecha-hora ISO (UTC si no lleva zona) -> epoch en ms"""
+    if value is None or value == '':
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        ms = int(value)
+    else:
+        try:
+            moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"fecha no válida: '{value}' (usa epoch en ms o ISO, p. ej. 2025-03-01)")
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        ms = int(moment.timestamp() * 1000)
+    # Fuera de este rango partition_key (datetime.fromtimestamp) fallaría a mitad de respuesta
+    if not 0 <= ms <= MAX_TIME_MS:
+        raise ValueError(f"fecha fuera de rango: '{value}' (entre 1970 y el año 9999)")
+    return ms
+
+
+def is_closed(row):
+    return len(row) < 9 or str(row[8]) == '1'
+
+
+def aggregate(rows, bar):
+    """Agrupa filas ordenadas (las de CandleStore.query) en velas de `bar`, sin cargar el rango
+    Genera filas con el mismo formato que las de OKX."""
+    bucket_ms = BAR_SECONDS[bar] * 1000
+    offset = BUCKET_OFFSET_MS.get(bar, 0)
+    current = None
+    for row in rows:
+        ts = int(row[0])
+        start = (ts - offset) // bucket_ms * bucket_ms + offset
+        if current is not None and current[0] == start:
+            current[2] = max(current[2], float(row[2]))
+            current[3] = min(current[3], float(row[3]))
+            current[4] = float(row[4])
+            for i in (5, 6, 7):
+                current[i] += float(row[i])
+            continue
+        if current is not None:
+            yield current
+        current = [start, float(row[1]), float(row[2]), float(row[3]), float(row[4]),
+                   float(row[5]), float(row[6]), float(row[7])]
+    if current is not None:
+        yield current
+
+
+def select_fields(rows, fields):
+    """Filas -> listas con solo `fields`, con timestamp entero y el resto float"""
+    indices = [FIELDS.index(field) for field in fields]
+    for row in rows:
+        yield [int(row[i]) if i == 0 else float(row[i]) for i in indices]
+
+
+class CandleStore:
+    """Particiones de velas cerradas en disco con un manifiesto de rangos"""
+
+    def __init__(self, directory='candle_store'):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest = {}
+        self._manifest_mtime = None
+        self.writes = 0
+
+    # --- Rutas y manifiesto -----------------------------------------------------------
+
+    def _series_dir(self, symbol, bar):
+        return os.path.join(self.directory, symbol, bar)
+
+    def _partition_path(self, symbol, bar, key):
+        return os.path.join(self._series_dir(symbol, bar), f'{key}.json')
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILENAME)
+
+    def _load_manifest(self):
+        """Relee el manifiesto si otro proceso lo ha cambiado"""
+        path = self._manifest_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest, self._manifest_mtime = {}, None
+            return self._manifest
+        if mtime != self._manifest_mtime:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._manifest = json.load(f)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _write_json(self, path, value):
+        tmp_path = f'{path}.tmp.{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(self.directory, LOCK_FILENAME), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_partition(self, symbol, bar, key):
+        try:
+            with open(self._partition_path(symbol, bar, key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    # --- Escritura ----------------------------------------------------------------------
+
+    def write(self, symbol, bar, rows):
+        """Añade (o actualiza) velas cerradas; devuelve cuántas velas nuevas o cambiadas había
+        Solo se reescriben las particiones que cambian."""
+        groups = {}
+        for row in rows or []:
+            if is_closed(row):
+                groups.setdefault(partition_key(int(row[0]), bar), []).append(list(row))
+        if not groups:
+            return 0
+
+        changed_rows = 0
+        with self._write_lock():
+            manifest = self._load_manifest()
+            series = manifest.setdefault(f'{symbol}/{bar}', {})
+            for key, new_rows in groups.items():
+                existing = {int(row[0]): row for row in self._read_partition(symbol, bar, key)}
+                changed = [row for row in new_rows if existing.get(int(row[0])) != row]
+                if not changed:
+                    continue
+                for row in changed:
+                    existing[int(row[0])] = row
+                merged = [existing[ts] for ts in sorted(existing)]
+                os.makedirs(self._series_dir(symbol, bar), exist_ok=True)
+                self._write_json(self._partition_path(symbol, bar, key), merged)
+                series[key] = [int(merged[0][0]), int(merged[-1][0]), len(merged)]
+                changed_rows += len(changed)
+            if changed_rows:
+                manifest[f'{symbol}/{bar}'] = dict(sorted(series.items()))
+                self._write_json(self._manifest_path(), manifest)
+                self._manifest_mtime = os.stat(self._manifest_path()).st_mtime_ns
+                self.writes += 1
+        return changed_rows
+
+    def import_file(self, path, bar='5m', symbol=None):
+        """Importa un candles_<símbolo>_<fecha>.json de test.py; devuelve velas añadidas"""
+        if symbol is None:
+            match = LEGACY_FILENAME.search(os.path.basename(path))
+            if not match:
+                raise ValueError(f'no se puede deducir el símbolo de {path}; usa --symbol')
+            symbol = match.group('symbol')
+        with open(path, 'r', encoding='utf-8') as f:
+            return self.write(symbol, bar, json.load(f))
+
+    # --- Lectura ------------------------------------------------------------------------
+
+    def partitions(self, symbol, bar, start=None, end=None):
+        """Claves de partición que se solapan con [start, end) (en ms), en orden"""
+        with self._lock:
+            series = self._load_manifest().get(f'{symbol}/{bar}', {})
+        keys = list(series)
+        low = bisect.bisect_left(keys, partition_key(start, bar)) if start is not None else 0
+        high = bisect.bisect_right(keys, partition_key(end, bar)) if end is not None else len(keys)
+        return [
+            key for key in keys[low:high]
+            if (start is None or series[key][1] >= start) and (end is None or series[key][0] < end)
+        ]
+
+    def query(self, symbol, bar, start=None, end=None):
+        """Genera las filas de OKX con start <= timestamp < end, de la más antigua a la más reciente
+        Solo tiene en memoria una partición cada vez."""
+        for key in self.partitions(symbol, bar, start, end):
+            rows = self._read_partition(symbol, bar, key)
+            timestamps = [int(row[0]) for row in rows]
+            low = bisect.bisect_left(timestamps, start) if start is not None else 0
+            high = bisect.bisect_left(timestamps, end) if end is not None else len(rows)
+            yield from rows[low:high]
+
+    def series(self):
+        with self._lock:
+            return list(self._load_manifest())
+
+    def stats(self):
+        with self._lock:
+            manifest = self._load_manifest()
+        return {
+            'directory': self.directory,
+            'series': len(manifest),
+            'partitions': sum(len(series) for series in manifest.values()),
+            'candles': sum(entry[2] for series in manifest.values() for entry in series.values()),
+            'writes': self.writes,
+        }
+
+
+def main():
+    """Importa archivos antiguos o muestra el contenido del almacén"""
+    parser = argparse.ArgumentParser(description='Almacén local de velas')
+    parser.add_argument('--dir', default=os.environ.get('CANDLE_STORE_DIR') or 'candle_store')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help='Importa candles_<símbolo>_<fecha>.json')
+    import_parser.add_argument('files', nargs='+')
+    import_parser.add_argument('--bar', default='5m', help='Intervalo de las velas del archivo (5m en test.py)')
+    import_parser.add_argument('--symbol', help='Símbolo (por defecto se deduce del nombre del archivo)')
+    subparsers.add_parser('stats', help='Series, particiones y velas guardadas')
+    args = parser.parse_args()
+
+    store = CandleStore(args.dir)
+    if args.command == 'import':
+        for path in args.files:
+            added = store.import_file(path, args.bar, args.symbol)
+            print(f"{path}: {added} velas importadas")
+    print(json.dumps({**store.stats(), 'series_list': store.series()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Ventana de velas ordenada por tiempo sobre arrays de numpy
+Sustituye a `pd.concat` + `drop_duplicates` + `sort_values` + `tail(81)` al combinar las velas
+guardadas con las nuevas. Las dos entradas ya vienen ordenadas, así que:
+
+- si las velas nuevas son todas posteriores a la última guardada, se copian al final;
+- si se solapan con la cola (la vela abierta que cambia, una respuesta que repite velas),
+  solo se fusiona esa cola con searchsorted y la vela nueva gana en los timestamps repetidos.
+
+El coste de cada actualización depende de las velas nuevas y de la cola solapada, no del
+tamaño de la ventana. Los arrays se reservan con holgura: recortar al máximo solo mueve un
+índice y compactar o crecer ocurre de vez en cuando (coste amortizado constante).
+"""
+
+import numpy as np
+
+
+class CandleWindow:
+    """Velas (timestamp en ms + fila) en orden cronológico, con un máximo opcional de velas
+
+    Cada fila es un array de `width` valores del `dtype` indicado; con dtype=object se pueden
+    guardar las filas de OKX tal cual (cadenas)."""
+
+    def __init__(self, max_len=None, width=9, dtype=object, capacity=None):
+        self.max_len = max_len
+        self.width = width
+        capacity = capacity or max(16, 2 * (max_len or 128))
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((capacity, width), dtype=dtype)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def timestamps(self):
+        """Vista (sin copia) de los timestamps de la ventana"""
+        return self._ts[self._start:self._end]
+
+    @property
+    def values(self):
+        """Vista (sin copia) de las filas de la ventana"""
+        return self._values[self._start:self._end]
+
+    def rows(self):
+        """Filas como listas, de la más antigua a la más reciente"""
+        return self.values.tolist()
+
+    def _reserve(self, count):
+        """Deja sitio para `count` filas al final: compacta al principio o duplica los arrays"""
+        if self._end + count <= len(self._ts):
+            return
+        size = len(self)
+        capacity = len(self._ts)
+        while size + count > capacity:
+            capacity *= 2
+        if capacity != len(self._ts):
+            ts = np.empty(capacity, dtype=self._ts.dtype)
+            values = np.empty((capacity, self.width), dtype=self._values.dtype)
+        else:
+            ts, values = self._ts, self._values
+        ts[:size] = self._ts[self._start:self._end]
+        values[:size] = self._values[self._start:self._end]
+        self._ts, self._values = ts, values
+        self._start, self._end = 0, size
+
+    def _append(self, timestamps, values):
+        self._reserve(len(timestamps))
+        self._ts[self._end:self._end + len(timestamps)] = timestamps
+        self._values[self._end:self._end + len(timestamps)] = values
+        self._end += len(timestamps)
+
+    def update(self, timestamps, values):
+        """Fusiona velas nuevas (en cualquier orden); en un timestamp repetido gana la nueva
+        Devuelve cuántas velas tienen un timestamp que no estaba en la ventana."""
+        new_ts = np.asarray(timestamps, dtype=np.int64)
+        if not len(new_ts):
+            return 0
+        new_values = np.empty((len(new_ts), self.width), dtype=self._values.dtype)
+        new_values[:] = values
+
+        # OKX devuelve de la más reciente a la más antigua: basta con darles la vuelta
+        if len(new_ts) > 1 and (np.diff(new_ts) < 0).all():
+            new_ts, new_values = new_ts[::-1], new_values[::-1]
+        elif len(new_ts) > 1 and (np.diff(new_ts) <= 0).any():
+            order = np.argsort(new_ts, kind='stable')
+            new_ts, new_values = new_ts[order], new_values[order]
+            # Timestamps repetidos dentro de las nuevas: se queda la última
+            last = np.append(new_ts[1:] != new_ts[:-1], True)
+            new_ts, new_values = new_ts[last], new_values[last]
+
+        current = self.timestamps
+        position = int(np.searchsorted(current, new_ts[0]))
+        added = len(new_ts)
+        if position < len(current):
+            # Cola solapada: las velas guardadas que no se sustituyen se intercalan con las nuevas
+            tail_ts = current[position:]
+            tail_values = self.values[position:]
+            index = np.searchsorted(new_ts, tail_ts)
+            replaced = (index < len(new_ts)) & (new_ts[np.minimum(index, len(new_ts) - 1)] == tail_ts)
+            added -= int(replaced.sum())
+            kept_ts, kept_values = tail_ts[~replaced], tail_values[~replaced]
+            insert_at = np.searchsorted(new_ts, kept_ts)
+            new_ts = np.insert(new_ts, insert_at, kept_ts)
+            new_values = np.insert(new_values, insert_at, kept_values, axis=0)
+            self._end = self._start + position
+        self._append(new_ts, new_values)
+
+        if self.max_len is not None and len(self) > self.max_len:
+            self._start = self._end - self.max_len
+        return added
+
+    def update_rows(self, rows):
+        """update() con filas de OKX ([ts, o, h, l, c, ...], timestamp en la primera columna)"""
+        if not rows:
+            return 0
+        return self.update([int(row[0]) for row in rows], [list(row)[:self.width] for row in rows])
+
+    @classmethod
+    def from_rows(cls, rows, max_len=None, width=9, dtype=object):
+        window = cls(max_len=max_len, width=width, dtype=dtype, capacity=max(16, 2 * max(len(rows), max_len or 0)))
+        window.update_rows(rows)
+        return window
@@ -14,14 +14,23 @@ import base64
 import hashlib
 from datetime import datetime, timedelta
 import os
+import sys
 import json
 import io
 import base64
 from env_config import OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE
 
+# Módulos compartidos con app.py (debug_capture, candle_cleaning, mpl_candles, candle_window):
+# están en la raíz del repositorio, un nivel por encima de cleanup/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from debug_capture import capture_from_env
+
 app = Flask(__name__)
 CORS(app)  # Permitir CORS para n8n
 
+# Capturas de debug en segundo plano (DEBUG_CAPTURE_* en el entorno)
+DEBUG_CAPTURE = capture_from_env('debug_api')
+
 def get_timestamp():
     """Genera timestamp en formato ISO8601 UTC"""
     return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
@@ -144,10 +153,9 @@ def create_candlestick_chart(df, symbol, candles_count):
     return img_bytes
 
 def save_debug_info(api_response, processed_data, symbol, candles_count):
-    """Guarda información de debug"""
-    debug_filename = f"debug_api_{symbol}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    
-    debug_info = {
+    """Encola la información de debug para el escritor en segundo plano (ver debug_capture.py)
+    Devuelve el id de la captura, o None si se descartó por muestreo o por cola llena"""
+    return DEBUG_CAPTURE.capture({
         "timestamp": datetime.now().isoformat(),
         "symbol": symbol,
         "candles_count": candles_count,
@@ -159,15 +167,7 @@ def save_debug_info(api_response, processed_data, symbol, candles_count):
             "candles_used_for_chart": len(processed_data) if processed_data else 0,
             "data": processed_data
         }
-    }
-    
-    try:
-        with open(debug_filename, 'w', encoding='utf-8') as f:
-            json.dump(debug_info, f, indent=2, ensure_ascii=False, default=str)
-        return debug_filename
-    except Exception as e:
-        print(f"Error guardando debug: {e}")
-        return None
+    })
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -8,25 +8,32 @@ from flask import Flask, jsonify, send_file, request
 from flask_cors import CORS
 import requests
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from mplfinance.original_flavor import candlestick_ohlc
 import time
 import hmac
 import base64
 import hashlib
 from datetime import datetime, timedelta
 import os
+import sys
 import json
 import io
 import base64
-import re
 from functools import wraps
 from env_config import OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE
 
+# Módulos compartidos con app.py (debug_capture, candle_cleaning, mpl_candles, candle_window):
+# están en la raíz del repositorio, un nivel por encima de cleanup/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from debug_capture import capture_from_env
+from candle_cleaning import clean_candles, reject_summary
+from mpl_candles import render_candles
+
 app = Flask(__name__)
 CORS(app)  # Permitir CORS para n8n
 
+# Capturas de debug en segundo plano (DEBUG_CAPTURE_* en el entorno)
+DEBUG_CAPTURE = capture_from_env('debug_api')
+
 # Configuración de seguridad
 API_KEYS = {
     "n8n-secure-key-2025": "n8n_user",
@@ -100,30 +107,6 @@ def get_candlestick_data(symbol='BTC-USDT', bar='5m', candles_count=81):
     else:
         return [], []
 
-def clean_numeric_value(value):
-    """Limpia y convierte un valor numérico de manera segura"""
-    if isinstance(value, (int, float)):
-        return float(value)
-    
-    if isinstance(value, str):
-        # Si es una cadena muy larga, puede contener múltiples números concatenados
-        if len(value) > 20:
-            # Buscar el primer número válido
-            numbers = re.findall(r'\d+\.?\d*', value)
-            if numbers:
-                try:
-                    return float(numbers[0])
-                except (ValueError, IndexError):
-                    return None
-        else:
-            # Intentar convertir directamente
-            try:
-                return float(value)
-            except ValueError:
-                return None
-    
-    return None
-
 def create_dataframe(data):
     """Convierte los datos de la API a DataFrame de manera segura"""
     if not data:
@@ -138,13 +121,11 @@ def create_dataframe(data):
     # Convertir timestamp
     df['timestamp'] = pd.to_datetime(df['timestamp'].astype(int), unit='ms')
     
-    # Convertir precios de manera segura
-    numeric_columns = ['open', 'high', 'low', 'close']
-    for col in numeric_columns:
-        df[col] = df[col].apply(clean_numeric_value)
-    
-    # Filtrar filas con datos inválidos
-    df = df.dropna(subset=['open', 'high', 'low', 'close'])
+    # Convertir precios y volumen de forma vectorizada y descartar velas que no cumplen
+    # los invariantes OHLC (low <= open/close <= high, precios positivos)
+    df, rejects = clean_candles(df)
+    if not rejects.empty:
+        print(f"Velas descartadas: {len(rejects)} {reject_summary(rejects)}")
     
     # Ordenar por timestamp
     df = df.sort_values('timestamp')
@@ -152,60 +133,31 @@ def create_dataframe(data):
     return df
 
 def create_candlestick_chart(df, symbol, candles_count):
-    """Crea gráfico de velas con matplotlib y retorna como imagen"""
+    """Crea gráfico de velas con matplotlib y retorna como imagen
+    Usa una Figure con canvas Agg propio (mpl_candles) en lugar del estado global de pyplot,
+    así que se puede llamar desde varios hilos a la vez (gunicorn --worker-class gthread)."""
     if df.empty:
         return None
     
-    # Configurar matplotlib para no mostrar la ventana
-    plt.switch_backend('Agg')
-    
-    # Crear figura y eje
-    fig, ax = plt.subplots(figsize=(12, 6))
-    
-    # Preparar datos para candlestick
-    df_plot = df.copy()
-    df_plot['date_num'] = mdates.date2num(df_plot['timestamp'])
-    
-    # Crear datos OHLC
-    ohlc_data = df_plot[['date_num', 'open', 'high', 'low', 'close']].values
-    
-    # Crear gráfico de velas
-    candlestick_ohlc(ax, ohlc_data, width=0.6, colorup='green', colordown='red', alpha=0.8)
-    
-    # Configurar formato de fecha
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-    ax.xaxis.set_major_locator(mdates.MinuteLocator(interval=15))
-    
-    # Rotar etiquetas de fecha
-    plt.setp(ax.xaxis.get_majorticklabels(), rotation=45)
-    
-    # Configurar título y etiquetas
-    ax.set_title(f'Candlestick {symbol} - Últimas {candles_count} velas', fontsize=14, fontweight='bold')
-    ax.set_xlabel('Hora', fontsize=12)
-    ax.set_ylabel('Precio (USDT)', fontsize=12)
-    
-    # Configurar grid
-    ax.grid(True, alpha=0.3)
-    
-    # Ajustar layout
-    plt.tight_layout()
-    
-    # Convertir a bytes
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=100, bbox_inches='tight')
-    img_buffer.seek(0)
-    img_bytes = img_buffer.getvalue()
-    
-    # Cerrar figura para liberar memoria
-    plt.close(fig)
-    
-    return img_bytes
+    return render_candles(
+        symbol,
+        df['timestamp'].values,
+        df['open'].values,
+        df['high'].values,
+        df['low'].values,
+        df['close'].values,
+        width=1200,
+        height=600,
+        dpi=100,
+        theme='light',
+        labels=('Hora', 'Precio (USDT)'),
+        title=f'Candlestick {symbol} - Últimas {candles_count} velas'
+    )
 
 def save_debug_info(api_response, processed_data, symbol, candles_count):
-    """Guarda información de debug"""
-    debug_filename = f"debug_api_{symbol}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    
-    debug_info = {
+    """Encola la información de debug para el escritor en segundo plano (ver debug_capture.py)
+    Devuelve el id de la captura, o None si se descartó por muestreo o por cola llena"""
+    return DEBUG_CAPTURE.capture({
         "timestamp": datetime.now().isoformat(),
         "symbol": symbol,
         "candles_count": candles_count,
@@ -217,15 +169,7 @@ def save_debug_info(api_response, processed_data, symbol, candles_count):
             "candles_used_for_chart": len(processed_data) if processed_data else 0,
             "data": processed_data
         }
-    }
-    
-    try:
-        with open(debug_filename, 'w', encoding='utf-8') as f:
-            json.dump(debug_info, f, indent=2, ensure_ascii=False, default=str)
-        return debug_filename
-    except Exception as e:
-        print(f"Error guardando debug: {e}")
-        return None
+    })
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -7,9 +7,18 @@ import base64
 import hashlib
 from datetime import datetime, timedelta
 import os
+import sys
 import json
 from env_config import OKX_API_KEY, OKX_API_SECRET, OKX_PASSPHRASE
 
+# Módulos compartidos con app.py (debug_capture, candle_cleaning, mpl_candles, candle_window):
+# están en la raíz del repositorio, un nivel por encima de cleanup/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from debug_capture import capture_from_env
+from candle_window import CandleWindow
+
+DEBUG_CAPTURE = capture_from_env('debug_api')
+
 def get_timestamp():
     """Genera timestamp en formato ISO8601 UTC"""
     return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
@@ -33,9 +42,7 @@ def get_headers(method, request_path, body=''):
     }
 
 def save_api_debug_info(api_response, processed_data, symbol, date_str):
-    """Guarda información de debug de la API y datos procesados"""
-    debug_filename = f"debug_api_{symbol}_{date_str}_{datetime.now().strftime('%H%M%S')}.json"
-    
+    """Encola la información de debug de la API y datos procesados (ver debug_capture.py)"""
     debug_info = {
         "timestamp": datetime.now().isoformat(),
         "symbol": symbol,
@@ -62,14 +69,10 @@ def save_api_debug_info(api_response, processed_data, symbol, date_str):
         }
     }
     
-    try:
-        with open(debug_filename, 'w', encoding='utf-8') as f:
-            json.dump(debug_info, f, indent=2, ensure_ascii=False, default=str)
-        print(f"Información de debug guardada en: {debug_filename}")
-        return debug_filename
-    except Exception as e:
-        print(f"Error guardando información de debug: {e}")
-        return None
+    capture_id = DEBUG_CAPTURE.capture(debug_info)
+    if capture_id:
+        print(f"Información de debug encolada ({capture_id}) en: {DEBUG_CAPTURE.directory}")
+    return capture_id
 
 def get_candlestick_data(symbol='BTC-USDT', bar='5m', start_time=None, end_time=None):
     """Obtiene datos de velas desde la API de OKX - últimas 81 velas"""
@@ -137,68 +140,32 @@ def create_dataframe(data):
     return df
 
 def load_existing_data(symbol, date_str):
-    """Carga datos existentes del día desde archivo"""
+    """Carga las velas del día desde archivo en una ventana de las últimas 81 velas"""
+    window = CandleWindow(max_len=81)
     filename = f"candles_{symbol}_{date_str}.json"
     if os.path.exists(filename):
         try:
             with open(filename, 'r') as f:
-                data = json.load(f)
-            df = create_dataframe(data)
-            # Tomar solo las últimas 81 velas de los datos existentes
-            if len(df) > 81:
-                df = df.tail(81)
-            return df
+                window.update_rows(json.load(f))
         except Exception as e:
             print(f"Error cargando datos existentes: {e}")
-    return pd.DataFrame()
+    return window
 
-def save_data(df, symbol, date_str):
-    """Guarda los datos del día en archivo"""
-    if not df.empty:
+def save_data(window, symbol, date_str):
+    """Guarda las velas de la ventana (filas de OKX en orden cronológico) en el archivo del día"""
+    if len(window):
         filename = f"candles_{symbol}_{date_str}.json"
         try:
-            # Convertir DataFrame a formato JSON
-            data_to_save = []
-            for _, row in df.iterrows():
-                data_to_save.append([
-                    str(int(row['timestamp'].timestamp() * 1000)),
-                    str(row['open']),
-                    str(row['high']),
-                    str(row['low']),
-                    str(row['close']),
-                    str(row['volume']),
-                    str(row['volume_currency']),
-                    str(row['volume_currency_2']),
-                    str(row['trades'])
-                ])
-            
             with open(filename, 'w') as f:
-                json.dump(data_to_save, f)
+                json.dump(window.rows(), f)
             print(f"Datos guardados en {filename}")
         except Exception as e:
             print(f"Error guardando datos: {e}")
 
-def merge_and_deduplicate_data(existing_df, new_df):
-    """Combina datos existentes con nuevos y elimina duplicados, manteniendo solo las últimas 81 velas"""
-    if existing_df.empty:
-        return new_df
-    if new_df.empty:
-        return existing_df
-    
-    # Combinar DataFrames
-    combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-    
-    # Eliminar duplicados basados en timestamp
-    combined_df = combined_df.drop_duplicates(subset=['timestamp'], keep='last')
-    
-    # Ordenar por timestamp
-    combined_df = combined_df.sort_values('timestamp')
-    
-    # Tomar solo las últimas 81 velas
-    if len(combined_df) > 81:
-        combined_df = combined_df.tail(81)
-    
-    return combined_df
+def merge_and_deduplicate_data(window, new_data):
+    """Añade las velas nuevas a la ventana: en un timestamp repetido gana la nueva y solo se
+    conservan las últimas 81 velas. Devuelve cuántas velas no estaban ya en la ventana"""
+    return window.update_rows(new_data)
 
 def create_candlestick_chart(df, symbol, date_str):
     """Crea gráfico de velas con Plotly"""
@@ -236,34 +203,33 @@ def main():
     print(f"Obteniendo las últimas 81 velas del día: {date_str}")
     
     # Cargar datos existentes del día
-    existing_df = load_existing_data(symbol, date_str)
-    print(f"Velas existentes cargadas: {len(existing_df)}")
+    window = load_existing_data(symbol, date_str)
+    print(f"Velas existentes cargadas: {len(window)}")
     
     # Obtener datos (últimas 81 velas)
     new_data, raw_api_data = get_candlestick_data(symbol, bar)
     
     if new_data:
-        new_df = create_dataframe(new_data)
-        print(f"Nuevas velas obtenidas: {len(new_df)}")
+        print(f"Nuevas velas obtenidas: {len(new_data)}")
         
         # Combinar datos existentes con nuevos
-        combined_df = merge_and_deduplicate_data(existing_df, new_df)
-        print(f"Total de velas después de combinar: {len(combined_df)}")
+        added = merge_and_deduplicate_data(window, new_data)
+        print(f"Velas nuevas: {added} - total de velas después de combinar: {len(window)}")
         
         # Guardar datos actualizados
-        save_data(combined_df, symbol, date_str)
+        save_data(window, symbol, date_str)
         
         # Guardar información de debug de la API
         debug_file = save_api_debug_info(raw_api_data, new_data, symbol, date_str)
         
         # Crear y mostrar gráfico
-        fig = create_candlestick_chart(combined_df, symbol, date_str)
+        fig = create_candlestick_chart(create_dataframe(window.rows()), symbol, date_str)
         if fig:
             fig.show()
     else:
         print("No se pudieron obtener nuevos datos")
-        if not existing_df.empty:
-            fig = create_candlestick_chart(existing_df, symbol, date_str)
+        if len(window):
+            fig = create_candlestick_chart(create_dataframe(window.rows()), symbol, date_str)
             if fig:
                 fig.show()
 
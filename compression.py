@@ -0,0 +1,87 @@
+"""
+Compresión negociada de respuestas (zstd, brotli, gzip)
+El JSON de la figura de Plotly y los payloads en base64 son grandes y muy compresibles.
+Se elige la codificación según Accept-Encoding (zstd y brotli solo si sus paquetes están
+instalados; gzip siempre) y, para las respuestas derivadas de la caché de velas (las que
+llevan ETag), los bytes comprimidos se guardan junto a la huella del cuerpo original para
+no volver a comprimir lo mismo en cada petición.
+"""
+
+import gzip
+import hashlib
+
+from lazy_imports import lazy_import, is_available
+from render_cache import RenderCache
+
+zstandard = lazy_import('zstandard') if is_available('zstandard') else None
+brotli = lazy_import('brotli') if is_available('brotli') else None
+
+# Tipos que merece la pena comprimir (las imágenes PNG/JPEG ya van comprimidas)
+COMPRESSIBLE_TYPES = {
+    'application/json', 'text/html', 'text/plain', 'text/css',
+    'application/javascript', 'image/svg+xml',
+}
+
+
+def _compress_zstd(body, level):
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+def _compress_br(body, level):
+    return brotli.compress(body, quality=level)
+
+
+def _compress_gzip(body, level):
+    # mtime=0 para que el mismo cuerpo produzca siempre los mismos bytes
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+# Orden de preferencia del servidor cuando el cliente acepta varias con la misma calidad
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS['zstd'] = (_compress_zstd, 3)
+if brotli is not None:
+    ENCODERS['br'] = (_compress_br, 5)
+ENCODERS['gzip'] = (_compress_gzip, 6)
+
+
+def negotiate(accept_encodings):
+    """Codificación a usar según el Accept-Encoding ya parseado por werkzeug, o None"""
+    return accept_encodings.best_match(list(ENCODERS))
+
+
+def compress(body, encoding, level=None):
+    """Comprime `body` con `encoding` (nivel por defecto de cada codificación si no se indica)"""
+    encoder, default_level = ENCODERS[encoding]
+    return encoder(body, default_level if level is None else level)
+
+
+def is_compressible(response, min_bytes):
+    """Solo respuestas completas, sin codificar, de un tipo de texto y de cierto tamaño"""
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    return (response.content_length or 0) >= min_bytes
+
+
+class CompressionCache:
+    """Variantes comprimidas por (huella del cuerpo, codificación), con presupuesto en bytes"""
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self._variants = RenderCache(max_bytes=max_bytes, name='compressed')
+
+    def compress(self, body, encoding):
+        key = (hashlib.blake2b(body, digest_size=16).hexdigest(), encoding)
+        compressed = self._variants.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            self._variants.put(key, compressed)
+        return compressed
+
+    def stats(self):
+        return self._variants.stats()
@@ -0,0 +1,117 @@
+"""
+Correlación, beta y fuerza relativa entre varios símbolos (/api/correlation)
+Las ventanas de velas de cada símbolo se alinean por timestamp (solo velas cerradas presentes
+en todos) y los rendimientos logarítmicos quedan en una matriz tiempo x símbolo. Con sumas
+acumuladas de los rendimientos y de sus productos cruzados (tiempo x símbolo x símbolo) se
+obtienen en una sola pasada las covarianzas de todas las ventanas móviles y de todos los pares:
+de ahí salen la correlación móvil, la beta frente al símbolo de referencia y la matriz de
+correlación de la última ventana.
+Importa numpy, así que app.py lo carga de forma diferida.
+"""
+
+import numpy as np
+
+from candle_store import is_closed
+
+DEFAULT_SYMBOLS = ('BTC-USDT', 'ETH-USDT', 'ADA-USDT', 'DOT-USDT', 'LINK-USDT')
+DEFAULT_WINDOW = 20
+
+
+def align_closes(windows):
+    """{símbolo: filas de OKX} -> (timestamps, símbolos, cierres tiempo x símbolo)
+    Solo quedan las velas cerradas cuyo timestamp tienen todos los símbolos."""
+    series = {}
+    for symbol, rows in windows.items():
+        closed = [row for row in rows if is_closed(row)]
+        ts = np.array([int(row[0]) for row in closed], dtype=np.int64)
+        closes = np.array([float(row[4]) for row in closed], dtype=float)
+        order = np.argsort(ts)
+        series[symbol] = (ts[order], closes[order])
+    symbols = list(series)
+    common = series[symbols[0]][0]
+    for symbol in symbols[1:]:
+        common = np.intersect1d(common, series[symbol][0], assume_unique=True)
+    matrix = np.empty((len(common), len(symbols)))
+    for column, symbol in enumerate(symbols):
+        ts, closes = series[symbol]
+        matrix[:, column] = closes[np.searchsorted(ts, common)]
+    return common, symbols, matrix
+
+
+def rolling_sums(values, window):
+    """Sumas de `window` filas consecutivas a lo largo del eje 0 (con sumas acumuladas)"""
+    cumulative = np.cumsum(values, axis=0)
+    cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), cumulative])
+    return cumulative[window:] - cumulative[:-window]
+
+
+def rolling_covariance(returns, window):
+    """Covarianzas móviles de todos los pares: array (ventanas, símbolos, símbolos)"""
+    sums = rolling_sums(returns, window)
+    products = rolling_sums(returns[:, :, None] * returns[:, None, :], window)
+    means = sums / window
+    return (products - window * means[:, :, None] * means[:, None, :]) / (window - 1)
+
+
+def correlation_from_covariance(covariance):
+    deviations = np.sqrt(np.diagonal(covariance, axis1=-2, axis2=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / (deviations[..., :, None] * deviations[..., None, :])
+
+
+def _clean(values, digits=4):
+    """Array -> listas JSON con NaN/inf como None"""
+    values = np.round(np.asarray(values, dtype=float), digits)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def correlation_report(timestamps, symbols, closes, window=DEFAULT_WINDOW, benchmark=None):
+    """Correlación, beta y fuerza relativa de los cierres alineados
+    - correlation: matriz de la última ventana; rolling: series por vela frente a `benchmark`
+    - relative_strength: (precio / precio inicial) del símbolo entre el de la referencia
+    Lanza ValueError si no hay velas suficientes para una ventana."""
+    benchmark = benchmark or symbols[0]
+    b = symbols.index(benchmark)
+    returns = np.diff(np.log(closes), axis=0)
+    if len(returns) < window:
+        raise ValueError(f'hacen falta al menos {window + 1} velas comunes (hay {len(closes)})')
+
+    covariance = rolling_covariance(returns, window)
+    correlation = correlation_from_covariance(covariance)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = covariance[:, :, b] / covariance[:, b, b][:, None]
+    normalized = closes / closes[0]
+    relative_strength = normalized / normalized[:, [b]]
+    performance = (normalized[-1] - 1) * 100
+    volatility = returns[-window:].std(axis=0, ddof=1) * 100
+
+    # La ventana móvil i termina en la vela i + window (el rendimiento i va de la vela i a la i + 1)
+    rolling_timestamps = timestamps[window:]
+    return {
+        'benchmark': benchmark,
+        'window': window,
+        'candles': int(len(timestamps)),
+        'start': int(timestamps[0]),
+        'end': int(timestamps[-1]),
+        'correlation': {
+            symbol: dict(zip(symbols, row)) for symbol, row in zip(symbols, _clean(correlation[-1]))
+        },
+        'symbols': {
+            symbol: {
+                'change_percent': change,
+                'volatility_percent': vol,
+                'correlation': corr,
+                'beta': beta_value,
+                'relative_strength': rs,
+            }
+            for symbol, change, vol, corr, beta_value, rs in zip(
+                symbols, _clean(performance, 2), _clean(volatility), _clean(correlation[-1, :, b]),
+                _clean(beta[-1]), _clean(relative_strength[-1]))
+        },
+        'rolling': {
+            'timestamps': rolling_timestamps.tolist(),
+            'correlation': dict(zip(symbols, _clean(correlation[:, :, b].T))),
+            'beta': dict(zip(symbols, _clean(beta.T))),
+            'relative_strength': dict(zip(symbols, _clean(relative_strength[window:].T))),
+        },
+    }
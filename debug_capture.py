@@ -0,0 +1,217 @@
+"""
+Captura de debug asíncrona: registros JSON Lines en segmentos gzip rotados por tamaño
+Sustituye a los `debug_api_*.json` que se escribían con indent=2 dentro de cada petición.
+capture() solo encola el registro (o lo descarta por muestreo o si la cola está llena) y
+un hilo en segundo plano lo serializa y lo añade al segmento activo:
+
+    debug_captures/debug-20250727-163000-1234-0001.jsonl.gz
+
+Un segmento se cierra al superar `segment_max_bytes` (sin comprimir) o `segment_max_age`
+segundos, y solo se conservan los `max_segments` más recientes. analyze_debug.py lee
+tanto los segmentos como los archivos antiguos.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+# {prefix}-{YYYYmmdd}-{HHMMSS}-{pid}-{n}.jsonl.gz
+SEGMENT_PID = re.compile(r'-\d{8}-\d{6}-(\d+)-\d+\.jsonl\.gz$')
+
+
+def segment_pid(name):
+    """PID del proceso que escribió el segmento, o None si el nombre no sigue el formato"""
+    match = SEGMENT_PID.search(name)
+    return int(match.group(1)) if match else None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DebugCapture:
+    """Cola acotada + hilo escritor de segmentos JSONL comprimidos"""
+
+    def __init__(self, directory='debug_captures', prefix='debug', sample_rate=1.0, max_queue=1000,
+                 segment_max_bytes=16 * 1024 * 1024, segment_max_age=300.0, max_segments=50,
+                 compresslevel=6, flush_interval=5.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.sample_rate = sample_rate
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.max_segments = max_segments
+        self.compresslevel = compresslevel
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._segment = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._segment_opened = 0.0
+        self._sequence = 0
+        self.counts = {'captured': 0, 'written': 0, 'sampled_out': 0, 'dropped': 0, 'errors': 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def capture(self, record):
+        """Encola `record` (dict serializable con default=str) sin bloquear
+        Devuelve el id asignado al registro, o None si se descartó por muestreo o por cola llena."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._count('sampled_out')
+            return None
+        self._ensure_started()
+        capture_id = uuid.uuid4().hex[:12]
+        try:
+            self._queue.put_nowait((capture_id, time.time(), record))
+        except queue.Full:
+            # Bajo presión se pierde debug, nunca latencia de la petición
+            self._count('dropped')
+            return None
+        self._count('captured')
+        return capture_id
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='debug-capture', daemon=True)
+                self._thread.start()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"{self.prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence:04d}{SEGMENT_SUFFIX}"
+        self._segment_path = os.path.join(self.directory, name)
+        self._segment = gzip.open(self._segment_path, 'wb', compresslevel=self.compresslevel)
+        self._segment_bytes = 0
+        self._segment_opened = time.monotonic()
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+            self._prune_segments()
+
+    def _prune_segments(self):
+        """Borra los segmentos más antiguos por encima de `max_segments`
+        Solo se borran segmentos de este proceso o de procesos que ya no existen: el segmento
+        abierto de otro worker que escribe en el mismo directorio nunca se toca."""
+        pid = os.getpid()
+        try:
+            segments = sorted(
+                (entry for entry in os.scandir(self.directory)
+                 if entry.name.startswith(f'{self.prefix}-') and entry.name.endswith(SEGMENT_SUFFIX)),
+                key=lambda entry: entry.stat().st_mtime
+            )
+        except FileNotFoundError:
+            return
+        excess = len(segments) - self.max_segments
+        for entry in segments:
+            if excess <= 0:
+                break
+            owner = segment_pid(entry.name)
+            if owner is None or (owner != pid and _process_alive(owner)):
+                continue
+            try:
+                os.remove(entry.path)
+                excess -= 1
+            except OSError:
+                pass
+
+    def _write(self, capture_id, captured_at, record):
+        if self._segment is None:
+            self._open_segment()
+        line = json.dumps({'capture_id': capture_id, 'captured_at': captured_at, **record},
+                          separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        self._segment.write(line)
+        self._segment_bytes += len(line)
+        self._count('written')
+        if self._segment_bytes >= self.segment_max_bytes:
+            self._close_segment()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    self._count('errors')
+                    print(f"Error guardando captura de debug: {e}")
+            now = time.monotonic()
+            if self._segment is not None:
+                if now - self._segment_opened >= self.segment_max_age:
+                    self._close_segment()
+                elif now - last_flush >= self.flush_interval:
+                    # Sync flush: lo escrito hasta aquí se puede leer aunque el segmento siga abierto
+                    self._segment.flush(zlib.Z_SYNC_FLUSH)
+                    last_flush = now
+            if self._stop.is_set() and self._queue.empty():
+                self._close_segment()
+                return
+
+    def stop(self, timeout=5.0):
+        """Escribe lo pendiente y cierra el segmento activo"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def restart_after_fork(self):
+        """El hilo y el segmento abierto no sobreviven a fork: el hijo empieza de cero"""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        self._segment = None
+
+    def stats(self):
+        return {
+            **self.counts,
+            'queued': self._queue.qsize(),
+            'sample_rate': self.sample_rate,
+            'active_segment': self._segment_path if self._segment is not None else None,
+        }
+
+
+def capture_from_env(prefix='debug'):
+    """DebugCapture configurado con las variables DEBUG_CAPTURE_*; se vacía al salir del proceso"""
+    capture = DebugCapture(
+        directory=os.environ.get('DEBUG_CAPTURE_DIR', 'debug_captures'),
+        prefix=prefix,
+        sample_rate=float(os.environ.get('DEBUG_CAPTURE_SAMPLE_RATE', '1.0')),
+        max_queue=int(os.environ.get('DEBUG_CAPTURE_QUEUE', '1000')),
+        segment_max_bytes=int(os.environ.get('DEBUG_CAPTURE_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+        segment_max_age=float(os.environ.get('DEBUG_CAPTURE_SEGMENT_AGE', '300')),
+        max_segments=int(os.environ.get('DEBUG_CAPTURE_MAX_SEGMENTS', '50')),
+    )
+    atexit.register(capture.stop)
+    os.register_at_fork(after_in_child=capture.restart_after_fork)
+    return capture
@@ -0,0 +1,24 @@
+"""
+Configuración de gunicorn (se lee automáticamente desde el directorio de trabajo)
+Con --preload la app se importa en el proceso maestro antes del fork: en ese caso las
+dependencias pesadas se cargan de forma síncrona (STARTUP_IMPORTS=eager) para que los
+workers las compartan copy-on-write. Un hilo de precarga en el maestro no es seguro con fork.
+Por lo mismo, los hilos en segundo plano de la app (instantánea, pre-render, reparación de
+huecos) no se arrancan al importar sino en cada worker, desde post_fork.
+"""
+
+import os
+import sys
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1' or '--preload' in sys.argv
+
+if preload_app:
+    os.environ.setdefault('STARTUP_IMPORTS', 'eager')
+    os.environ.setdefault('BACKGROUND_THREADS', 'post_fork')
+
+
+def post_fork(server, worker):
+    """Con --preload la app ya está importada en el worker: solo faltan sus hilos"""
+    if server.cfg.preload_app and os.environ.get('BACKGROUND_THREADS') == 'post_fork':
+        import app
+        app.start_background_threads()
@@ -0,0 +1,99 @@
+"""
+Parámetros de formato y tamaño de las imágenes (format, width, height, dpi, quality, thumbnail, panels)
+Los flujos de n8n hacia Telegram/Slack necesitan imágenes pequeñas: con `thumbnail=1` se
+renderiza directamente a baja resolución y con menos elementos, en lugar de generar un PNG
+grande que luego se reescala.
+"""
+
+from collections import namedtuple
+
+# Formato -> tipo MIME
+IMAGE_FORMATS = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+# Valores por defecto (equivalen a la figura de 12x8 pulgadas a 100 dpi de siempre)
+DEFAULT_WIDTH = 1200
+DEFAULT_HEIGHT = 800
+DEFAULT_DPI = 100
+DEFAULT_QUALITY = 85
+
+# Miniatura para notificaciones de chat
+THUMBNAIL_WIDTH = 480
+THUMBNAIL_HEIGHT = 320
+THUMBNAIL_DPI = 80
+
+# Paneles bajo el precio (ver indicators.PANELS; se repite aquí para no importar pandas)
+PANELS = ('volume', 'rsi')
+
+LIMITS = {
+    'width': (64, 4000),
+    'height': (64, 4000),
+    'dpi': (30, 300),
+    'quality': (1, 100),
+}
+
+ImageOptions = namedtuple('ImageOptions', ['format', 'width', 'height', 'dpi', 'quality', 'thumbnail', 'panels'])
+
+
+def _int_arg(args, name, default):
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"'{name}' debe ser un número entero")
+    low, high = LIMITS[name]
+    if not low <= number <= high:
+        raise ValueError(f"'{name}' debe estar entre {low} y {high}")
+    return number
+
+
+def parse_image_options(args):
+    """Lee los parámetros de la query string; lanza ValueError con un mensaje para el cliente"""
+    image_format = args.get('format', 'png').lower()
+    image_format = FORMAT_ALIASES.get(image_format, image_format)
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"'format' debe ser uno de: {', '.join(IMAGE_FORMATS)}")
+
+    thumbnail = args.get('thumbnail', '').lower() in ('1', 'true', 'yes')
+    requested = [p.strip().lower() for p in args.get('panels', '').split(',') if p.strip()]
+    unknown = [p for p in requested if p not in PANELS]
+    if unknown:
+        raise ValueError(f"'panels' admite: {', '.join(PANELS)}")
+    return ImageOptions(
+        format=image_format,
+        width=_int_arg(args, 'width', THUMBNAIL_WIDTH if thumbnail else DEFAULT_WIDTH),
+        height=_int_arg(args, 'height', THUMBNAIL_HEIGHT if thumbnail else DEFAULT_HEIGHT),
+        dpi=_int_arg(args, 'dpi', THUMBNAIL_DPI if thumbnail else DEFAULT_DPI),
+        quality=_int_arg(args, 'quality', DEFAULT_QUALITY),
+        thumbnail=thumbnail,
+        # Orden fijo para que 'rsi,volume' y 'volume,rsi' compartan caché
+        panels=tuple(p for p in PANELS if p in requested),
+    )
+
+
+def default_image_options():
+    """Opciones por defecto (PNG de 1200x800 a 100 dpi, solo precio)"""
+    return ImageOptions('png', DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_DPI, DEFAULT_QUALITY, False, ())
+
+
+def mimetype_for(options):
+    return IMAGE_FORMATS[options.format]
+
+
+def cache_params(options):
+    """Parámetros que distinguen la imagen en la caché y en el ETag
+    (la calidad solo afecta a los formatos con pérdida)"""
+    quality = options.quality if options.format in ('jpeg', 'webp') else None
+    return (options.format, options.width, options.height, options.dpi, quality, options.thumbnail,
+            '+'.join(options.panels))
+
+
+def etag_suffix(options):
+    return '-'.join('' if p is None else str(p) for p in cache_params(options))
@@ -0,0 +1,39 @@
+"""
+Indicadores para los paneles inferiores de los gráficos (volumen, RSI)
+Se calculan de forma vectorizada sobre la misma ventana en memoria que se dibuja, con
+las velas ordenadas de la más antigua a la más reciente (como las deja create_dataframe).
+Importa numpy y pandas, así que app.py lo carga de forma diferida.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Paneles que se pueden pedir con ?panels=, en el orden en que se dibujan
+PANELS = ('volume', 'rsi')
+
+RSI_PERIOD = 14
+RSI_LEVELS = (30, 70)
+
+
+def rsi(closes, period=RSI_PERIOD):
+    """RSI de Wilder (media exponencial con alpha = 1/period); NaN hasta tener `period` velas"""
+    closes = pd.Series(np.asarray(closes, dtype=float))
+    delta = closes.diff()
+    gains = delta.clip(lower=0)
+    losses = -delta.clip(upper=0)
+    avg_gain = gains.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    avg_loss = losses.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100 - 100 / (1 + avg_gain / avg_loss)
+    # Sin pérdidas en el periodo el RSI es 100
+    values = values.where(avg_loss != 0, 100.0).where(avg_gain.notna())
+    return values.to_numpy()
+
+
+def compute_indicators(df, panels):
+    """Líneas de indicador de los paneles pedidos, calculadas sobre `df` completo
+    (el volumen no es un indicador: se dibuja desde las propias velas)"""
+    series = {}
+    if 'rsi' in panels:
+        series['rsi'] = rsi(df['close'].to_numpy())
+    return series
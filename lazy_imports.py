@@ -0,0 +1,94 @@
+"""
+Importación diferida de dependencias pesadas (pandas, plotly, matplotlib, requests)
+Permite que el proceso web arranque y responda a /ping y /health sin pagar el coste
+de importar las librerías de análisis y gráficos, que se cargan en el primer uso o se
+precalientan en un hilo en segundo plano. Registra cuánto tardó cada importación.
+"""
+
+import importlib
+import importlib.util
+import threading
+import time
+import types
+
+# Segundos que tardó cada importación real, en el orden en que ocurrieron
+IMPORT_TIMINGS = {}
+
+_import_lock = threading.RLock()
+
+
+def is_available(name):
+    """Comprueba si un módulo está instalado sin importarlo"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def timed_import(name):
+    """Importa un módulo registrando el tiempo que tardó (solo la primera vez)"""
+    with _import_lock:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        if name not in IMPORT_TIMINGS:
+            IMPORT_TIMINGS[name] = time.perf_counter() - started
+        return module
+
+
+class LazyModule(types.ModuleType):
+    """Módulo que se importa de verdad la primera vez que se accede a un atributo"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = timed_import(self.__name__)
+            # Copiar el espacio de nombres para que los accesos siguientes no pasen por __getattr__
+            for key, value in module.__dict__.items():
+                self.__dict__.setdefault(key, value)
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_lazy_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name):
+    """Devuelve un proxy del módulo `name` que se importa en el primer uso"""
+    return LazyModule(name)
+
+
+def warm_imports(names, background=True, on_done=None):
+    """Importa `names` ahora o en un hilo daemon; las que fallen se ignoran aquí
+    (el error vuelve a aparecer, y se maneja, en el primer uso real)"""
+    def run():
+        started = time.perf_counter()
+        for name in names:
+            try:
+                timed_import(name)
+            except Exception as e:
+                print(f"Warning: no se pudo precargar {name}: {e}")
+        if on_done is not None:
+            on_done(time.perf_counter() - started)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='okx-import-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def import_timings_ms():
+    """Tiempos de importación en milisegundos, para /debug"""
+    return {name: round(seconds * 1000, 1) for name, seconds in IMPORT_TIMINGS.items()}
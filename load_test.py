@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga simple para el servicio desplegado (o local contra okx_mock_server.py)
+Lanza peticiones concurrentes a uno o varios endpoints durante un tiempo fijo y
+reporta throughput, latencias (p50/p95/p99) y códigos de respuesta.
+
+Ejemplo:
+    python okx_mock_server.py --replay --latency-ms 80 --jitter-ms 40 &
+    OKX_BASE_URL=http://localhost:8090 OKX_API_KEY=x OKX_API_SECRET=x OKX_PASSPHRASE=x gunicorn app:app &
+    python load_test.py --base-url http://localhost:8000 --concurrency 8 --duration 30
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+DEFAULT_PATHS = [
+    '/api/n8n?symbol=BTC-USDT&interval=5m',
+    '/api/candles?symbol=BTC-USDT&interval=5m',
+    '/api/n8n-image-base64?symbol=BTC-USDT&interval=5m',
+]
+
+
+def worker(base_url, paths, deadline, rate, results, lock):
+    """Ejecuta peticiones en bucle hasta `deadline`, opcionalmente limitado a `rate` peticiones/s"""
+    session = requests.Session()
+    interval = 1.0 / rate if rate else 0
+    i = 0
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.monotonic()
+        try:
+            response = session.get(base_url + path, timeout=30)
+            status = response.status_code
+            size = len(response.content)
+        except requests.RequestException as e:
+            status = type(e).__name__
+            size = 0
+        elapsed = time.monotonic() - started
+        with lock:
+            results.append((path, status, elapsed, size))
+        if interval and elapsed < interval:
+            time.sleep(interval - elapsed)
+
+
+def percentile(ordered, q):
+    """Percentil por vecino más cercano sobre una lista ordenada"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(results, duration):
+    """Agrega los resultados por endpoint"""
+    summary = {}
+    for path in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == path]
+        latencies = sorted(r[2] for r in rows)
+        summary[path] = {
+            'requests': len(rows),
+            'throughput_rps': round(len(rows) / duration, 2),
+            'status_codes': dict(Counter(str(r[1]) for r in rows)),
+            'latency_ms': {
+                'mean': round(statistics.fmean(latencies) * 1000, 2),
+                'p50': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99': round(percentile(latencies, 0.99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2),
+            },
+            'bytes_mean': int(statistics.fmean(r[3] for r in rows)),
+        }
+    return summary
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Prueba de carga para OKX Candlestick Analyzer')
+    parser.add_argument('--base-url', default='http://localhost:8080')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Endpoint a probar (se puede repetir)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30.0, help='Duración en segundos')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Peticiones por segundo por cliente (0 = lo más rápido posible)')
+    parser.add_argument('--output', help='Archivo JSON de salida')
+    args = parser.parse_args()
+
+    paths = args.paths or DEFAULT_PATHS
+    base_url = args.base_url.rstrip('/')
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    print(f"🚀 Prueba de carga contra {base_url}: {args.concurrency} clientes durante {args.duration:.0f}s")
+    threads = [
+        threading.Thread(target=worker, args=(base_url, paths, deadline, args.rate, results, lock), daemon=True)
+        for _ in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if not results:
+        print("❌ No se completó ninguna petición")
+        return 1
+
+    report = {
+        'base_url': base_url,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'endpoints': summarize(results, args.duration),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"Resultados guardados en {args.output}")
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Nivel de detalle (LOD) para gráficos de velas largos
+Con semanas de historia no tiene sentido dibujar cada vela: en 1200 px caben unas pocas
+centenas. Antes de pasar los datos a cualquiera de los dos renderers se agrupan las velas
+en cubos OHLC más anchos (apertura del primero, cierre del último, máximo y mínimo del
+cubo, volumen sumado) hasta un número que depende del ancho de la imagen, así el coste del
+render queda acotado por el ancho y no por la longitud de los datos.
+Para líneas de indicadores se ofrece LTTB (Largest-Triangle-Three-Buckets), que conserva la
+forma visual de la serie con menos puntos.
+Importa numpy y pandas, así que app.py lo carga de forma diferida.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+# Píxeles mínimos por vela para que cuerpo y mecha se distingan
+MIN_PX_PER_CANDLE = 4
+
+
+def max_candles_for_width(width, min_px_per_candle=MIN_PX_PER_CANDLE):
+    """Número máximo de velas que se dibujan en una imagen de `width` píxeles"""
+    return max(1, int(width) // max(1, int(min_px_per_candle)))
+
+
+def aggregate_ohlc(timestamps, opens, highs, lows, closes, volumes, max_buckets):
+    """Agrupa velas consecutivas (ordenadas de la más antigua a la más reciente) en como mucho
+    `max_buckets` cubos; devuelve las seis series agregadas y el tamaño del cubo"""
+    count = len(opens)
+    if count <= max_buckets:
+        return timestamps, opens, highs, lows, closes, volumes, 1
+    size = math.ceil(count / max_buckets)
+    starts = np.arange(0, count, size)
+    ends = np.minimum(starts + size, count) - 1
+    return (
+        np.asarray(timestamps)[starts],
+        np.asarray(opens)[starts],
+        np.maximum.reduceat(np.asarray(highs), starts),
+        np.minimum.reduceat(np.asarray(lows), starts),
+        np.asarray(closes)[ends],
+        np.add.reduceat(np.asarray(volumes), starts),
+        size,
+    )
+
+
+def downsample_frame(df, width, min_px_per_candle=MIN_PX_PER_CANDLE):
+    """DataFrame de velas (columnas de create_dataframe) agregado al ancho de la imagen
+    Devuelve el mismo DataFrame si ya cabe."""
+    max_buckets = max_candles_for_width(width, min_px_per_candle)
+    if df is None or len(df) <= max_buckets:
+        return df
+    timestamps, opens, highs, lows, closes, volumes, size = aggregate_ohlc(
+        df['timestamp'].values, df['open'].values, df['high'].values,
+        df['low'].values, df['close'].values, df['volume'].values, max_buckets
+    )
+    aggregated = pd.DataFrame({
+        'timestamp': timestamps,
+        'open': opens,
+        'high': highs,
+        'low': lows,
+        'close': closes,
+        'volume': volumes,
+    })
+    aggregated.attrs['lod_bucket_size'] = size
+    return aggregated
+
+
+def line_positions(count, bucket_size=1):
+    """Posición X (en unidades de vela agrupada) de cada una de las `count` velas originales,
+    para dibujar un indicador calculado a resolución completa sobre velas agrupadas"""
+    return (np.arange(count) + 0.5) / bucket_size - 0.5
+
+
+def lttb(x, y, threshold):
+    """Índices de los puntos que conserva Largest-Triangle-Three-Buckets (incluye extremos)"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = len(y)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    # Cubos intermedios (el primer y el último punto se conservan siempre)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Punto medio del cubo siguiente (o el último punto en el último cubo)
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Área del triángulo (punto anterior, candidato, media del siguiente) para cada candidato
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_line(x, y, width, points_per_px=1):
+    """Serie (x, y) de un indicador reducida con LTTB a unos `width * points_per_px` puntos
+    Se descartan los NaN (p. ej. el arranque del RSI). Las velas están equiespaciadas, así
+    que LTTB trabaja sobre el índice y `x` puede ser de cualquier tipo (también datetime64)."""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    indices = lttb(np.arange(len(y)), y, max(3, int(width * points_per_px)))
+    return x[indices], y[indices]
@@ -0,0 +1,216 @@
+"""
+Métricas en memoria con formato de texto de Prometheus
+Contadores, gauges e histogramas con etiquetas, sin dependencias externas.
+Las métricas son por proceso: con varios workers de gunicorn cada uno expone las suyas.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from tracing import record_span
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    """Construye el bloque {k="v",...} de una serie"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base común: nombre, ayuda, etiquetas y un lock por métrica"""
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}, no {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Valor que puede subir y bajar"""
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas expuestas en /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'okx_pipeline_stage_seconds', 'Duración de cada etapa del pipeline (fetch, parse, chart, ...)', ['stage']))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'okx_http_request_duration_seconds', 'Duración de las peticiones HTTP por ruta', ['route', 'method', 'status']))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    'okx_upstream_errors_total', 'Errores al consultar la API de OKX', ['reason']))
+CACHE_HITS = REGISTRY.register(Counter(
+    'okx_cache_hits_total', 'Aciertos de caché', ['cache']))
+CACHE_MISSES = REGISTRY.register(Counter(
+    'okx_cache_misses_total', 'Fallos de caché', ['cache']))
+RENDER_FALLBACKS = REGISTRY.register(Counter(
+    'okx_render_fallbacks_total', 'Peticiones de imagen que terminaron en la respuesta alternativa', ['renderer', 'reason']))
+STALE_SERVED = REGISTRY.register(Counter(
+    'okx_stale_responses_total', 'Respuestas servidas con datos vencidos (stale-while-revalidate o última ventana buena)'))
+UPSTREAM_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    'okx_upstream_circuit_open', 'Circuito hacia OKX abierto (1) o cerrado (0)'))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'okx_http_requests_in_flight', 'Peticiones HTTP en curso'))
+PRERENDERS = REGISTRY.register(Counter(
+    'okx_prerenders_total', 'Pre-renders de la lista de seguimiento al cierre de vela', ['result']))
+CANDLE_REJECTS = REGISTRY.register(Counter(
+    'okx_candle_rejects_total', 'Velas descartadas por valores no numéricos o invariantes OHLC', ['reason']))
+GAP_REPAIRS = REGISTRY.register(Counter(
+    'okx_gap_repairs_total', 'Huecos del almacén de velas procesados por resultado (filled, empty, error)', ['result']))
+GAP_CANDLES_FILLED = REGISTRY.register(Counter(
+    'okx_gap_candles_filled_total', 'Velas añadidas al almacén al reparar huecos'))
+
+
+@contextmanager
+def stage(name):
+    """Mide un bloque como etapa del pipeline (histograma y traza de la petición actual)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=name)
+        record_span(name, duration)
+
+
+def timed_stage(name):
+    """Decorador equivalente a `with stage(name)` para funciones completas"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render_prometheus():
+    """Texto de todas las métricas en formato de exposición de Prometheus"""
+    return REGISTRY.render()
@@ -0,0 +1,314 @@
+"""
+Velas de matplotlib dibujadas con colecciones y figuras reutilizables
+- draw_candles: mechas en un LineCollection y cuerpos en un PolyCollection (dos artistas en
+  total en lugar de dos por vela con ax.plot/ax.bar).
+- CandleFigure: figura, canvas, ejes, colores y fuentes ya configurados; en cada render solo
+  se cambian los datos de las colecciones, límites, título y etiquetas.
+- Paneles opcionales de volumen y RSI con el eje X compartido, cada serie en un solo artista.
+- FigurePool: plantillas libres por clave (renderer, tamaño, tema); cada petición toma una
+  en exclusiva y la devuelve al terminar, así que es seguro con varios hilos. Las claves se
+  descartan en orden LRU con un máximo global de plantillas libres.
+Este módulo importa matplotlib, así que app.py lo carga de forma diferida.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+
+from indicators import RSI_LEVELS
+
+THEMES = {
+    'dark': {
+        'background': 'black',
+        'text': 'white',
+        'grid': 'gray',
+        'up': '#00ff88',
+        'down': '#ff4444',
+    },
+    # Aspecto de los servidores de cleanup/ (antes mplfinance sobre pyplot)
+    'light': {
+        'background': 'white',
+        'text': 'black',
+        'grid': 'gray',
+        'up': 'green',
+        'down': 'red',
+    },
+}
+
+DEFAULT_LABELS = ('Time', 'Price (USDT)')
+
+BODY_WIDTH = 0.8
+# Altura mínima del cuerpo (fracción del rango de precios) para que las velas doji se vean
+DOJI_HEIGHT = 0.0005
+
+
+def candle_geometry(opens, highs, lows, closes):
+    """Segmentos de las mechas, polígonos de los cuerpos y máscara de velas alcistas"""
+    opens, highs, lows, closes = (np.asarray(a, dtype=float) for a in (opens, highs, lows, closes))
+    x = np.arange(len(opens), dtype=float)
+    up = closes >= opens
+
+    wicks = np.empty((len(x), 2, 2))
+    wicks[:, 0, 0] = wicks[:, 1, 0] = x
+    wicks[:, 0, 1] = lows
+    wicks[:, 1, 1] = highs
+
+    price_range = float(highs.max() - lows.min()) if len(x) else 0.0
+    bottoms = np.minimum(opens, closes)
+    tops = np.maximum(opens, closes)
+    tops = np.maximum(tops, bottoms + price_range * DOJI_HEIGHT)
+    left = x - BODY_WIDTH / 2
+    right = x + BODY_WIDTH / 2
+    bodies = np.stack([
+        np.column_stack([left, bottoms]),
+        np.column_stack([left, tops]),
+        np.column_stack([right, tops]),
+        np.column_stack([right, bottoms]),
+    ], axis=1)
+    return wicks, bodies, up
+
+
+def draw_candles(ax, opens, highs, lows, closes, up_color='#00ff88', down_color='#ff4444'):
+    """Dibuja las velas en `ax` con dos colecciones; devuelve (mechas, cuerpos)"""
+    wicks, bodies, up = candle_geometry(opens, highs, lows, closes)
+    colors = np.where(up, up_color, down_color)
+    wick_collection = LineCollection(wicks, colors=colors, linewidths=1)
+    body_collection = PolyCollection(bodies, facecolors=colors, edgecolors=colors, alpha=0.8)
+    ax.add_collection(wick_collection)
+    ax.add_collection(body_collection)
+    return wick_collection, body_collection
+
+
+def _time_label(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime('%H:%M')
+
+
+class CandleFigure:
+    """Figura de velas preconfigurada; render() solo cambia los datos
+
+    `panels` añade paneles bajo el precio que comparten el eje X: 'volume' (barras en un
+    PolyCollection) y 'rsi' (una línea con los niveles 30/70)."""
+
+    def __init__(self, width, height, dpi, thumbnail=False, theme='dark', panels=(), labels=DEFAULT_LABELS):
+        self.thumbnail = thumbnail
+        self.panels = tuple(panels)
+        self.colors = THEMES[theme]
+        colors = self.colors
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor=colors['background'])
+        self.canvas = FigureCanvasAgg(self.figure)
+
+        # Precio arriba con 3/4 de la altura si hay un panel (y proporcionalmente si hay más)
+        grid = self.figure.add_gridspec(1 + len(self.panels), 1, height_ratios=[3] + [1] * len(self.panels))
+        self.ax = self.figure.add_subplot(grid[0], facecolor=colors['background'])
+        self.panel_axes = {}
+        for row, panel in enumerate(self.panels, start=1):
+            self.panel_axes[panel] = self.figure.add_subplot(grid[row], sharex=self.ax, facecolor=colors['background'])
+        ax = self.ax
+        self.bottom_ax = self.panel_axes[self.panels[-1]] if self.panels else ax
+
+        if thumbnail:
+            self.title = ax.set_title('', color=colors['text'], fontsize=10)
+        else:
+            self.title = ax.set_title('', color=colors['text'], fontsize=16, pad=20)
+            self.bottom_ax.set_xlabel(labels[0], color=colors['text'], fontsize=12)
+            ax.set_ylabel(labels[1], color=colors['text'], fontsize=12)
+        for axis in (ax, *self.panel_axes.values()):
+            axis.tick_params(colors=colors['text'], labelsize=7 if thumbnail else None)
+            axis.grid(True, alpha=0.3, color=colors['grid'])
+            for spine in axis.spines.values():
+                spine.set_color(colors['grid'])
+            if axis is not self.bottom_ax:
+                axis.tick_params(labelbottom=False)
+
+        self.wicks, self.bodies = draw_candles(ax, [0], [0], [0], [0], colors['up'], colors['down'])
+
+        self.volume_bars = None
+        if 'volume' in self.panel_axes:
+            volume_ax = self.panel_axes['volume']
+            self.volume_bars = PolyCollection([], alpha=0.6)
+            volume_ax.add_collection(self.volume_bars)
+            if not thumbnail:
+                volume_ax.set_ylabel('Vol', color=colors['text'], fontsize=10)
+        self.rsi_line = None
+        if 'rsi' in self.panel_axes:
+            rsi_ax = self.panel_axes['rsi']
+            (self.rsi_line,) = rsi_ax.plot([], [], color=colors['text'], linewidth=1)
+            for level in RSI_LEVELS:
+                rsi_ax.axhline(level, color=colors['grid'], linewidth=0.8, linestyle='--')
+            rsi_ax.set_ylim(0, 100)
+            rsi_ax.set_yticks(RSI_LEVELS)
+            if not thumbnail:
+                rsi_ax.set_ylabel('RSI', color=colors['text'], fontsize=10)
+
+        self.max_ticks = 5 if thumbnail else 10
+        self._layout_signature = None
+
+    def _update_layout(self, title, volume_max=None):
+        """tight_layout solo cuando cambia lo que ocupa espacio (título y ancho de las etiquetas)"""
+        if self.thumbnail:
+            if self._layout_signature is None:
+                self.figure.subplots_adjust(left=0.12, right=0.98, top=0.9, bottom=0.18, hspace=0.08)
+                self._layout_signature = 'fixed'
+            return
+        low, high = self.ax.get_ylim()
+        signature = (title, len(f'{high:.0f}'), len(f'{low:.0f}'),
+                     None if volume_max is None else len(f'{volume_max:.0f}'))
+        if signature != self._layout_signature:
+            # h_pad pequeño: los paneles comparten eje X y no llevan etiquetas entre ellos
+            self.figure.tight_layout(h_pad=0.3)
+            self._layout_signature = signature
+
+    def render(self, symbol, timestamps, opens, highs, lows, closes, image_format='png', quality=None,
+               volumes=None, rsi=None, title=None):
+        """Dibuja la ventana y devuelve los bytes de la imagen
+
+        `volumes` va alineado con las velas; `rsi` es un par (x, valores) con x en posiciones
+        de vela (puede tener más resolución que las velas si estas se agruparon con lod.py).
+        `title` sustituye al título por defecto."""
+        colors = self.colors
+        wicks, bodies, up = candle_geometry(opens, highs, lows, closes)
+        candle_colors = np.where(up, colors['up'], colors['down'])
+        self.wicks.set_segments(wicks)
+        self.wicks.set_colors(candle_colors)
+        self.bodies.set_verts(bodies)
+        self.bodies.set_facecolors(candle_colors)
+        self.bodies.set_edgecolors(candle_colors)
+
+        ax = self.ax
+        # Acepta datetime64 (columna de pandas) o enteros en milisegundos
+        timestamps = np.asarray(timestamps).astype('datetime64[ms]').astype('int64')
+        count = len(timestamps)
+        low, high = float(np.min(lows)), float(np.max(highs))
+        margin = (high - low) * 0.05 or abs(high) * 0.001 or 1.0
+        ax.set_xlim(-1, count)
+        ax.set_ylim(low - margin, high + margin)
+        if title is None:
+            title = symbol if self.thumbnail else f'{symbol} Candlestick Chart'
+        self.title.set_text(title)
+
+        volume_max = None
+        if self.volume_bars is not None and volumes is not None:
+            volumes = np.asarray(volumes, dtype=float)
+            x = np.arange(count, dtype=float)
+            left, right = x - BODY_WIDTH / 2, x + BODY_WIDTH / 2
+            zeros = np.zeros(count)
+            self.volume_bars.set_verts(np.stack([
+                np.column_stack([left, zeros]),
+                np.column_stack([left, volumes]),
+                np.column_stack([right, volumes]),
+                np.column_stack([right, zeros]),
+            ], axis=1))
+            self.volume_bars.set_facecolors(candle_colors)
+            volume_max = float(np.nanmax(volumes)) if count else 0.0
+            self.panel_axes['volume'].set_ylim(0, (volume_max or 1.0) * 1.1)
+        if self.rsi_line is not None and rsi is not None:
+            self.rsi_line.set_data(*rsi)
+
+        step = max(1, count // self.max_ticks) if count > self.max_ticks else 1
+        positions = range(0, count, step)
+        self.bottom_ax.set_xticks(positions)
+        self.bottom_ax.set_xticklabels([_time_label(int(timestamps[i])) for i in positions],
+                                       rotation=45, color=colors['text'])
+
+        self._update_layout(title, volume_max)
+
+        buffer = io.BytesIO()
+        save_kwargs = {}
+        if image_format in ('jpeg', 'webp') and quality is not None:
+            save_kwargs['pil_kwargs'] = {'quality': quality}
+        self.figure.savefig(buffer, format=image_format, facecolor=colors['background'],
+                            edgecolor='none', dpi=self.figure.dpi, **save_kwargs)
+        return buffer.getvalue()
+
+
+class FigurePool:
+    """Plantillas de figura libres por clave; checkout() entrega una en exclusiva
+
+    La clave sale de los parámetros de la petición (tamaño, dpi, tema...), así que las claves
+    se guardan en orden LRU y el total de plantillas libres está acotado por `max_idle`: al
+    pasarse se descartan las de la clave usada hace más tiempo (cada una retiene su buffer Agg)."""
+
+    def __init__(self, max_idle_per_key=4, max_idle=16):
+        self.max_idle_per_key = max_idle_per_key
+        self.max_idle = max_idle
+        self._idle = OrderedDict()  # clave -> plantillas libres, de la menos a la más usada
+        self._idle_count = 0
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @contextmanager
+    def checkout(self, key, factory):
+        with self._lock:
+            idle = self._idle.get(key)
+            template = idle.pop() if idle else None
+            if template is None:
+                self.created += 1
+            else:
+                self.reused += 1
+                self._idle_count -= 1
+                if not idle:
+                    del self._idle[key]
+        if template is None:
+            template = factory()
+        try:
+            yield template
+        except Exception:
+            # Una plantilla que falló a mitad de render puede quedar en un estado raro: se descarta
+            template = None
+            raise
+        finally:
+            if template is not None:
+                self._release(key, template)
+
+    def _release(self, key, template):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) >= self.max_idle_per_key:
+                return
+            idle.append(template)
+            self._idle_count += 1
+            while self._idle_count > self.max_idle:
+                oldest_key, oldest = next(iter(self._idle.items()))
+                # Sin pyplot no hay nada que cerrar: basta con soltar la figura (y su canvas)
+                oldest.pop(0)
+                self._idle_count -= 1
+                self.evicted += 1
+                if not oldest:
+                    del self._idle[oldest_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._idle),
+                'idle': self._idle_count,
+                'max_idle': self.max_idle,
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+            }
+
+
+FIGURE_POOL = FigurePool(max_idle=int(os.environ.get('FIGURE_POOL_MAX_IDLE', '16')))
+
+
+def render_candles(symbol, timestamps, opens, highs, lows, closes, width=1200, height=800, dpi=100,
+                   image_format='png', quality=None, thumbnail=False, theme='dark', panels=(),
+                   volumes=None, rsi=None, labels=DEFAULT_LABELS, title=None):
+    """Renderiza con una plantilla del pool para (renderer, tamaño, tema, paneles, etiquetas)
+    Solo usa Figure + FigureCanvasAgg (nada de pyplot), así que se puede llamar desde varios hilos."""
+    labels = tuple(labels)
+    key = ('matplotlib', width, height, dpi, thumbnail, theme, tuple(panels), labels)
+    with FIGURE_POOL.checkout(key, lambda: CandleFigure(width, height, dpi, thumbnail, theme, panels, labels)) as template:
+        return template.render(symbol, timestamps, opens, highs, lows, closes, image_format, quality,
+                               volumes=volumes, rsi=rsi, title=title)
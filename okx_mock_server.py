@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Servidor local compatible con la API de mercado de OKX
+Sirve /api/v5/market/candles y endpoints relacionados a partir de velas grabadas
+(candles_*.json), con latencia, jitter, errores y límites de peticiones configurables.
+
+Uso:
+    python okx_mock_server.py --port 8090 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+    OKX_BASE_URL=http://localhost:8090 gunicorn app:app
+
+Con --replay los timestamps grabados se desplazan para que la última vela coincida
+con la vela actual, de modo que app.py ve datos "en vivo".
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+# Duración de cada intervalo de OKX en milisegundos
+BAR_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1H': 3_600_000, '2H': 7_200_000, '4H': 14_400_000, '6H': 21_600_000,
+    '12H': 43_200_000, '1D': 86_400_000,
+}
+
+# Configuración (se puede sobrescribir por línea de comandos)
+CONFIG = {
+    'data_dir': os.environ.get('MOCK_OKX_DATA_DIR', '.'),
+    'latency_ms': float(os.environ.get('MOCK_OKX_LATENCY_MS', 0)),
+    'jitter_ms': float(os.environ.get('MOCK_OKX_JITTER_MS', 0)),
+    'error_rate': float(os.environ.get('MOCK_OKX_ERROR_RATE', 0)),
+    'rate_limit': int(os.environ.get('MOCK_OKX_RATE_LIMIT', 0)),  # peticiones por ventana, 0 = sin límite
+    'rate_window_s': float(os.environ.get('MOCK_OKX_RATE_WINDOW_S', 2)),
+    'replay': os.environ.get('MOCK_OKX_REPLAY', '0') == '1',
+}
+
+# Velas grabadas por símbolo, en orden cronológico (solo velas de 5m)
+RECORDINGS = {}
+
+_rate_lock = threading.Lock()
+_rate_hits = deque()
+
+
+def load_recordings(data_dir):
+    """Carga todos los candles_<symbol>_<fecha>.json del directorio, agrupados por símbolo"""
+    recordings = {}
+    pattern = re.compile(r'candles_(.+)_(\d{4}-\d{2}-\d{2})\.json$')
+    for path in sorted(glob.glob(os.path.join(data_dir, 'candles_*.json'))):
+        match = pattern.search(os.path.basename(path))
+        if not match:
+            continue
+        try:
+            with open(path, 'r') as f:
+                candles = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error cargando {path}: {e}")
+            continue
+        recordings.setdefault(match.group(1), {}).update({c[0]: c for c in candles})
+
+    return {
+        symbol: sorted(by_ts.values(), key=lambda c: int(c[0]))
+        for symbol, by_ts in recordings.items()
+    }
+
+
+def aggregate_candles(candles, bar_ms):
+    """Agrupa velas de 5m en velas de `bar_ms` (open primero, close último, max/min, sumas)"""
+    if bar_ms <= BAR_MS['5m']:
+        return candles
+    buckets = {}
+    for candle in candles:
+        start = int(candle[0]) // bar_ms * bar_ms
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = [str(start)] + list(candle[1:])
+            continue
+        bucket[2] = str(max(float(bucket[2]), float(candle[2])))
+        bucket[3] = str(min(float(bucket[3]), float(candle[3])))
+        bucket[4] = candle[4]
+        for i in (5, 6, 7):
+            bucket[i] = str(float(bucket[i]) + float(candle[i]))
+        bucket[8] = candle[8]
+    return [buckets[k] for k in sorted(buckets)]
+
+
+def shift_to_now(candles, bar_ms):
+    """Desplaza los timestamps para que la última vela sea la vela en curso"""
+    if not candles:
+        return candles
+    current_bar = int(time.time() * 1000) // bar_ms * bar_ms
+    offset = current_bar - int(candles[-1][0])
+    return [[str(int(c[0]) + offset)] + list(c[1:]) for c in candles]
+
+
+def okx_error(code, msg, status=200):
+    """Respuesta de error con el formato de OKX"""
+    return jsonify({'code': code, 'msg': msg, 'data': []}), status
+
+
+def rate_limited():
+    """Ventana deslizante simple compartida por todos los clientes"""
+    if CONFIG['rate_limit'] <= 0:
+        return False
+    now = time.monotonic()
+    with _rate_lock:
+        while _rate_hits and now - _rate_hits[0] > CONFIG['rate_window_s']:
+            _rate_hits.popleft()
+        if len(_rate_hits) >= CONFIG['rate_limit']:
+            return True
+        _rate_hits.append(now)
+    return False
+
+
+@app.before_request
+def simulate_network():
+    """Aplica límite de peticiones, latencia, jitter y errores inyectados"""
+    if request.path.startswith('/mock/'):
+        return None
+    if rate_limited():
+        return okx_error('50011', 'Too Many Requests', 429)
+
+    delay_ms = CONFIG['latency_ms'] + random.uniform(-1, 1) * CONFIG['jitter_ms']
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000)
+
+    if CONFIG['error_rate'] and random.random() < CONFIG['error_rate']:
+        if random.random() < 0.5:
+            return okx_error('50001', 'Service temporarily unavailable', 503)
+        return okx_error('50026', 'System error. Try again later.', 500)
+    return None
+
+
+def select_candles(inst_id, history=False):
+    """Filtra las velas grabadas según instId, bar, after, before y limit (más reciente primero)"""
+    if inst_id not in RECORDINGS:
+        return None, okx_error('51001', f"Instrument ID {inst_id} doesn't exist.")
+
+    bar = request.args.get('bar', '1m')
+    if bar not in BAR_MS:
+        return None, okx_error('51000', 'Parameter bar error')
+    bar_ms = BAR_MS[bar]
+
+    max_limit = 100 if history else 300
+    try:
+        limit = min(int(request.args.get('limit', 100)), max_limit)
+    except ValueError:
+        return None, okx_error('51000', 'Parameter limit error')
+
+    candles = aggregate_candles(RECORDINGS[inst_id], bar_ms)
+    if CONFIG['replay']:
+        candles = shift_to_now(candles, bar_ms)
+
+    after = request.args.get('after')
+    before = request.args.get('before')
+    if after:
+        candles = [c for c in candles if int(c[0]) < int(after)]
+    if before:
+        candles = [c for c in candles if int(c[0]) > int(before)]
+
+    # OKX devuelve primero las velas más recientes
+    selected = list(reversed(candles))
+    if before and not after:
+        selected = selected[-limit:]
+    else:
+        selected = selected[:limit]
+    return selected, None
+
+
+@app.route('/api/v5/market/candles')
+def market_candles():
+    """Equivalente a GET /api/v5/market/candles"""
+    candles, error = select_candles(request.args.get('instId', ''))
+    if error:
+        return error
+    return jsonify({'code': '0', 'msg': '', 'data': candles})
+
+
+@app.route('/api/v5/market/history-candles')
+def market_history_candles():
+    """Equivalente a GET /api/v5/market/history-candles"""
+    candles, error = select_candles(request.args.get('instId', ''), history=True)
+    if error:
+        return error
+    return jsonify({'code': '0', 'msg': '', 'data': candles})
+
+
+@app.route('/api/v5/market/ticker')
+def market_ticker():
+    """Equivalente a GET /api/v5/market/ticker a partir de la última vela grabada"""
+    inst_id = request.args.get('instId', '')
+    if inst_id not in RECORDINGS:
+        return okx_error('51001', f"Instrument ID {inst_id} doesn't exist.")
+    candles = RECORDINGS[inst_id]
+    last = candles[-1]
+    day = candles[-288:]
+    ts = str(int(time.time() * 1000)) if CONFIG['replay'] else last[0]
+    return jsonify({'code': '0', 'msg': '', 'data': [{
+        'instType': 'SPOT',
+        'instId': inst_id,
+        'last': last[4],
+        'open24h': day[0][1],
+        'high24h': str(max(float(c[2]) for c in day)),
+        'low24h': str(min(float(c[3]) for c in day)),
+        'vol24h': str(sum(float(c[5]) for c in day)),
+        'volCcy24h': str(sum(float(c[6]) for c in day)),
+        'ts': ts,
+    }]})
+
+
+@app.route('/api/v5/public/time')
+def public_time():
+    """Equivalente a GET /api/v5/public/time"""
+    return jsonify({'code': '0', 'msg': '', 'data': [{'ts': str(int(time.time() * 1000))}]})
+
+
+@app.route('/mock/config', methods=['GET', 'POST'])
+def mock_config():
+    """Consulta o modifica la configuración del simulador en caliente"""
+    if request.method == 'POST':
+        updates = request.get_json() or {}
+        for key, value in updates.items():
+            if key not in CONFIG or key == 'data_dir':
+                continue
+            if isinstance(CONFIG[key], bool):
+                CONFIG[key] = str(value).lower() in ('1', 'true', 'yes')
+            else:
+                CONFIG[key] = type(CONFIG[key])(value)
+    return jsonify({
+        'config': CONFIG,
+        'symbols': {symbol: len(candles) for symbol, candles in RECORDINGS.items()}
+    })
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description='Servidor local compatible con la API de mercado de OKX')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('MOCK_OKX_PORT', 8090)))
+    parser.add_argument('--data-dir', default=CONFIG['data_dir'], help='Directorio con candles_*.json')
+    parser.add_argument('--latency-ms', type=float, default=CONFIG['latency_ms'])
+    parser.add_argument('--jitter-ms', type=float, default=CONFIG['jitter_ms'])
+    parser.add_argument('--error-rate', type=float, default=CONFIG['error_rate'],
+                        help='Probabilidad (0-1) de responder con un error 5xx')
+    parser.add_argument('--rate-limit', type=int, default=CONFIG['rate_limit'],
+                        help='Peticiones permitidas por ventana antes de responder 429 (0 = sin límite)')
+    parser.add_argument('--rate-window', type=float, default=CONFIG['rate_window_s'],
+                        help='Duración de la ventana del límite de peticiones en segundos')
+    parser.add_argument('--replay', action='store_true', default=CONFIG['replay'],
+                        help='Desplazar los timestamps grabados al momento actual')
+    args = parser.parse_args()
+
+    CONFIG.update({
+        'data_dir': args.data_dir,
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+        'rate_limit': args.rate_limit,
+        'rate_window_s': args.rate_window,
+        'replay': args.replay,
+    })
+    RECORDINGS.update(load_recordings(args.data_dir))
+
+    print("🧪 Servidor simulado de OKX")
+    print(f"   Símbolos grabados: {', '.join(f'{s} ({len(c)} velas)' for s, c in RECORDINGS.items()) or 'ninguno'}")
+    print(f"   Latencia: {args.latency_ms} ms ± {args.jitter_ms} ms, errores: {args.error_rate:.0%}, "
+          f"límite: {args.rate_limit or 'sin límite'}")
+    print(f"   Para usarlo desde app.py: OKX_BASE_URL=http://localhost:{args.port}")
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
+else:
+    RECORDINGS.update(load_recordings(CONFIG['data_dir']))
@@ -0,0 +1,110 @@
+"""
+Pre-render de los gráficos de una lista de seguimiento al cierre de cada vela
+Los cron de n8n se disparan justo después del cierre de vela; en ese momento la ventana
+cambia (hay una vela nueva) y la imagen cacheada ya no sirve, así que todas las peticiones
+renderizaban a la vez. Este hilo se adelanta: al cerrar cada vela pide la ventana nueva a
+OKX, la renderiza con los mismos parámetros que los endpoints y la deja en la caché de
+imágenes con la misma clave que usarán ellos.
+"""
+
+import threading
+import time
+
+from candle_cache import bar_seconds, next_bar_close
+from metrics import PRERENDERS
+
+
+def parse_watchlist(value):
+    """'BTC-USDT:5m,ETH-USDT:1H' -> [('BTC-USDT', '5m'), ('ETH-USDT', '1H')] (5m por defecto)"""
+    watchlist = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        symbol, _, bar = item.partition(':')
+        watchlist.append((symbol.strip(), bar.strip() or '5m'))
+    return watchlist
+
+
+class Prerenderer:
+    """Hilo que, tras cada cierre de vela, refresca y renderiza cada (símbolo, intervalo)
+
+    `refresh(symbol, bar)` devuelve la ventana recién pedida a OKX (o None si falló) y
+    `render(symbol, bar, data)` la renderiza y la guarda en la caché.
+    """
+
+    def __init__(self, watchlist, refresh, render, delay=2.0, attempts=3, retry_interval=1.0):
+        self.watchlist = list(watchlist)
+        self.refresh = refresh
+        self.render = render
+        self.delay = delay
+        self.attempts = attempts
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = {}
+
+    def _due_times(self, now):
+        return {entry: next_bar_close(entry[1], now) + self.delay for entry in self.watchlist}
+
+    def _window_is_current(self, bar, data, closed_at):
+        """OKX publica la vela nueva con un pequeño retraso: la ventana vale si ya la incluye"""
+        if not data:
+            return False
+        latest_open = max(int(candle[0]) for candle in data) / 1000
+        return latest_open >= closed_at - bar_seconds(bar) / 2
+
+    def run_entry(self, symbol, bar, closed_at=None):
+        """Refresca y renderiza una entrada; devuelve True si quedó renderizada"""
+        closed_at = closed_at if closed_at is not None else next_bar_close(bar) - bar_seconds(bar)
+        started = time.perf_counter()
+        for attempt in range(self.attempts):
+            data = self.refresh(symbol, bar)
+            if self._window_is_current(bar, data, closed_at):
+                try:
+                    self.render(symbol, bar, data)
+                except Exception as e:
+                    print(f"Error en pre-render de {symbol} {bar}: {e}")
+                    PRERENDERS.inc(result='error')
+                    return False
+                PRERENDERS.inc(result='ok')
+                self.last_run[f'{symbol}:{bar}'] = {
+                    'at': time.time(),
+                    'seconds': round(time.perf_counter() - started, 3),
+                    'attempts': attempt + 1,
+                }
+                return True
+            if self._stop.wait(self.retry_interval):
+                return False
+        PRERENDERS.inc(result='stale_window')
+        return False
+
+    def _run(self):
+        due = self._due_times(time.time())
+        while not self._stop.is_set():
+            next_due = min(due.values())
+            if self._stop.wait(max(0.0, next_due - time.time())):
+                return
+            now = time.time()
+            for (symbol, bar), when in due.items():
+                if when <= now:
+                    self.run_entry(symbol, bar, closed_at=when - self.delay)
+            due = {entry: (when if when > now else next_bar_close(entry[1], now) + self.delay)
+                   for entry, when in due.items()}
+
+    def start(self):
+        if not self.watchlist:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='okx-prerender', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'watchlist': [f'{symbol}:{bar}' for symbol, bar in self.watchlist],
+            'last_run': self.last_run,
+        }
@@ -0,0 +1,92 @@
+"""
+Caché LRU de imágenes renderizadas, limitada por tamaño total en bytes
+Las claves incluyen la huella de la ventana de velas (ver candle_cache.window_fingerprint),
+así que una entrada deja de usarse sola en cuanto llega una vela nueva.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import CACHE_HITS, CACHE_MISSES
+
+
+class RenderCache:
+    """Diccionario LRU clave -> bytes con presupuesto de memoria"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, name='render'):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        if value is None:
+            CACHE_MISSES.inc(cache=self.name)
+        else:
+            CACHE_HITS.inc(cache=self.name)
+        return value
+
+    def put(self, key, value):
+        if value is None or len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def items(self):
+        """Copia de las entradas (de la más antigua a la más reciente)"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class ImageLinks:
+    """Enlaces de corta duración token -> clave de la caché de imágenes
+    Permiten devolver la imagen por URL en lugar de incrustarla en base64 dentro del JSON.
+    Son por proceso: con varios workers el enlace solo es válido en el que lo emitió."""
+
+    def __init__(self, ttl=300.0, max_links=1024):
+        self.ttl = ttl
+        self.max_links = max_links
+        self._links = OrderedDict()  # token -> (render_key, mimetype, expires_at)
+        self._lock = threading.Lock()
+
+    def issue(self, render_key, mimetype='image/png'):
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            while self._links and (len(self._links) >= self.max_links
+                                   or next(iter(self._links.values()))[2] <= now):
+                self._links.popitem(last=False)
+            self._links[token] = (render_key, mimetype, now + self.ttl)
+        return token
+
+    def resolve(self, token):
+        """Devuelve (render_key, mimetype, segundos restantes) o (None, None, 0) si no existe o caducó"""
+        with self._lock:
+            render_key, mimetype, expires_at = self._links.get(token, (None, None, 0))
+        remaining = expires_at - time.monotonic()
+        if render_key is None or remaining <= 0:
+            return None, None, 0
+        return render_key, mimetype, remaining
@@ -0,0 +1,79 @@
+"""
+Respuestas en streaming para rangos de velas grandes
+`jsonify` construye la respuesta entera en memoria antes de enviarla. Aquí las velas se
+escriben a medida que salen del almacén o de la caché, en fragmentos de `chunk_rows` filas:
+
+- json:   un objeto JSON con la cabecera, las velas bajo "candles" y "count" al final
+- ndjson: una línea JSON por vela ({"timestamp": ..., "open": ..., ...})
+
+La memoria no depende del tamaño del rango y el primer fragmento sale antes de leer
+ninguna vela.
+"""
+
+import json
+
+from flask import Response, stream_with_context
+
+STREAM_MODES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+TRUE_VALUES = ('1', 'true', 'yes')
+
+DEFAULT_CHUNK_ROWS = 500
+
+
+def parse_stream_mode(args, default=None):
+    """Modo pedido con ?stream= (json, ndjson, o 1/true para json); None si no se pide
+    Lanza ValueError con un mensaje para el cliente si el valor no es válido."""
+    value = (args.get('stream') or '').lower() or default
+    if value in (None, '', '0', 'false', 'no'):
+        return None
+    if value in TRUE_VALUES:
+        return 'json'
+    if value not in STREAM_MODES:
+        raise ValueError(f"'stream' debe ser uno de: {', '.join(STREAM_MODES)}")
+    return value
+
+
+def json_chunks(header, rows, key='candles', chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Objeto JSON `header` + `rows` (listas) bajo `key` + "count", generado a trozos"""
+    opening = json.dumps(header, ensure_ascii=False)
+    yield opening[:-1] + (',' if header else '') + f'"{key}":['
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, separators=(',', ':')))
+        if len(chunk) >= chunk_rows:
+            yield (',' if count else '') + ','.join(chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        yield (',' if count else '') + ','.join(chunk)
+        count += len(chunk)
+    yield f'],"count":{count}}}'
+
+
+def ndjson_chunks(rows, fields, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Una línea JSON por fila, como objeto {campo: valor}, en fragmentos de `chunk_rows` líneas"""
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(dict(zip(fields, row)), separators=(',', ':')))
+        if len(chunk) >= chunk_rows:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def stream_rows(mode, header, rows, fields, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Respuesta en streaming con las filas (listas en el orden de `fields`)
+    En ndjson la cabecera no va en el cuerpo: cada línea es una vela."""
+    if mode == 'ndjson':
+        chunks = ndjson_chunks(rows, fields, chunk_rows)
+    else:
+        chunks = json_chunks({**header, 'fields': list(fields)}, rows, chunk_rows=chunk_rows)
+    response = Response(stream_with_context(chunks), mimetype=STREAM_MODES[mode])
+    # Sin buffer en proxies (nginx, Railway) para que el primer fragmento salga ya
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
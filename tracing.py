@@ -0,0 +1,151 @@
+"""
+Trazas por petición y profiler por muestreo
+- Cada etapa medida con metrics.stage() se acumula en la traza de la petición actual,
+  que se devuelve en la cabecera Server-Timing.
+- SamplingProfiler muestrea la pila del hilo de la petición a intervalos fijos y
+  genera pilas en formato "folded" (flamegraph.pl, speedscope, inferno).
+"""
+
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+_current_trace = contextvars.ContextVar('okx_current_trace', default=None)
+
+
+class RequestTrace:
+    """Duraciones acumuladas por etapa durante una petición"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    def add(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (duraciones en milisegundos)"""
+        parts = [f'{name};dur={duration * 1000:.2f}' for name, duration in self.spans.items()]
+        parts.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def begin_trace():
+    """Inicia una traza para la petición actual"""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Termina y devuelve la traza de la petición actual"""
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    return trace
+
+
+def record_span(name, duration):
+    """Añade una duración a la traza actual, si hay una activa"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    """Muestrea la pila de un hilo desde un hilo auxiliar mientras dura la petición"""
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='okx-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[';'.join(labels)] += 1
+            self.samples += 1
+
+    def folded(self):
+        """Pilas en formato folded: "marco;marco;marco muestras" por línea"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Guarda en disco los perfiles de las peticiones más lentas (hasta `keep`)"""
+
+    def __init__(self, directory, keep=20):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._profiles = []  # (duración, id, ruta)
+
+    def save(self, profiler, duration, route, force=False):
+        """Guarda el perfil si está entre los `keep` más lentos (o si `force`); devuelve su id"""
+        with self._lock:
+            if not force and len(self._profiles) >= self.keep and duration <= self._profiles[0][0]:
+                return None
+            profile_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{int(duration * 1000)}ms_{os.getpid()}_{threading.get_ident() % 10000}"
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{profile_id}.folded')
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(profiler.folded())
+            except OSError as e:
+                print(f"Error guardando perfil: {e}")
+                return None
+            self._profiles.append((duration, profile_id, route))
+            self._profiles.sort()
+            while len(self._profiles) > self.keep:
+                # Un perfil forzado nunca se descarta en el mismo momento en que se guarda
+                index = 1 if self._profiles[0][1] == profile_id else 0
+                _, old_id, _ = self._profiles.pop(index)
+                try:
+                    os.remove(os.path.join(self.directory, f'{old_id}.folded'))
+                except OSError:
+                    pass
+            return profile_id
+
+    def list(self):
+        with self._lock:
+            return [
+                {'id': profile_id, 'route': route, 'duration_ms': round(duration * 1000, 1)}
+                for duration, profile_id, route in sorted(self._profiles, reverse=True)
+            ]
+
+    def path(self, profile_id):
+        with self._lock:
+            if not any(p[1] == profile_id for p in self._profiles):
+                return None
+        return os.path.join(self.directory, f'{profile_id}.folded')